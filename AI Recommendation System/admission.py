@@ -0,0 +1,167 @@
+"""
+Admission control for the scoring endpoints.
+
+Requests to a guarded route pass three checks before reaching the handler:
+
+- a token bucket per client key (the API key header when it is one of the
+  configured ``api_keys``, otherwise the client address, read from
+  ``X-Forwarded-For`` when ``trusted_proxies`` is set) refills at ``rate``
+  requests per second up to ``burst``; an empty bucket is answered with 429
+  and the seconds until the next token as Retry-After
+- a concurrency limit per route runs ``limit`` requests at a time and lets
+  ``max_waiting`` more wait up to ``max_wait`` seconds for a slot; anything
+  beyond that is shed with 503 straight away rather than queued
+- ``pressure()``, the inference queue's fill level, puts handlers into
+  degraded mode from ``degrade_at`` on, in which they answer from rankings
+  that are already scored instead of loading or re-scoring catalogs
+
+Buckets are kept least recently used first and capped at ``max_clients``,
+so a scraper rotating addresses cannot grow them without bound.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+from inference import Overloaded
+
+
+class RateLimiter:
+    """Token bucket per client key"""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+
+    def acquire(self, key: str, now: float = None):
+        """Take a token for key; return 0, or the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+            self.allowed += 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+class ConcurrencyLimit:
+    """At most ``limit`` requests of a route at once, ``max_waiting`` more queued"""
+
+    def __init__(self, limit: int, max_waiting: int = 0, max_wait: float = 1.0):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        """Take a slot, raising Overloaded when the queue is full or the wait runs out"""
+        # Waiters count until they hold a slot, so a burst can't all slip past the check
+        if self.active + self.waiting >= self.limit + self.max_waiting:
+            self.rejected += 1
+            raise Overloaded(f"{self.active} requests running, {self.waiting} waiting")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"No slot free within {self.max_wait}s")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionController:
+    """Rate limits, route concurrency limits and the degraded-mode switch"""
+
+    def __init__(self, routes: dict, limiter: RateLimiter, pressure=None, degrade_at: float = 0.75,
+                 client_header: str = "x-api-key", api_keys=(), trusted_proxies: int = 0):
+        """routes: path -> ConcurrencyLimit, matching the path and everything below it"""
+        self.routes = routes
+        self.limiter = limiter
+        self.pressure = pressure
+        self.degrade_at = degrade_at
+        self.client_header = client_header
+        self.api_keys = frozenset(api_keys)
+        self.trusted_proxies = trusted_proxies
+        # Longest first, so /recommend/personalized wins over /recommend
+        self._prefixes = sorted(routes, key=len, reverse=True)
+
+    def route(self, path: str):
+        """``(route, limit)`` guarding a request path, or ``(None, None)``"""
+        for prefix in self._prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return prefix, self.routes[prefix]
+        return None, None
+
+    def client_key(self, request):
+        """
+        Rate limit key: a configured API key when sent, else the (forwarded) client address.
+
+        Each of the ``trusted_proxies`` in front of the server appends the address it was reached from to
+        X-Forwarded-For, so the client is the entry that many places from the right; anything further left
+        was sent by the client itself and is ignored.
+        """
+        # Unknown keys are ignored, or every made-up key would be a fresh bucket
+        api_key = request.headers.get(self.client_header) if self.client_header else None
+        if api_key and api_key in self.api_keys:
+            return f"key:{api_key}"
+        if self.trusted_proxies:
+            hops = [hop.strip() for hop in (request.headers.get("x-forwarded-for") or "").split(",")]
+            if len(hops) >= self.trusted_proxies and hops[-self.trusted_proxies]:
+                return f"ip:{hops[-self.trusted_proxies]}"
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    def degraded(self):
+        """Whether handlers should answer from already scored rankings only"""
+        return self.pressure is not None and self.pressure() >= self.degrade_at
+
+    def stats(self):
+        stats = {f"rate_{key}": value for key, value in self.limiter.stats().items()}
+        for path, limit in self.routes.items():
+            name = path.strip("/").replace("/", "_")
+            stats.update({f"{name}_{key}": value for key, value in limit.stats().items()})
+        if self.pressure is not None:
+            stats["pressure"] = self.pressure()
+            stats["degraded"] = self.degraded()
+        return stats
@@ -0,0 +1,264 @@
+"""
+Indexed archive of saved recommendation snapshots.
+
+Snapshots saved by ``/save-recommendations-endpoint`` live in one SQLite
+database in WAL mode instead of one JSON file each. Listing by city, budget
+and time range is served from indexes with LIMIT/OFFSET paging, a snapshot
+is fetched by its unique filename, and every recommended property's score
+is recorded in a side table indexed by property id, so a property's score
+history is one index range scan. Retention drops snapshots by age and
+count; ``compact()`` checkpoints the WAL and vacuums the freed pages.
+
+Nothing is opened until first use, and connections are per thread and per
+process: an archive created before ``serve.py`` forks its workers is
+opened afresh in each of them instead of sharing the parent's handle.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from persistence import dumps, loads
+from score_cache import normalize_city
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    city TEXT NOT NULL,
+    city_display TEXT NOT NULL,
+    max_budget REAL,
+    created_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_city_created ON snapshots (city, created_at);
+CREATE INDEX IF NOT EXISTS snapshots_created ON snapshots (created_at);
+CREATE INDEX IF NOT EXISTS snapshots_budget ON snapshots (max_budget);
+
+CREATE TABLE IF NOT EXISTS property_scores (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    property_id TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    score REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (snapshot_id, property_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS property_scores_history ON property_scores (property_id, created_at);
+"""
+
+_OPENING = threading.Lock()
+
+LIST_COLUMNS = "filename, city_display, max_budget, created_at, size"
+
+
+def _listing(row):
+    filename, city, max_budget, created_at, size = row
+    return {
+        "filename": filename,
+        "city": city,
+        "max_budget": max_budget,
+        "size": size,
+        "modified": datetime.fromtimestamp(created_at).isoformat(),
+    }
+
+
+class SnapshotArchive:
+    """SQLite-backed store of recommendation snapshots"""
+
+    def __init__(self, path: str, max_age_days: float = 0, max_snapshots: int = 0):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.max_snapshots = max_snapshots
+        self.saved = 0
+        self.expired = 0
+        self._pid = None
+
+    def _process(self):
+        if self._pid == os.getpid():
+            return
+        with _OPENING:
+            if self._pid != os.getpid():
+                # First use, or a forked child: never touch the parent's connections or lock
+                self._local = threading.local()
+                self._lock = threading.Lock()
+                self._created = False
+                self._pid = os.getpid()
+
+    @property
+    def _write_lock(self):
+        self._process()
+        return self._lock
+
+    def _conn(self):
+        # One connection per thread and process; WAL lets readers proceed during a write
+        self._process()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            if not self._created:
+                with conn:
+                    conn.executescript(SCHEMA)
+                self._created = True
+            self._local.conn = conn
+        return conn
+
+    def save(self, city: str, max_budget: float, data: dict, created_at: float = None, filename: str = None):
+        """Store a snapshot and its per-property scores, returning its filename"""
+        created_at = created_at or time.time()
+        if filename is None:
+            stamp = datetime.fromtimestamp(created_at).strftime("%Y%m%d_%H%M%S")
+            filename = f"{city}_{max_budget}_{stamp}.json"
+        payload = dumps(data)
+        scores = [
+            (str(r["_id"]), rank, r.get("score"))
+            for rank, r in enumerate(data.get("recommendations") or [], start=1)
+            if isinstance(r, dict) and "_id" in r
+        ]
+
+        with self._write_lock, self._conn() as conn:
+            base, ext = os.path.splitext(filename)
+            for attempt in range(1, 100):
+                try:
+                    cursor = conn.execute(
+                        "INSERT INTO snapshots (filename, city, city_display, max_budget, created_at, size, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (filename, normalize_city(city), city, max_budget, created_at, len(payload), payload),
+                    )
+                    break
+                except sqlite3.IntegrityError:
+                    # Same city and budget saved twice within a second
+                    filename = f"{base}_{attempt}{ext}"
+            snapshot_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO property_scores (snapshot_id, property_id, rank, score, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(snapshot_id, pid, rank, score, created_at) for pid, rank, score in scores],
+            )
+            self.saved += 1
+            self._apply_retention(conn)
+        return filename
+
+    def list(self, city: str = None, min_budget: float = None, max_budget: float = None,
+             since: float = None, until: float = None, limit: int = 50, offset: int = 0):
+        """Return ``(total, listings)`` for one page of snapshots, newest first"""
+        clauses, params = [], []
+        if city is not None:
+            clauses.append("city = ?")
+            params.append(normalize_city(city))
+        if min_budget is not None:
+            clauses.append("max_budget >= ?")
+            params.append(min_budget)
+        if max_budget is not None:
+            clauses.append("max_budget <= ?")
+            params.append(max_budget)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM snapshots {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {LIST_COLUMNS} FROM snapshots {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return total, [_listing(row) for row in rows]
+
+    def get(self, filename: str):
+        """Stored JSON bytes of a snapshot, or None"""
+        row = self._conn().execute("SELECT payload FROM snapshots WHERE filename = ?", (filename,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, filename: str):
+        """Remove a snapshot and its scores, returning whether it existed"""
+        with self._write_lock, self._conn() as conn:
+            return conn.execute("DELETE FROM snapshots WHERE filename = ?", (filename,)).rowcount > 0
+
+    def history(self, property_id: str, limit: int = 100):
+        """A property's scores across snapshots, newest first"""
+        rows = self._conn().execute(
+            "SELECT s.filename, s.city_display, s.max_budget, p.created_at, p.rank, p.score "
+            "FROM property_scores p JOIN snapshots s ON s.id = p.snapshot_id "
+            "WHERE p.property_id = ? ORDER BY p.created_at DESC LIMIT ?",
+            (property_id, limit),
+        ).fetchall()
+        return [
+            {
+                "filename": filename,
+                "city": city,
+                "max_budget": max_budget,
+                "timestamp": datetime.fromtimestamp(created_at).isoformat(),
+                "rank": rank,
+                "score": score,
+            }
+            for filename, city, max_budget, created_at, rank, score in rows
+        ]
+
+    def _apply_retention(self, conn):
+        deleted = 0
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 86400
+            deleted += conn.execute("DELETE FROM snapshots WHERE created_at < ?", (cutoff,)).rowcount
+        if self.max_snapshots:
+            deleted += conn.execute(
+                "DELETE FROM snapshots WHERE id IN ("
+                "SELECT id FROM snapshots ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?)",
+                (self.max_snapshots,),
+            ).rowcount
+        self.expired += deleted
+        return deleted
+
+    def apply_retention(self):
+        """Delete snapshots past the age and count limits, returning how many went"""
+        with self._write_lock, self._conn() as conn:
+            return self._apply_retention(conn)
+
+    def compact(self):
+        """Apply retention, then fold the WAL into the database and reclaim free pages"""
+        deleted = self.apply_retention()
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        logger.info(f"🗜️ Compacted snapshot archive, {deleted} expired snapshots removed")
+        return deleted
+
+    def import_directory(self, directory: str, skip: tuple = ()):
+        """Import legacy per-file JSON snapshots; already imported files are skipped"""
+        conn = self._conn()
+        imported = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json") or name in skip:
+                continue
+            if conn.execute("SELECT 1 FROM snapshots WHERE filename = ?", (name,)).fetchone():
+                continue
+            filepath = os.path.join(directory, name)
+            try:
+                with open(filepath, "rb") as f:
+                    data = loads(f.read())
+                self.save(str(data.get("city", "")), data.get("max_budget"), data,
+                          created_at=os.path.getmtime(filepath), filename=name)
+                imported += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Skipping unreadable snapshot {name}: {e}")
+        if imported:
+            logger.info(f"📥 Imported {imported} saved recommendation files into {self.path}")
+        return imported
+
+    def stats(self):
+        return {
+            "snapshots": self._conn().execute("SELECT COUNT(*) FROM snapshots").fetchone()[0],
+            "saved": self.saved,
+            "expired": self.expired,
+        }
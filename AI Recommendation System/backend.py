@@ -0,0 +1,181 @@
+"""
+Express backend fallback used while MongoDB is unavailable.
+
+``BackendCatalog`` fetches ``/api/rentals`` through the server's pooled
+HTTP client and revalidates with ``If-None-Match``/``If-Modified-Since``, so
+an unchanged catalog costs a 304 instead of a full download. Each payload is
+converted and indexed by city once; requests then pick their city from the
+index instead of filtering the whole list. A ``CircuitBreaker`` stops
+calling a backend that keeps failing and lets a single trial request
+through after a cool-down. While the circuit is open the last good payload
+keeps being served.
+"""
+import logging
+import time
+
+from score_cache import ALL_CITIES, normalize_city
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures.
+
+    While open every call is refused until ``reset_timeout`` seconds have
+    passed; then one trial call is let through (half-open), which closes
+    the circuit on success and re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.trial or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Whether a call may go out now; claims the trial call when half-open"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial:
+            self.trial = True
+            return True
+        self.rejected += 1
+        return False
+
+    def success(self):
+        if self.opened_at is not None:
+            logger.info("✅ Backend circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        if self.trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if not self.trial:
+                self.opens += 1
+            logger.warning(f"⚠️ Backend circuit open after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self.trial = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+def to_property(rental: dict):
+    """Map an Express rental onto the property fields the scorer expects"""
+    return {
+        "_id": str(rental.get("_id", "")),
+        "name": rental.get("name", ""),
+        "price": rental.get("price", 0),
+        "rating": rental.get("rating", 0),
+        "capacity": rental.get("capacity", 1),
+        "amenities": rental.get("amenities", {}),
+        "city": rental.get("location", ""),
+        "location": rental.get("location", ""),
+        "property_type": rental.get("property_type", ""),
+        "latitude": rental.get("latitude"),
+        "longitude": rental.get("longitude"),
+        "images": rental.get("images", [])
+    }
+
+
+class BackendCatalog:
+    """Conditional, circuit-broken fetches of the Express rentals list, indexed by city"""
+
+    def __init__(self, url: str, timeout: float = 2, breaker: CircuitBreaker = None):
+        self.url = url
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.etag = None
+        self.last_modified = None
+        self.properties = None
+        self.by_city = {}
+        self.fetched_at = None
+        self.counters = {"requests": 0, "not_modified": 0, "downloads": 0, "errors": 0}
+
+    def _index(self, rentals: list):
+        self.properties = [to_property(r) for r in rentals]
+        by_city = {}
+        for prop in self.properties:
+            by_city.setdefault(normalize_city(prop["city"]), []).append(prop)
+        self.by_city = by_city
+
+    def _select(self, city_key: str):
+        if city_key == ALL_CITIES:
+            return list(self.properties)
+        return list(self.by_city.get(city_key, ()))
+
+    async def fetch(self, client, city_key: str = ALL_CITIES):
+        """
+        Return the city's properties, revalidating the cached payload first.
+
+        A failed or refused call falls back to the last good payload. With
+        none yet, errors propagate and a refused call raises ``CircuitOpen``.
+        """
+        if not self.breaker.allow():
+            if self.properties is None:
+                raise CircuitOpen(f"backend circuit is {self.breaker.state}")
+            return self._select(city_key)
+
+        headers = {}
+        if self.properties is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+
+        self.counters["requests"] += 1
+        try:
+            response = await client.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and self.properties is not None:
+                self.counters["not_modified"] += 1
+            elif response.status_code == 200:
+                self._index(response.json().get("rentals", []))
+                self.etag = response.headers.get("ETag")
+                self.last_modified = response.headers.get("Last-Modified")
+                self.counters["downloads"] += 1
+            else:
+                raise RuntimeError(f"backend returned status {response.status_code}")
+        except Exception as e:
+            self.counters["errors"] += 1
+            self.breaker.failure()
+            if self.properties is None:
+                raise
+            logger.warning(f"⚠️ Backend fetch failed: {e} - serving the last good payload")
+            return self._select(city_key)
+
+        self.breaker.success()
+        self.fetched_at = time.time()
+        return self._select(city_key)
+
+    def stats(self):
+        return {
+            **self.counters,
+            "circuit": self.breaker.stats(),
+            "circuit_open": self.breaker.state != "closed",
+            "cached_properties": len(self.properties) if self.properties is not None else 0,
+            "fetched_at": self.fetched_at,
+        }
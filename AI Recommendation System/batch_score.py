@@ -0,0 +1,352 @@
+"""
+Offline batch scoring of the whole property catalog.
+
+The properties collection (or an NDJSON export of it) is streamed with a
+batched cursor and cut into fixed-size chunks. Worker processes encode and
+score the chunks in parallel and spill each one to disk as a run sorted by
+city, then score. The runs are k-way merged into a catalog version laid out
+per city: each city's properties are contiguous and ranked, with the global
+all-cities ranking stored alongside. Only a bounded number of chunks is in
+flight and the merge streams through memory-mapped runs, so memory use does
+not grow with the catalog.
+
+The output uses the ``shared_catalog`` format, so the API serves it directly
+by pointing ``SHARED_CATALOG_DIR`` at the output directory (or with
+``serve.py --no-publish``), and picks up each new run as soon as it lands.
+
+    python batch_score.py --chunk-size 20000 --workers 4
+    python batch_score.py --input catalog.ndjson --output recommendations/batch_catalog
+"""
+import argparse
+import heapq
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from dotenv import load_dotenv
+
+from compiled_model import load_model
+from feature_schema import FeatureSchema
+from feature_store import FALLBACK_FEATURES, RESULT_COLUMNS, FeatureStore
+from persistence import dumps, loads
+from shared_catalog import commit_version, stage_version
+
+logger = logging.getLogger("batch_score")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Rows gathered per copy while merging runs
+MERGE_BLOCK = 65536
+
+# Set in each scoring process by load_scorer()
+_model = None
+_feature_names = list(FALLBACK_FEATURES)
+_schema = None
+
+
+def load_scorer(model_path: str, features_path: str, artifact_path: str, schema_path: str):
+    """Load the model and feature schema the way ml_server does, falling back to the scoring formula"""
+    global _model, _feature_names, _schema
+    try:
+        model, names = load_model(model_path, features_path, artifact_path)
+    except Exception as e:
+        logger.warning(f"⚠️ Error loading model files: {e}, using fallback scoring formula")
+        model, names = None, None
+    _model = model
+    _feature_names = list(names) if model is not None else list(FALLBACK_FEATURES)
+    _schema = FeatureSchema.load(schema_path, _feature_names) if model is not None else FeatureSchema(_feature_names)
+
+
+def read_mongo(uri: str, db: str, chunk_size: int, limit: int = 0, schema: FeatureSchema = None):
+    """Stream every property from MongoDB with the server's query plan"""
+    from pymongo import MongoClient
+
+    from query_planner import QueryPlanner
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    try:
+        plan = QueryPlanner((schema or _schema).source_fields, RESULT_COLUMNS).plan()
+        for doc in plan.find(client[db]["properties"], limit, batch_size=chunk_size):
+            doc["_id"] = str(doc["_id"])
+            yield doc
+    finally:
+        client.close()
+
+
+def read_ndjson(path: str, limit: int = 0):
+    with open(path, "rb") as f:
+        for i, line in enumerate(f):
+            if limit and i >= limit:
+                return
+            if line.strip():
+                yield loads(line)
+
+
+def chunked(docs, size: int):
+    chunk = []
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_chunk(docs: list, path: str):
+    """Encode and score one chunk, then write it to path as a run ranked within each city"""
+    store = FeatureStore(_feature_names, RESULT_COLUMNS, capacity=max(len(docs), 1), schema=_schema)
+    store.upsert(docs)
+    rows = np.flatnonzero(store.live[:store.size])
+    if _model is not None:
+        store.scores[rows] = _model.predict(store.matrix[rows])
+    else:
+        store.scores[rows] = store.fallback_scores(rows)
+
+    # Runs number cities alphabetically so every run sorts the same way
+    cities = sorted(store.cities)
+    rank = np.empty(len(store.cities), dtype=np.int32)
+    rank[np.argsort(np.array(store.cities, dtype=str), kind="stable")] = np.arange(len(cities))
+    city_codes = rank[store.city_codes[rows]]
+    ids = np.array([store.ids[r] for r in rows], dtype=str)
+    order = np.lexsort((ids, -store.scores[rows], city_codes))
+    rows, city_codes, ids = rows[order], city_codes[order], ids[order]
+
+    records = [dumps(store.records[r]) for r in rows]
+    os.makedirs(path)
+    arrays = {
+        "matrix": store.matrix[rows],
+        "scores": store.scores[rows],
+        "prices": store.prices[rows],
+        "ratings": store.ratings[rows],
+        "city_codes": city_codes,
+        "lats": store.lats[rows],
+        "lngs": store.lngs[rows],
+        "amenity_masks": store.amenity_masks[rows],
+        "ids": ids,
+        "record_offsets": np.concatenate([[0], np.cumsum([len(r) for r in records])]).astype(np.int64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, "records.bin"), "wb") as f:
+        f.writelines(records)
+
+    bounds = np.searchsorted(city_codes, np.arange(len(cities) + 1))
+    return {
+        "path": path,
+        "rows": len(rows),
+        "id_width": ids.dtype.itemsize // 4,
+        "ranges": {city: (int(bounds[c]), int(bounds[c + 1])) for c, city in enumerate(cities)},
+    }
+
+
+def score_chunks(chunks, spill: str, workers: int, scorer: tuple):
+    """Score chunks across worker processes, keeping at most two per worker in flight"""
+    runs = []
+    started = time.time()
+
+    def collect(futures):
+        for future in futures:
+            runs.append(future.result())
+            if len(runs) % 10 == 0:
+                rows = sum(run["rows"] for run in runs)
+                logger.info(f"⚙️ Scored {len(runs)} chunks ({rows} properties, {rows / (time.time() - started):.0f}/s)")
+
+    if workers <= 1:
+        for i, chunk in enumerate(chunks):
+            runs.append(score_chunk(chunk, os.path.join(spill, f"run{i:06d}")))
+        return runs
+
+    with ProcessPoolExecutor(workers, initializer=load_scorer, initargs=scorer) as pool:
+        pending = set()
+        for i, chunk in enumerate(chunks):
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(score_chunk, chunk, os.path.join(spill, f"run{i:06d}")))
+        collect(wait(pending).done)
+
+    # Completion order varies; keep the merge deterministic
+    runs.sort(key=lambda run: run["path"])
+    return runs
+
+
+def _ranked(scores, ids, start: int, end: int, tag=None, block: int = 4096):
+    """Yield ``(-score, id, tag, row)`` for rows start..end, reading the arrays in blocks"""
+    for lo in range(start, end, block):
+        hi = min(lo + block, end)
+        for row, score, doc_id in zip(range(lo, hi), scores[lo:hi].tolist(), ids[lo:hi].tolist()):
+            yield -score, doc_id, tag, row
+
+
+def merge_runs(runs: list, staging: str, feature_names: list, mode: str, encodings: dict = None):
+    """K-way merge sorted runs into a catalog version: per-city blocks plus the global order"""
+    open_memmap = np.lib.format.open_memmap
+    total = sum(run["rows"] for run in runs)
+    cities = sorted({city for run in runs for city in run["ranges"]})
+    width = max(run["id_width"] for run in runs)
+
+    def column(name, dtype, shape=(total,)):
+        return open_memmap(os.path.join(staging, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+    out = {
+        "matrix": column("matrix", np.float32, (total, len(feature_names))),
+        "scores": column("scores", np.float32),
+        "prices": column("prices", np.float32),
+        "ratings": column("ratings", np.float32),
+        "city_codes": column("city_codes", np.int32),
+        "lats": column("lats", np.float32),
+        "lngs": column("lngs", np.float32),
+        "amenity_masks": column("amenity_masks", np.uint16),
+        "live": column("live", bool),
+        "ids": column("ids", f"<U{width}"),
+    }
+    offsets = column("record_offsets", np.int64, (total + 1,))
+    offsets[0] = 0
+    out["live"][:] = True
+
+    loaded = []
+    for run in runs:
+        arrays = {name: np.load(os.path.join(run["path"], f"{name}.npy"), mmap_mode="r")
+                  for name in ("matrix", "scores", "prices", "ratings", "lats", "lngs", "amenity_masks", "ids",
+                               "record_offsets")}
+        with open(os.path.join(run["path"], "records.bin"), "rb") as f:
+            arrays["records"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if arrays["record_offsets"][-1] else b""
+        loaded.append(arrays)
+
+    ranges = {}
+    position = 0
+    with open(os.path.join(staging, "records.bin"), "wb") as blob:
+        for code, city in enumerate(cities):
+            start = position
+            streams = [_ranked(loaded[i]["scores"], loaded[i]["ids"], *run["ranges"][city], tag=i)
+                       for i, run in enumerate(runs) if city in run["ranges"]]
+            merged = heapq.merge(*streams)
+            while True:
+                block = [(tag, row) for _, _, tag, row in _take(merged, MERGE_BLOCK)]
+                if not block:
+                    break
+                position = _copy_block(block, loaded, out, offsets, blob, position)
+            out["city_codes"][start:position] = code
+            ranges[city] = (start, position)
+
+    # All-cities ranking: merge the already ranked city blocks
+    order = column("order", np.int64)
+    streams = [_ranked(out["scores"], out["ids"], start, end) for start, end in ranges.values()]
+    merged = heapq.merge(*streams)
+    written = 0
+    while True:
+        block = [row for _, _, _, row in _take(merged, MERGE_BLOCK)]
+        if not block:
+            break
+        order[written:written + len(block)] = block
+        written += len(block)
+
+    for array in list(out.values()) + [offsets, order]:
+        array.flush()
+    meta = {
+        "version": os.path.basename(staging).lstrip("."),
+        "mode": mode,
+        "cities": cities,
+        "feature_names": list(feature_names),
+        "encodings": encodings or {},
+        "rows": total,
+        "city_ranges": ranges,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def _take(iterator, n: int):
+    block = []
+    for item in iterator:
+        block.append(item)
+        if len(block) == n:
+            break
+    return block
+
+
+def _copy_block(block: list, loaded: list, out: dict, offsets, blob, position: int):
+    """Copy merged (run, row) pairs to the output starting at position"""
+    tags = np.array([tag for tag, _ in block])
+    rows = np.array([row for _, row in block])
+    end = position + len(block)
+    for tag in np.unique(tags):
+        at = np.flatnonzero(tags == tag)
+        source = loaded[tag]
+        for name in ("matrix", "scores", "prices", "ratings", "lats", "lngs", "amenity_masks", "ids"):
+            out[name][position + at] = source[name][rows[at]]
+
+    sizes = np.empty(len(block), dtype=np.int64)
+    for i, (tag, row) in enumerate(block):
+        source = loaded[tag]
+        start, stop = source["record_offsets"][row], source["record_offsets"][row + 1]
+        blob.write(source["records"][start:stop])
+        sizes[i] = stop - start
+    offsets[position + 1:end + 1] = offsets[position] + np.cumsum(sizes)
+    return end
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every property offline and write per-city rankings")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    parser.add_argument("--db", default="webgi")
+    parser.add_argument("--input", help="NDJSON export to score instead of MongoDB")
+    parser.add_argument("--output", default=os.path.join(HERE, "recommendations", "batch_catalog"))
+    parser.add_argument("--chunk-size", type=int, default=20000, help="documents per cursor batch and scoring chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes (1 = inline)")
+    parser.add_argument("--limit", type=int, default=0, help="score at most this many properties (0 = all)")
+    parser.add_argument("--model", default=os.path.join(HERE, "best_model.pkl"))
+    parser.add_argument("--features", default=os.path.join(HERE, "feature_names.pkl"))
+    parser.add_argument("--artifact", default=os.getenv("COMPILED_MODEL_PATH", os.path.join(HERE, "best_model.npz")))
+    parser.add_argument("--schema", default=os.getenv("FEATURE_SCHEMA_PATH", os.path.join(HERE, "feature_schema.json")))
+    args = parser.parse_args()
+
+    if not args.input and not args.mongo_uri:
+        parser.error("set MONGO_URI, pass --mongo-uri or pass --input")
+
+    # Load (and compile, if needed) once up front so the workers only read the artifact
+    scorer = (args.model, args.features, args.artifact, args.schema)
+    load_scorer(*scorer)
+
+    if args.input:
+        docs, mode = read_ndjson(args.input, args.limit), "file"
+    else:
+        docs, mode = read_mongo(args.mongo_uri, args.db, args.chunk_size, args.limit), "mongodb"
+
+    started = time.time()
+    version, staging = stage_version(args.output)
+    spill = os.path.join(args.output, f".spill-{version}")
+    os.makedirs(spill)
+    try:
+        runs = score_chunks(chunked(docs, args.chunk_size), spill, args.workers, scorer)
+        if not sum(run["rows"] for run in runs):
+            logger.warning("⚠️ No properties to score, nothing published")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        scored = time.time()
+        meta = merge_runs(runs, staging, _feature_names, mode, _schema.encodings)
+        commit_version(args.output, version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(spill, ignore_errors=True)
+
+    logger.info(
+        f"📤 Published {version} to {args.output}: {meta['rows']} properties in {len(meta['cities'])} cities "
+        f"(score {scored - started:.1f}s, merge {time.time() - scored:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    main()
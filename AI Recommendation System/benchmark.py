@@ -0,0 +1,264 @@
+"""
+Benchmark harness for the scoring service.
+
+For each catalog size a synthetic catalog is generated, every stage of the
+scoring path is timed on its own (fetch, preprocess, predict, sort,
+serialize, persist), and then ``/recommend`` is driven in-process through
+the ASGI app at each concurrency level to measure latency percentiles and
+throughput. Peak RSS is sampled after every run. Results are written as
+JSON so runs can be compared over time.
+
+Without ``--mongo-uri`` the catalog cache loader is replaced by an
+in-memory stand-in serving the synthetic catalog. With it, the catalog is
+seeded into ``<db>.properties`` of that server (a local mongod) and the
+real MongoDB fetch path is measured.
+
+    python benchmark.py --sizes 1000 10000 100000 --concurrency 1 8 32 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUDGETS = [6000, 9000, 12000, 20000, 500000]
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(samples_ms: list):
+    samples = np.array(samples_ms)
+    return {
+        "runs": len(samples),
+        "min_ms": round(float(samples.min()), 3),
+        "median_ms": round(float(np.median(samples)), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def time_stages(server, fetch, repeat: int, workdir: str):
+    """Time each scoring stage separately over repeat runs"""
+    from persistence import dumps, write_atomic
+    from score_cache import ALL_CITIES, CatalogEntry
+
+    samples = {stage: [] for stage in ("fetch", "preprocess", "predict", "sort", "serialize", "persist")}
+    for _ in range(repeat):
+        (_, docs), ms = await timed(fetch, ALL_CITIES)
+        samples["fetch"].append(ms)
+
+        store = server.new_feature_store()
+        rows, ms = await timed(store.upsert, docs)
+        samples["preprocess"].append(ms)
+
+        scores, ms = await timed(server.score_rows, store, rows)
+        store.scores[rows] = scores
+        samples["predict"].append(ms)
+
+        entry = CatalogEntry(ALL_CITIES, "benchmark", store)
+        (total, top), ms = await timed(entry.top, ALL_CITIES, 12000, 100)
+        samples["sort"].append(ms)
+
+        response = {"recommendations": top, "total_properties_scored": total, "mode": "benchmark"}
+        payload, ms = await timed(dumps, response)
+        samples["serialize"].append(ms)
+
+        _, ms = await timed(write_atomic, os.path.join(workdir, "stage.json"), payload)
+        samples["persist"].append(ms)
+
+    return {stage: summarize(values) for stage, values in samples.items()}
+
+
+async def load_test(client, cities: list, concurrency: int, requests: int, seed: int):
+    """Issue requests /recommend calls from concurrency workers"""
+    rng = random.Random(seed)
+    queries = [
+        {"city": rng.choice(cities + ["all"]), "max_budget": rng.choice(BUDGETS), "top_k": 20}
+        for _ in range(requests)
+    ]
+    latencies, errors = [], 0
+    position = 0
+
+    async def worker():
+        nonlocal position, errors
+        while position < len(queries):
+            params = queries[position]
+            position += 1
+            started = time.perf_counter()
+            response = await client.get("/recommend", params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200 or "error" in response.json():
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            f"p{q}": round(float(np.percentile(latencies, q)), 3) for q in (50, 90, 95, 99)
+        } | {"max": round(float(latencies.max()), 3)},
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+async def seed_mongo(uri: str, db: str, docs: list):
+    from pymongo import AsyncMongoClient
+    from query_planner import ensure_indexes
+
+    client = AsyncMongoClient(uri)
+    collection = client[db]["properties"]
+    await collection.drop()
+    for start in range(0, len(docs), 10000):
+        # insert_many adds _id keys in place; insert copies so the catalog stays reusable
+        await collection.insert_many([dict(d) for d in docs[start:start + 10000]])
+    await ensure_indexes(collection)
+    return client, collection
+
+
+async def run(args):
+    import httpx
+
+    from admission import AdmissionController, RateLimiter
+    from score_cache import ALL_CITIES, normalize_city
+    from persistence import CatalogSnapshot, SnapshotFile
+    from synthetic_catalog import city_names, generate_catalog
+
+    workdir = tempfile.mkdtemp(prefix="webgi-bench-")
+    os.environ["MONGO_URI"] = ""
+    os.environ["ARCHIVE_PATH"] = os.path.join(workdir, "archive.db")
+    import ml_server as server
+    # Every benchmark request comes from one client: without this they would measure 429s and 503s
+    server.admission = AdmissionController({}, RateLimiter(0, 1))
+    try:
+        server.load_model_files()
+    except Exception as e:
+        print(f"model not loaded, benchmarking the fallback formula: {e}", file=sys.stderr)
+
+    # Keep the checked-in recommendations.json untouched
+    server.recommendations_file = SnapshotFile(os.path.join(workdir, "recommendations.json"), 0)
+    server.catalog_snapshot = CatalogSnapshot(os.path.join(workdir, "catalog_snapshot.json"), 0)
+
+    results = []
+    for size in args.sizes:
+        docs = generate_catalog(size, args.seed)
+        mongo_client = None
+
+        if args.mongo_uri:
+            mongo_client, server.collection = await seed_mongo(args.mongo_uri, args.db, docs)
+            fetch = server.fetch_properties
+        else:
+            async def fetch(city_key: str, docs=docs):
+                # Stand-in for the MongoDB fetch: fresh dicts per load, as the driver would decode
+                return "mongodb", [dict(d) for d in docs
+                                   if city_key == ALL_CITIES or normalize_city(d["city"]) == city_key]
+            server.collection = None
+            server.catalog_cache.loader = fetch
+
+        result = {
+            "catalog_size": size,
+            "stages": await time_stages(server, fetch, args.repeat, workdir),
+            "load": [],
+        }
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for concurrency in args.concurrency:
+                server.catalog_cache.invalidate()
+                started = time.perf_counter()
+                await client.get("/recommend", params={"city": "all", "top_k": 20})
+                cold_ms = (time.perf_counter() - started) * 1000
+
+                run_result = await load_test(client, city_names(), concurrency, args.requests, args.seed)
+                run_result["cold_ms"] = round(cold_ms, 3)
+                if run_result["errors"]:
+                    raise RuntimeError(f"size={size} concurrency={concurrency}: {run_result['errors']} of "
+                                       f"{run_result['requests']} requests failed, latencies would be meaningless")
+                result["load"].append(run_result)
+                print(f"size={size} concurrency={concurrency} "
+                      f"p50={run_result['latency_ms']['p50']}ms p99={run_result['latency_ms']['p99']}ms "
+                      f"rps={run_result['throughput_rps']}", file=sys.stderr)
+
+        result["peak_rss_bytes"] = peak_rss_bytes()
+        results.append(result)
+        server.catalog_cache.invalidate()
+        if mongo_client is not None:
+            await mongo_client.close()
+
+    server.recommendations_file.close()
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "source": "mongodb" if args.mongo_uri else "synthetic",
+            "model": type(server.model).__name__ if server.model is not None else None,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation scoring service")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage timing")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", help="seed and query this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--db", default="webgi_bench")
+    parser.add_argument("--output", help="JSON results file (default stdout)")
+    args = parser.parse_args()
+
+    # Model files and recommendations/ are resolved relative to the server directory
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+    report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Dependency-light scorer compiled from the trained pipeline.
+
+``best_model.pkl`` is an sklearn ``Pipeline`` (imputer, optional scaler,
+XGBoost estimator). Unpickling it imports sklearn and xgboost and every
+predict goes through their validation layers. ``export_model()`` flattens
+the fitted pipeline into plain arrays (imputer medians, scaler moments and
+every tree's nodes) saved as an ``.npz`` file, and ``CompiledModel``
+evaluates all trees at once with vectorized NumPy, so the server needs
+only NumPy to load and run the model.
+
+Run ``python compiled_model.py [best_model.pkl] [best_model.npz] [--check data.csv]``
+to export ahead of deploys; the export refuses to write an artifact whose
+predictions differ from the original pipeline.
+"""
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOGISTIC_OBJECTIVES = ("binary:logistic", "binary:logitraw", "reg:logistic")
+
+# Rows evaluated per chunk, bounding the (rows x trees) node index matrix
+EVAL_CHUNK_ROWS = 4096
+
+
+class CompiledModel:
+    """Flattened tree ensemble evaluated with NumPy"""
+
+    def __init__(self, arrays: dict):
+        self.feature_names = [str(f) for f in arrays["feature_names"]]
+        self.objective = str(arrays["objective"])
+        self.base_margin = float(arrays["base_margin"])
+        self.columns = arrays["columns"]
+        self.fill = arrays["fill"]
+        self.shift = arrays["shift"]
+        self.scale = arrays["scale"]
+        self.roots = arrays["roots"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.default_left = arrays["default_left"]
+        self.value = arrays["value"]
+        self.depth = int(arrays["depth"])
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.roots)
+
+    def transform(self, X):
+        """Apply the imputer and scaler steps"""
+        X = np.asarray(X, dtype=np.float32)[:, self.columns]
+        X = np.where(np.isnan(X), self.fill, X)
+        return ((X - self.shift) / self.scale).astype(np.float32)
+
+    def margin(self, X):
+        """Raw ensemble output: base margin plus the sum of leaf values"""
+        X = self.transform(X)
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), EVAL_CHUNK_ROWS):
+            chunk = X[start:start + EVAL_CHUNK_ROWS]
+            rows = np.arange(len(chunk))[:, None]
+            node = np.broadcast_to(self.roots, (len(chunk), len(self.roots))).copy()
+            # Leaves point to themselves, so every tree settles within depth steps
+            for _ in range(self.depth):
+                x = chunk[rows, self.feature[node]]
+                go_left = np.where(np.isnan(x), self.default_left[node], x < self.threshold[node])
+                node = np.where(go_left, self.left[node], self.right[node])
+            out[start:start + len(chunk)] = self.value[node].sum(axis=1, dtype=np.float64)
+        return out + self.base_margin
+
+    def predict_proba(self, X):
+        if self.objective not in LOGISTIC_OBJECTIVES:
+            raise ValueError(f"predict_proba is undefined for objective {self.objective}")
+        p = 1.0 / (1.0 + np.exp(-self.margin(X)))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X):
+        """Same output as the pipeline's predict: class labels or regression values"""
+        margin = self.margin(X)
+        if self.objective in LOGISTIC_OBJECTIVES:
+            return (margin > 0).astype(np.int64)
+        return margin
+
+
+def _base_margin(config: dict, objective: str):
+    base_score = config["learner"]["learner_model_param"]["base_score"]
+    # XGBoost 3 stores it as a one-element vector, e.g. "[5E-1]"
+    base_score = float(str(base_score).strip("[]").split(",")[0])
+    if objective in ("binary:logistic", "reg:logistic"):
+        return math.log(base_score / (1.0 - base_score))
+    return base_score
+
+
+def _flatten_trees(booster):
+    model = json.loads(booster.save_raw("json"))["learner"]["gradient_booster"]["model"]
+
+    roots, depth = [], 0
+    columns = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "value")}
+    for tree in model["trees"]:
+        if tree.get("categories_nodes"):
+            raise ValueError("Categorical splits are not supported")
+        offset = len(columns["feature"])
+        roots.append(offset)
+        left, right = tree["left_children"], tree["right_children"]
+        conditions, split_indices = tree["split_conditions"], tree["split_indices"]
+
+        node_depth = {0: 1}
+        for n in range(len(left)):
+            leaf = left[n] == -1
+            columns["feature"].append(0 if leaf else split_indices[n])
+            columns["threshold"].append(0.0 if leaf else conditions[n])
+            columns["left"].append(offset + (n if leaf else left[n]))
+            columns["right"].append(offset + (n if leaf else right[n]))
+            columns["default_left"].append(bool(tree["default_left"][n]))
+            # Leaf values are stored in split_conditions
+            columns["value"].append(conditions[n] if leaf else 0.0)
+            if not leaf:
+                node_depth[left[n]] = node_depth[right[n]] = node_depth[n] + 1
+        depth = max(depth, max(node_depth.values()))
+
+    return {
+        "roots": np.array(roots, dtype=np.int32),
+        "feature": np.array(columns["feature"], dtype=np.int32),
+        "threshold": np.array(columns["threshold"], dtype=np.float32),
+        "left": np.array(columns["left"], dtype=np.int32),
+        "right": np.array(columns["right"], dtype=np.int32),
+        "default_left": np.array(columns["default_left"], dtype=bool),
+        "value": np.array(columns["value"], dtype=np.float32),
+        "depth": np.int32(depth),
+    }
+
+
+def compile_pipeline(pipeline, feature_names: list):
+    """Flatten a fitted imputer/scaler/XGBoost pipeline into CompiledModel arrays"""
+    steps = [step for _, step in pipeline.steps] if hasattr(pipeline, "steps") else [pipeline]
+    *transforms, estimator = steps
+
+    width = len(feature_names)
+    columns = np.arange(width)
+    fill = np.zeros(width, dtype=np.float32)
+    shift = np.zeros(width, dtype=np.float32)
+    scale = np.ones(width, dtype=np.float32)
+    for step in transforms:
+        kind = type(step).__name__
+        if kind == "SimpleImputer":
+            if step.strategy not in ("median", "mean", "most_frequent", "constant"):
+                raise ValueError(f"Unsupported imputer strategy: {step.strategy}")
+            statistics = np.asarray(step.statistics_, dtype=np.float32)
+            # Columns that were all-missing during fit are dropped by the imputer
+            kept = ~np.isnan(statistics)
+            columns, fill = columns[kept], statistics[kept]
+            shift, scale = shift[kept], scale[kept]
+        elif kind == "StandardScaler":
+            if step.with_mean:
+                shift = np.asarray(step.mean_, dtype=np.float32)
+            if step.with_std:
+                scale = np.asarray(step.scale_, dtype=np.float32)
+        else:
+            raise ValueError(f"Unsupported pipeline step: {kind}")
+
+    if not hasattr(estimator, "get_booster"):
+        raise ValueError(f"Unsupported estimator: {type(estimator).__name__}")
+    arrays = compile_booster(estimator.get_booster(), feature_names)
+    arrays.update({
+        "columns": columns.astype(np.int32),
+        "fill": fill.astype(np.float32),
+        "shift": shift.astype(np.float32),
+        "scale": scale.astype(np.float32),
+    })
+    return arrays
+
+
+def compile_booster(booster, feature_names: list):
+    """Flatten a trained XGBoost booster into CompiledModel arrays; missing values take the default branches"""
+    config = json.loads(booster.save_config())
+    objective = config["learner"]["objective"]["name"]
+    if objective.startswith("multi:"):
+        raise ValueError(f"Unsupported objective: {objective}")
+
+    width = len(feature_names)
+    arrays = _flatten_trees(booster)
+    arrays.update({
+        "feature_names": np.array([str(f) for f in feature_names]),
+        "objective": np.array(objective),
+        "base_margin": np.float64(_base_margin(config, objective)),
+        "columns": np.arange(width, dtype=np.int32),
+        "fill": np.full(width, np.nan, dtype=np.float32),
+        "shift": np.zeros(width, dtype=np.float32),
+        "scale": np.ones(width, dtype=np.float32),
+    })
+    return arrays
+
+
+def parity_sample(feature_names: list, rows: int = 2000, seed: int = 42):
+    """Synthetic feature rows spanning the value ranges the server encodes"""
+    rng = np.random.default_rng(seed)
+    X = np.zeros((rows, len(feature_names)), dtype=np.float32)
+    for j, name in enumerate(feature_names):
+        if name == "Rating":
+            X[:, j] = np.round(rng.uniform(0, 5, rows), 1)
+        elif name == "Price":
+            X[:, j] = rng.integers(0, 50000, rows)
+        elif name == "Views":
+            X[:, j] = rng.integers(0, 5000, rows)
+        elif name in ("Capacity", "Vacancies"):
+            X[:, j] = rng.integers(0, 40, rows)
+        else:
+            X[:, j] = rng.integers(0, 2, rows)
+    return X
+
+
+def export_model(pipeline, feature_names: list, path: str, X_check=None):
+    """Compile the pipeline, verify it against the original on X_check and save it"""
+    arrays = compile_pipeline(pipeline, feature_names)
+    compiled = CompiledModel(arrays)
+    if X_check is None:
+        X_check = parity_sample(feature_names)
+    X_check = np.asarray(X_check, dtype=np.float32)
+
+    expected = np.asarray(pipeline.predict(X_check))
+    actual = compiled.predict(X_check)
+    mismatches = int(np.sum(~np.isclose(actual, expected, rtol=1e-5, atol=1e-5)))
+    if mismatches:
+        raise ValueError(f"Compiled model disagrees with the pipeline on {mismatches}/{len(X_check)} rows")
+
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    logger.info(f"📦 Exported {len(compiled)} trees to {path} (parity checked on {len(X_check)} rows)")
+    return compiled
+
+
+def load_model(model_path: str, features_path: str, artifact_path: str):
+    """
+    Return ``(model, feature_names)``, preferring the compiled artifact.
+
+    The artifact is used when it is at least as new as the pickle. Otherwise
+    the pickle is loaded and exported once, falling back to the pipeline
+    itself if it cannot be compiled. ``(None, None)`` means no model exists.
+    """
+    pickle_mtime = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+    if os.path.exists(artifact_path) and (pickle_mtime is None or os.path.getmtime(artifact_path) >= pickle_mtime):
+        model = CompiledModel.load(artifact_path)
+        logger.info(f"⚡ Loaded compiled model ({len(model)} trees) from {artifact_path}")
+        return model, model.feature_names
+
+    if pickle_mtime is None:
+        return None, None
+
+    import joblib
+    pipeline = joblib.load(model_path)
+    feature_names = joblib.load(features_path)
+    try:
+        return export_model(pipeline, feature_names, artifact_path), feature_names
+    except Exception as e:
+        logger.warning(f"⚠️ Could not compile {model_path}: {e}, serving the pipeline directly")
+        return pipeline, feature_names
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Compile best_model.pkl into a NumPy scoring artifact")
+    parser.add_argument("model", nargs="?", default="best_model.pkl")
+    parser.add_argument("artifact", nargs="?", default="best_model.npz")
+    parser.add_argument("--features", default="feature_names.pkl")
+    parser.add_argument("--check", help="CSV of model features (e.g. the notebook's encoded X) for the parity check")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    names = joblib.load(args.features)
+    X_check = None
+    if args.check:
+        import pandas as pd
+        X_check = pd.read_csv(args.check).reindex(columns=names, fill_value=0).to_numpy(np.float32)
+    export_model(joblib.load(args.model), names, args.artifact, X_check)
@@ -0,0 +1,178 @@
+"""
+Declarative mapping from raw property documents to the model's features.
+
+The model was trained on the notebook's columns (``Price``, label-encoded
+``City``/``Type``...), while MongoDB and Express documents use lowercase
+``price``, ``location``, ``property_type`` and friends. ``FIELDS`` lists,
+per feature, the document fields it may come from in priority order.
+``FeatureSchema`` compiles that mapping once against ``feature_names`` into
+a per-column plan that writes a document straight into a matrix row:
+
+- numeric features are coerced to float, missing ones are 0 as in training
+- categorical features use the training ``LabelEncoder`` classes from
+  ``feature_schema.json``; values never seen in training become NaN, which
+  the model's median imputer fills exactly as it would for missing data
+- amenity columns, including spellings like ``power backup``, are set
+  from the document's amenity bitmask
+
+    python feature_schema.py training.csv   # write feature_schema.json from the training data
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from feature_store import amenity_bit, amenity_mask, to_float
+
+SCHEMA_VERSION = 1
+
+# Feature -> document fields it is read from, first present wins
+FIELDS = {
+    "Price": ["Price", "price"],
+    "Rating": ["Rating", "rating"],
+    "Capacity": ["Capacity", "capacity"],
+    "Vacancies": ["Vacancies", "vacancies"],
+    "Views": ["Views", "views"],
+    "City": ["City", "city", "location"],
+    "Type": ["Type", "type", "property_type", "propertyType"],
+    "Gender Preference": ["Gender Preference", "gender_preference", "genderPreference", "gender"],
+    "Sharing Type": ["Sharing Type", "sharing_type", "sharingType", "sharing"],
+}
+
+# Label-encoded in WebGI.ipynb; the codes are indexes into LabelEncoder.classes_
+CATEGORICAL = ("City", "Type", "Gender Preference", "Sharing Type")
+
+# Fields carrying the amenity list, as in training first
+AMENITY_FIELDS = ("Amenities", "amenities")
+
+
+def _key(value):
+    return str(value).strip().lower()
+
+
+class FeatureSchema:
+    """Compiled document-to-feature-row plan for one feature_names order"""
+
+    def __init__(self, feature_names: list, encodings: dict = None, fields: dict = None):
+        self.feature_names = list(feature_names)
+        self.encodings = {name: list(classes) for name, classes in (encodings or {}).items()}
+        fields = {**FIELDS, **(fields or {})}
+
+        self.numeric = []
+        self.categorical = []
+        amenities = []
+        self.capacity_col = None
+        for j, name in enumerate(self.feature_names):
+            bit = amenity_bit(name)
+            if name in CATEGORICAL:
+                table = {_key(c): float(code) for code, c in enumerate(self.encodings.get(name, ()))}
+                self.categorical.append((j, tuple(fields.get(name, [name])), table))
+            elif bit:
+                amenities.append((j, bit))
+            else:
+                self.numeric.append((j, tuple(fields.get(name, [name]))))
+            if name == "Capacity":
+                self.capacity_col = j
+        self.amenity_cols = np.array([j for j, _ in amenities], dtype=np.int64)
+        self.amenity_col_bits = np.array([bit for _, bit in amenities], dtype=np.uint16)
+
+        self.source_fields = sorted({f for _, sources in self.numeric for f in sources}
+                                    | {f for _, sources, _ in self.categorical for f in sources}
+                                    | set(AMENITY_FIELDS))
+        self.unencoded = [self.feature_names[j] for j, _, table in self.categorical if not table]
+
+    @classmethod
+    def load(cls, path: str, feature_names: list):
+        """Compile the schema with the encodings and field overrides saved at path, if any"""
+        if not os.path.exists(path):
+            return cls(feature_names)
+        with open(path) as f:
+            saved = json.load(f)
+        return cls(feature_names, saved.get("encodings"), saved.get("fields"))
+
+    def code(self, name: str, value):
+        """Matrix value of a categorical feature's class: codes pass through, labels are looked up (NaN if unknown)"""
+        if isinstance(value, (int, float)):
+            return float(value)
+        for j, _, table in self.categorical:
+            if self.feature_names[j] == name:
+                return table.get(_key(value), math.nan)
+        return math.nan
+
+    def encode(self, doc: dict, out):
+        """Write one document's numeric and categorical features into a matrix row, return its amenity bitmask"""
+        for j, sources in self.numeric:
+            value = 0.0
+            for field in sources:
+                if field in doc:
+                    # A listed capacity of 0 is read as 1
+                    value = to_float(doc[field]) or float(j == self.capacity_col)
+                    break
+            out[j] = value
+
+        for j, sources, table in self.categorical:
+            value = math.nan
+            for field in sources:
+                raw = doc.get(field)
+                if raw is not None and raw != "":
+                    # Already label-encoded documents keep their codes
+                    value = raw if isinstance(raw, (int, float)) else table.get(_key(raw), math.nan)
+                    break
+            out[j] = value
+
+        for field in AMENITY_FIELDS:
+            if doc.get(field) is not None:
+                return amenity_mask(doc[field])
+        return 0
+
+    def fill_amenities(self, matrix, rows, masks):
+        """Set the amenity columns of rows from their bitmasks in one vectorized step"""
+        if len(self.amenity_cols):
+            matrix[rows[:, None], self.amenity_cols] = (masks[:, None] & self.amenity_col_bits) != 0
+
+
+def fit_encodings(rows, fields: dict = None):
+    """
+    LabelEncoder classes (sorted distinct values) of each categorical feature, as in training.
+
+    Rows may be training CSV rows or raw documents; each feature is read from
+    its first present field in ``FIELDS``. Any iterable works, so documents
+    can be streamed through in a single pass.
+    """
+    fields = {**FIELDS, **(fields or {})}
+    values = {name: set() for name in CATEGORICAL}
+    for row in rows:
+        for name in CATEGORICAL:
+            for field in fields.get(name, [name]):
+                raw = row.get(field)
+                if raw is not None and raw != "":
+                    values[name].add(str(raw))
+                    break
+    return {name: sorted(classes) for name, classes in values.items()}
+
+
+def extend_encodings(previous: dict, fitted: dict):
+    """Previous classes keep their codes; classes seen since are appended in sorted order"""
+    extended = {}
+    for name in CATEGORICAL:
+        known = list(previous.get(name, ()))
+        seen = set(known)
+        extended[name] = known + [c for c in fitted.get(name, ()) if c not in seen]
+    return extended
+
+
+if __name__ == "__main__":
+    import argparse
+    import csv
+
+    parser = argparse.ArgumentParser(description="Write the training label encodings next to the model")
+    parser.add_argument("training_csv", help="the CSV WebGI.ipynb trained on")
+    parser.add_argument("--out", default="feature_schema.json")
+    args = parser.parse_args()
+
+    with open(args.training_csv, newline="") as f:
+        encodings = fit_encodings(csv.DictReader(f))
+    with open(args.out, "w") as f:
+        json.dump({"version": SCHEMA_VERSION, "encodings": encodings}, f, indent=2)
+    print(f"Wrote {args.out}: " + ", ".join(f"{name} ({len(c)} classes)" for name, c in encodings.items()))
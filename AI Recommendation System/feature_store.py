@@ -0,0 +1,250 @@
+"""
+Columnar feature store backing the scored-catalog cache.
+
+Properties are encoded once, when they are loaded or change, into a
+contiguous float32 matrix laid out in ``feature_names.pkl`` order, with a
+parallel id index and the few raw columns needed for filtering and fallback
+scoring. Requests then select rows with boolean city/budget masks and hand
+the matrix slice straight to the model, so no DataFrame is built per request.
+
+Amenities are tokenized once per distinct value, whether they arrive as a
+comma separated string, a list or a ``{name: bool}`` dict, into a uint16
+bitmask per row. The mask fills the amenity feature columns and answers
+amenity filters with a single bitwise AND.
+"""
+import math
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from geo_index import parse_coordinates
+
+AMENITIES = [
+    "wifi", "food", "ac", "parking",
+    "laundry", "power_backup", "security", "cctv",
+    "balcony", "tv"
+]
+
+# Bit i of an amenity mask is AMENITIES[i]
+AMENITY_BITS = {name: 1 << i for i, name in enumerate(AMENITIES)}
+
+# Spellings seen in listings, after lowercasing and joining words with "_"
+AMENITY_ALIASES = {
+    "wi_fi": "wifi",
+    "internet": "wifi",
+    "air_conditioning": "ac",
+    "air_conditioner": "ac",
+    "a/c": "ac",
+    "meals": "food",
+    "powerbackup": "power_backup",
+    "cctv_camera": "cctv",
+    "cctv_cameras": "cctv",
+    "washing_machine": "laundry",
+    "security_guard": "security",
+    "television": "tv",
+}
+
+_AMENITY_SEPARATORS = re.compile(r"[,;|\n]+")
+_AMENITY_SPACES = re.compile(r"[\s\-]+")
+
+# Model features assumed when feature_names.pkl is missing
+FALLBACK_FEATURES = ["Rating", "Capacity", "wifi", "ac", "parking"]
+
+# Columns included in scored results
+RESULT_COLUMNS = ["_id", "name", "price", "rating", "capacity", "amenities", "score", "city", "location"]
+
+
+def to_float(value, default: float = 0.0):
+    """Coerce a raw document value to float the way pd.to_numeric(errors='coerce') would"""
+    if value is None or isinstance(value, (dict, list)):
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if math.isnan(number) else number
+
+
+def amenity_bit(token: str):
+    """Bit of one amenity name or alias, 0 if unknown"""
+    key = _AMENITY_SPACES.sub("_", token.strip().lower())
+    return AMENITY_BITS.get(AMENITY_ALIASES.get(key, key), 0)
+
+
+@lru_cache(maxsize=4096)
+def _text_mask(text: str):
+    mask = 0
+    for token in _AMENITY_SEPARATORS.split(text):
+        mask |= amenity_bit(token)
+    return mask
+
+
+def amenity_mask(value):
+    """Bitmask of the known amenities in a string, list or dict amenity field
+
+    Tokens are matched whole and case-insensitively, so "ac" never matches
+    inside "power_backup". Dicts count the keys whose value is truthy.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return _text_mask(value)
+    if isinstance(value, dict):
+        value = [name for name, present in value.items() if present]
+    elif not isinstance(value, (list, tuple, set)):
+        return _text_mask(str(value))
+    mask = 0
+    for item in value:
+        mask |= _text_mask(str(item))
+    return mask
+
+
+def amenity_bits(amenities: list):
+    """Combined bitmask of amenity names, raising ValueError for unknown ones"""
+    mask = 0
+    for amenity in amenities:
+        bit = amenity_bit(amenity)
+        if not bit:
+            raise ValueError(f"Unknown amenity: {amenity}")
+        mask |= bit
+    return mask
+
+
+class FeatureStore:
+    """Row-wise updatable feature matrix with an id index"""
+
+    def __init__(self, feature_names: list, result_columns: list, capacity: int = 1024, schema=None):
+        self.feature_names = list(feature_names)
+        self.result_columns = [c for c in result_columns if c != "score"]
+
+        # The column plan is compiled once, not probed per document
+        if schema is None:
+            from feature_schema import FeatureSchema
+            schema = FeatureSchema(self.feature_names)
+        self.schema = schema
+
+        self.size = 0
+        self.ids = []
+        self.records = []
+        self.rows = {}
+        self.cities = []
+        self._city_codes = {}
+        self._free = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        width = len(self.feature_names)
+        old = self.size
+        matrix = np.zeros((capacity, width), dtype=np.float32)
+        columns = {
+            "prices": np.zeros(capacity, dtype=np.float32),
+            "ratings": np.zeros(capacity, dtype=np.float32),
+            "capacities": np.ones(capacity, dtype=np.float32),
+            "scores": np.zeros(capacity, dtype=np.float32),
+            "city_codes": np.full(capacity, -1, dtype=np.int32),
+            "lats": np.full(capacity, np.nan, dtype=np.float32),
+            "lngs": np.full(capacity, np.nan, dtype=np.float32),
+            "amenity_masks": np.zeros(capacity, dtype=np.uint16),
+            "live": np.zeros(capacity, dtype=bool),
+        }
+        if old:
+            matrix[:old] = self.matrix[:old]
+            for name, column in columns.items():
+                column[:old] = getattr(self, name)[:old]
+        self.matrix = matrix
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self.allocated = capacity
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _city_code(self, city: str):
+        code = self._city_codes.get(city)
+        if code is None:
+            code = len(self.cities)
+            self.cities.append(city)
+            self._city_codes[city] = code
+        return code
+
+    def encode(self, doc: dict, out: np.ndarray):
+        """Write one document's features into a matrix row and return its amenity mask"""
+        return self.schema.encode(doc, out)
+
+    def upsert(self, docs: list):
+        """Insert or update documents in place and return their row numbers"""
+        rows = np.empty(len(docs), dtype=np.int64)
+        for i, doc in enumerate(docs):
+            doc_id = str(doc.get("_id", f"demo-{self.size}"))
+            row = self.rows.get(doc_id)
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    if self.size == self.allocated:
+                        self._allocate(self.allocated * 2)
+                    row = self.size
+                    self.size += 1
+                    self.ids.append(None)
+                    self.records.append(None)
+                self.rows[doc_id] = row
+                self.ids[row] = doc_id
+
+            self.amenity_masks[row] = self.encode(doc, self.matrix[row])
+            self.prices[row] = to_float(doc.get("price", doc.get("Price")))
+            self.ratings[row] = to_float(doc.get("rating"))
+            self.capacities[row] = to_float(doc.get("capacity"), 1.0)
+            city = doc.get("city") or doc.get("location") or ""
+            self.city_codes[row] = self._city_code(str(city).strip().lower())
+            self.lats[row], self.lngs[row] = parse_coordinates(doc) or (math.nan, math.nan)
+            self.live[row] = True
+
+            record = {c: doc[c] for c in self.result_columns if c in doc}
+            record["_id"] = doc_id
+            self.records[row] = record
+            rows[i] = row
+
+        # Amenity feature columns straight from the masks, one pass for the whole batch
+        self.schema.fill_amenities(self.matrix, rows, self.amenity_masks[rows])
+        return rows
+
+    def delete(self, doc_id: str):
+        """Remove a document, leaving its row free for reuse"""
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self.live[row] = False
+        self.records[row] = None
+        self.ids[row] = None
+        self._free.append(row)
+        return True
+
+    def mask(self, city_key: str = None, max_budget: float = None):
+        """Boolean mask over the used rows for live properties in a city and budget"""
+        mask = self.live[:self.size].copy()
+        if city_key is not None:
+            code = self._city_codes.get(city_key, -2)
+            mask &= self.city_codes[:self.size] == code
+        if max_budget is not None:
+            mask &= self.prices[:self.size] <= max_budget
+        return mask
+
+    def mask_rows(self, rows, city_key: str = None, max_budget: float = None):
+        """Same filter as mask(), evaluated for the given rows only"""
+        mask = self.live[rows].copy()
+        if city_key is not None:
+            mask &= self.city_codes[rows] == self._city_codes.get(city_key, -2)
+        if max_budget is not None:
+            mask &= self.prices[rows] <= max_budget
+        return mask
+
+    def fallback_scores(self, rows):
+        """Score rows without a model: rating (70%) + capacity (30%)"""
+        return self.ratings[rows] * 0.7 + (self.capacities[rows] / 10) * 0.3
+
+    def result(self, row: int):
+        """Response record for a row, including its score"""
+        record = dict(self.records[row])
+        record["score"] = float(self.scores[row])
+        return record
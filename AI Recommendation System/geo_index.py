@@ -0,0 +1,118 @@
+"""
+Grid index over property coordinates for "near me" retrieval.
+
+Properties carry ``latitude``/``longitude`` (as in the backend's Property
+model). Rows with coordinates are bucketed into square grid cells
+``cell_km`` wide. A radius query visits only the cells overlapping the
+circle's bounding box and checks their rows with the haversine distance,
+so its cost follows the number of properties nearby rather than the size
+of the catalog. Rows are moved between cells as their properties change,
+so the index never needs a rebuild.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+# Coordinate fields, first present pair wins
+COORDINATE_FIELDS = (("latitude", "longitude"), ("lat", "lng"))
+
+
+def parse_coordinates(doc: dict):
+    """``(lat, lng)`` of a document, or None when it has no valid coordinates"""
+    for lat_field, lng_field in COORDINATE_FIELDS:
+        lat, lng = doc.get(lat_field), doc.get(lng_field)
+        if lat is None or lng is None:
+            continue
+        try:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            return None
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+        return None
+    return None
+
+
+def haversine_km(lat: float, lng: float, lats, lngs):
+    """Great-circle distances from one point to arrays of points"""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats.astype(np.float64)), np.radians(lngs.astype(np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """Rows of a feature store bucketed by grid cell"""
+
+    def __init__(self, store, cell_km: float = 5.0):
+        self.store = store
+        self.cell = cell_km / KM_PER_DEGREE
+        self._cells = {}
+        self._cell_of = {}
+
+        # Bulk build: bucket every live row with coordinates in one vectorized pass
+        rows = np.flatnonzero(store.live[:store.size])
+        rows = rows[~(np.isnan(store.lats[rows]) | np.isnan(store.lngs[rows]))]
+        if not len(rows):
+            return
+        i = np.floor(store.lats[rows].astype(np.float64) / self.cell).astype(np.int64)
+        j = np.floor(store.lngs[rows].astype(np.float64) / self.cell).astype(np.int64)
+        order = np.argsort((i << 32) | (j & 0xFFFFFFFF), kind="stable")
+        rows, i, j = rows[order], i[order], j[order]
+        starts = np.flatnonzero(np.r_[True, (i[1:] != i[:-1]) | (j[1:] != j[:-1])])
+        for start, end in zip(starts.tolist(), np.r_[starts[1:], len(rows)].tolist()):
+            key = (int(i[start]), int(j[start]))
+            members = rows[start:end].tolist()
+            self._cells[key] = set(members)
+            self._cell_of.update(dict.fromkeys(members, key))
+
+    def _key(self, lat: float, lng: float):
+        return int(math.floor(lat / self.cell)), int(math.floor(lng / self.cell))
+
+    def update(self, rows):
+        """Index rows after their coordinates were (re)written"""
+        store = self.store
+        for row in np.asarray(rows).tolist():
+            self.remove(row)
+            lat, lng = float(store.lats[row]), float(store.lngs[row])
+            if store.live[row] and not (math.isnan(lat) or math.isnan(lng)):
+                key = self._key(lat, lng)
+                self._cells.setdefault(key, set()).add(row)
+                self._cell_of[row] = key
+
+    def remove(self, row: int):
+        key = self._cell_of.pop(row, None)
+        if key is not None:
+            cell = self._cells[key]
+            cell.discard(row)
+            if not cell:
+                del self._cells[key]
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def query(self, lat: float, lng: float, radius_km: float):
+        """``(rows, distances_km)`` of the indexed rows within radius_km, nearest first"""
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        i0, j0 = self._key(lat - dlat, lng - dlng)
+        i1, j1 = self._key(lat + dlat, lng + dlng)
+
+        if (i1 - i0 + 1) * (j1 - j0 + 1) <= len(self._cells):
+            cells = (self._cells.get((i, j)) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+        else:
+            # A box wider than the populated area: walk the populated cells instead
+            cells = (rows for (i, j), rows in self._cells.items() if i0 <= i <= i1 and j0 <= j <= j1)
+        candidates = [row for cell in cells if cell for row in cell]
+
+        rows = np.array(candidates, dtype=np.int64)
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float64)
+        distances = haversine_km(lat, lng, self.store.lats[rows], self.store.lngs[rows])
+        near = distances <= radius_km
+        rows, distances = rows[near], distances[near]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
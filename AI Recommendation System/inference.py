@@ -0,0 +1,192 @@
+"""
+Dedicated executor for CPU-bound model inference.
+
+Scoring runs on its own bounded thread pool so the event loop keeps serving
+other requests while the model predicts. Work beyond the pool's capacity
+waits in a bounded queue; once that is full new work is rejected with
+``Overloaded`` instead of piling up behind a slow request.
+
+Predictions coming from concurrent pool workers are gathered by a
+``MicroBatcher`` into one ``model.predict`` call per micro-batch, so many
+small city-scoped requests don't each pay the model's per-call overhead.
+"""
+import asyncio
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+BATCH_ROWS_BUCKETS = [16, 64, 256, 1024, 4096, 16384, 65536]
+QUEUE_WAIT_BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1]
+
+
+class Overloaded(Exception):
+    """Raised when the inference queue is full"""
+
+
+class InferenceExecutor:
+    """Bounded thread pool with queue-depth backpressure"""
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool, raising Overloaded when the queue is full"""
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"Inference queue full ({self.pending} pending)")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args))
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+_STOP = object()
+
+
+class _Pending:
+    __slots__ = ("X", "future", "enqueued")
+
+    def __init__(self, X):
+        self.X = X
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Gather concurrent predict calls into micro-batches.
+
+    Callers block in ``predict(X)`` while a background thread collects work
+    until ``max_batch`` rows are queued or ``max_wait`` seconds have passed
+    since the first request of the batch, runs ``fn`` once on the stacked
+    matrix and hands every caller its slice of the result. A request larger
+    than ``max_batch`` runs as a batch of its own.
+    """
+
+    def __init__(self, fn, max_batch: int = 4096, max_wait: float = 0.002):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.failed = 0
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.batch_rows = Histogram(BATCH_ROWS_BUCKETS)
+        self.queue_wait = Histogram(QUEUE_WAIT_BUCKETS)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        """Score X as part of the next micro-batch, blocking until it is done"""
+        if len(X) == 0:
+            return self.fn(X)
+        pending = _Pending(X)
+        self._ensure_started().put(pending)
+        return pending.future.result()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                # Each thread drains its own queue, so close() never strands work
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._loop, args=(self._queue,), name="inference-batcher", daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def _loop(self, work: queue.Queue):
+        carry = None
+        while True:
+            first = carry if carry is not None else work.get()
+            carry = None
+            if first is _STOP:
+                return
+
+            batch, rows = [first], len(first.X)
+            deadline = time.perf_counter() + self.max_wait
+            while rows < self.max_batch:
+                try:
+                    item = work.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP or rows + len(item.X) > self.max_batch:
+                    # The stop marker or an overflowing request opens the next round
+                    carry = item
+                    break
+                batch.append(item)
+                rows += len(item.X)
+
+            self._run(batch, rows)
+
+    def _run(self, batch: list, rows: int):
+        started = time.perf_counter()
+        for item in batch:
+            self.queue_wait.observe(started - item.enqueued)
+        self.batch_size.observe(len(batch))
+        self.batch_rows.observe(rows)
+        self.batches += 1
+
+        try:
+            X = batch[0].X if len(batch) == 1 else np.concatenate([item.X for item in batch])
+            y = np.asarray(self.fn(X))
+        except Exception as e:
+            self.failed += 1
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        offset = 0
+        for item in batch:
+            item.future.set_result(y[offset:offset + len(item.X)])
+            offset += len(item.X)
+
+    def close(self):
+        """Stop the batching thread once queued work has been scored"""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread = None
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_size.stats(),
+            "batch_rows": self.batch_rows.stats(),
+            "queue_wait_seconds": self.queue_wait.stats(),
+        }
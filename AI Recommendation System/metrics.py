@@ -0,0 +1,217 @@
+"""
+Lightweight metric primitives for the recommendation server.
+
+Counters, histograms and stats gauges register with the module-level
+``REGISTRY``, which renders them in the Prometheus text exposition format
+for ``/metrics``. ``span(stage)`` times one stage of the hot path into the
+shared ``webgi_stage_duration_seconds`` histogram.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+STAGE_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+def _format_value(value: float):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = ""):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative bucket histogram with a running sum and count"""
+
+    def __init__(self, buckets: list):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations <= bound) pairs ending with +Inf"""
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + [float("inf")], counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": {("+Inf" if b == float("inf") else str(b)): n for b, n in self.cumulative()},
+        }
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values"""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class HistogramFamily:
+    """Histograms sharing a name and buckets, one per combination of label values"""
+
+    def __init__(self, name: str, help: str, buckets: list, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def attach(self, histogram: Histogram, *values):
+        """Export an existing histogram under these label values"""
+        with self._lock:
+            self._children[values] = histogram
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for labels, child in children:
+            for bound, count in child.cumulative():
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{suffix} {child.count}")
+        return lines
+
+
+class StatsGauge:
+    """Numeric fields of a ``stats()`` dict exported as ``<prefix>_<field>`` gauges"""
+
+    def __init__(self, prefix: str, stats):
+        self.prefix = prefix
+        self.stats = stats
+
+    def render(self):
+        lines = []
+        for key, value in self.stats().items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {self.prefix}_{key} gauge")
+                lines.append(f"{self.prefix}_{key} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """Ordered set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, key: str, metric):
+        """Add a metric, replacing one registered under the same key"""
+        with self._lock:
+            self._metrics[key] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()):
+        return self.register(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, buckets: list, labelnames: tuple = ()):
+        return self.register(name, HistogramFamily(name, help, buckets, labelnames))
+
+    def stats_gauge(self, prefix: str, stats):
+        return self.register(prefix, StatsGauge(prefix, stats))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def process_memory(pid="self"):
+    """Resident memory of a process split into shared and private bytes (Linux)"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                fields["Rss"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return {}
+
+    return {
+        "rss_bytes": fields.get("Rss", 0),
+        "pss_bytes": fields.get("Pss", 0),
+        "shared_bytes": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private_bytes": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "webgi_stage_duration_seconds", "Time spent in each stage of the scoring path", STAGE_BUCKETS, ("stage",)
+)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block into the stage duration histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
@@ -1,14 +1,34 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 import os
-import json
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from functools import lru_cache
 from dotenv import load_dotenv
-from pymongo import MongoClient
+import httpx
 import logging
 import numpy as np
+import warnings
+from feature_store import FALLBACK_FEATURES, RESULT_COLUMNS, FeatureStore
+from score_cache import ScoredCatalogCache, normalize_city, ALL_CITIES
+from query_planner import QueryPlanner, ensure_indexes
+from compiled_model import CompiledModel
+from inference import InferenceExecutor, MicroBatcher, Overloaded
+from singleflight import SingleFlight
+from persistence import CatalogSnapshot, SnapshotFile
+from backend import BackendCatalog, CircuitBreaker
+from archive import SnapshotArchive
+from metrics import REGISTRY, process_memory, span
+from shared_catalog import SharedCatalogReader
+from personalize import PreferenceProfile, preference_adjuster
+from startup import Readiness, retry
+from model_registry import DEFAULT_VERSION, ModelRegistry
+from responses import encode_json, encoded_response
+from admission import AdmissionController, ConcurrencyLimit, RateLimiter
 
 load_dotenv()
 
@@ -18,75 +38,498 @@ logger = logging.getLogger(__name__)
 
 # Create recommendations directory
 RECOMMENDATIONS_DIR = "recommendations"
+CATALOG_SNAPSHOT_FILE = "catalog_snapshot.json"  # last good catalog, not a saved recommendation
 os.makedirs(RECOMMENDATIONS_DIR, exist_ok=True)
 
+# Bursts of saves within this window collapse into one write of recommendations.json
+RECOMMENDATIONS_WRITE_DELAY = float(os.getenv("RECOMMENDATIONS_WRITE_DELAY", 0.25))
+
+# Saved snapshots live in one SQLite database; 0 disables a retention limit
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(RECOMMENDATIONS_DIR, "archive.db"))
+ARCHIVE_MAX_AGE_DAYS = float(os.getenv("ARCHIVE_MAX_AGE_DAYS", 0))
+ARCHIVE_MAX_SNAPSHOTS = int(os.getenv("ARCHIVE_MAX_SNAPSHOTS", 0))
+
 # Cache settings
-CACHE_SIZE = 128
-CACHE_TTL = 3600  # 1 hour
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", 128))  # cities kept resident
+CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))  # 1 hour, full reload after this
+CACHE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", 200000))
+CACHE_POLL_INTERVAL = int(os.getenv("CACHE_POLL_INTERVAL", 30))  # updatedAt polling without change streams
+# Deletes leave nothing to poll for: every Nth poll diffs the cached ids against MongoDB's (0 = off),
+# so without a change stream a deleted property is served for at most CACHE_POLL_INTERVAL * N seconds
+CACHE_ID_SWEEP_POLLS = int(os.getenv("CACHE_ID_SWEEP_POLLS", 10))
+
+# Serve a published catalog memory-mapped from this directory: set by serve.py for its
+# workers, or pointed at the output of batch_score.py to serve precomputed rankings
+SHARED_CATALOG_DIR = os.getenv("SHARED_CATALOG_DIR")
+
+# Maximum properties fetched per catalog load (0 = no limit)
+CATALOG_LIMIT = int(os.getenv("CATALOG_LIMIT", 0))
+
+# Pagination and NDJSON streaming of the ranked catalog
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 500
+
+# Ranking responses: compressed above this size, cacheable by browsers and CDNs for RESPONSE_MAX_AGE seconds
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+RESPONSE_MAX_AGE = int(os.getenv("RESPONSE_MAX_AGE", 0))  # 0: always revalidate with the ETag
+
+# Express backend used when MongoDB is unavailable
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5000/api/rentals")
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", 2))
+# Consecutive failures before the backend is left alone for BACKEND_RESET_TIMEOUT seconds
+BACKEND_FAILURE_THRESHOLD = int(os.getenv("BACKEND_FAILURE_THRESHOLD", 5))
+BACKEND_RESET_TIMEOUT = float(os.getenv("BACKEND_RESET_TIMEOUT", 30))
+
+# "More like this" switches from exact search to HNSW (if hnswlib is installed) above this many properties
+SIMILAR_HNSW_MIN_ROWS = int(os.getenv("SIMILAR_HNSW_MIN_ROWS", 50000))
+
+# Location queries (/recommend?lat=&lng=): search radius, distance decay and its share of the score
+GEO_RADIUS_KM = float(os.getenv("GEO_RADIUS_KM", 10))
+GEO_MAX_RADIUS_KM = float(os.getenv("GEO_MAX_RADIUS_KM", 100))
+GEO_DECAY_KM = float(os.getenv("GEO_DECAY_KM", 5))
+GEO_WEIGHT = float(os.getenv("GEO_WEIGHT", 0.3))
+GEO_CELL_KM = float(os.getenv("GEO_CELL_KM", 5))  # grid cell size of the spatial index
+
+# Admission control on the scoring endpoints: a token bucket per client (opt-in, off at RATE_LIMIT_RPS=0),
+# a concurrency limit per route, and degraded top-K answers past DEGRADE_AT of the inference queue
+ADMISSION_ROUTES = ("/recommend", "/recommend/personalized", "/similar")
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", 0))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))
+# Comma separated X-API-Key values that get a bucket of their own; other clients are keyed by address
+RATE_LIMIT_API_KEYS = [key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()]
+# Proxies in front of the server that append to X-Forwarded-For (1 behind Render's); clients are keyed
+# by the entry that many hops from the right. 0 keys them by the connecting address
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))
+ROUTE_CONCURRENCY = int(os.getenv("ROUTE_CONCURRENCY", 32))
+ROUTE_MAX_WAITING = int(os.getenv("ROUTE_MAX_WAITING", 64))
+ROUTE_MAX_WAIT = float(os.getenv("ROUTE_MAX_WAIT", 2))  # seconds a queued request waits for a slot
+DEGRADE_AT = float(os.getenv("DEGRADE_AT", 0.75))
+# Comma separated origins allowed by CORS
+CORS_ORIGINS = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()]
+
+# Startup work runs in the background; failed steps are retried with exponential backoff
+STARTUP_RETRY_BASE = float(os.getenv("STARTUP_RETRY_BASE", 0.5))
+STARTUP_RETRY_MAX = float(os.getenv("STARTUP_RETRY_MAX", 30))
+MODEL_LOAD_ATTEMPTS = int(os.getenv("MODEL_LOAD_ATTEMPTS", 5))  # then the fallback formula is used
+MONGO_STARTUP_WAIT = float(os.getenv("MONGO_STARTUP_WAIT", 5))  # before warming the cache from fallback data
+
+# Model inference runs on its own bounded pool; excess work is shed with a 503
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", min(4, os.cpu_count() or 1)))
+INFERENCE_QUEUE = int(os.getenv("INFERENCE_QUEUE", 64))
+
+# Concurrent predictions are gathered into micro-batches of at most this many rows
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 4096))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 2))
 
-app = FastAPI()
+# Which data source served each catalog load and which path scored each batch
+DATA_SOURCE = REGISTRY.counter("webgi_catalog_loads_total", "Catalog loads by data source", ("source",))
+SCORING_PATH = REGISTRY.counter("webgi_scoring_calls_total", "Scoring calls by model or fallback formula", ("path",))
+SCORED_ROWS = REGISTRY.counter("webgi_scored_rows_total", "Properties scored by model or fallback formula", ("path",))
+ADMISSION = REGISTRY.counter(
+    "webgi_admission_total", "Admission decisions on the scoring endpoints", ("route", "decision")
+)
+RESPONSES = REGISTRY.counter("webgi_responses_total", "Encoded ranking responses by content coding", ("encoding",))
+RECOMMEND_REQUESTS = REGISTRY.counter("webgi_recommend_requests_total", "/recommend requests by response kind", ("kind",))
+
+# The model is fed plain float32 matrices in feature_names order
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the pooled backend client and start up in the background, release everything on shutdown"""
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=5,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+    )
+    startup = asyncio.create_task(start_up())
+    # With a shared catalog the publisher scores, so it is the one following MODEL_DIR
+    following = None
+    if MODEL_POLL_INTERVAL and not SHARED_CATALOG_DIR:
+        following = asyncio.create_task(follow_models(catalog_cache))
+
+    yield
+
+    startup.cancel()
+    if following is not None:
+        following.cancel()
+    models.shutdown()
+    catalog_cache.stop()
+    recommendations_file.close()
+    catalog_snapshot.close()
+    await http_client.aclose()
+    inference.shutdown()
+    if batcher is not None:
+        batcher.close()
+    if mongo_client is not None:
+        await mongo_client.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Rate-limit clients and bound per-route concurrency in front of the scoring endpoints"""
+    route, limit = admission.route(request.url.path)
+    if limit is None:
+        return await call_next(request)
+
+    wait = admission.limiter.acquire(admission.client_key(request))
+    if wait:
+        ADMISSION.inc(route, "rate_limited")
+        return JSONResponse(
+            status_code=429,
+            content={"error": "Rate limit exceeded", "recommendations": [], "total_properties_scored": 0},
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    try:
+        await limit.acquire()
+    except Overloaded as e:
+        ADMISSION.inc(route, "shed")
+        logger.warning(f"⚠️ Shedding {route}: {e}")
+        return overloaded_response(e)
+
+    ADMISSION.inc(route, "admitted")
+    try:
+        response = await call_next(request)
+    except BaseException:
+        limit.release()
+        raise
+    # The body (NDJSON streams included) is produced after call_next returns; hold the slot until it is sent
+    response.body_iterator = release_after(response.body_iterator, limit)
+    return response
+
+async def release_after(body, limit):
+    """Pass a response body through, releasing the route slot once it is sent or abandoned"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        limit.release()
 
-# Add CORS middleware
+# Add CORS middleware (added last, so it also wraps the admission control answers)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Load model & features with fallback
+# Model & features, loaded by load_model_files(); the fallback formula scores until then
 model = None
-feature_names = ["Rating", "Capacity", "wifi", "ac", "parking"]
+model_checked = False
+feature_names = list(FALLBACK_FEATURES)
+batcher = None  # one model.predict per micro-batch of concurrent scoring work
 
-try:
-    if os.path.exists("best_model.pkl"):
-        try:
-            import joblib
-            model = joblib.load("best_model.pkl")
-            feature_names = joblib.load("feature_names.pkl")
-            logger.info("✅ Model loaded successfully")
-        except Exception as model_error:
-            logger.warning(f"⚠️ Error loading model files: {model_error}")
-            logger.warning("Using fallback scoring formula")
-            model = None
-    else:
-        logger.warning("⚠️ Model files not found - using fallback scoring formula")
-        model = None
-except Exception as e:
-    logger.error(f"❌ Unexpected error in model loading: {e}")
-    model = None
+# Compiled NumPy scorer exported from best_model.pkl, re-exported when the pickle is newer
+COMPILED_MODEL_PATH = os.getenv("COMPILED_MODEL_PATH", "best_model.npz")
+
+# Training label encodings and field overrides, written by feature_schema.py
+FEATURE_SCHEMA_PATH = os.getenv("FEATURE_SCHEMA_PATH", "feature_schema.json")
+
+# Retrained models ship as version directories under MODEL_DIR and are swapped in without a
+# restart; the CURRENT and SHADOW files there are polled every MODEL_POLL_INTERVAL seconds (0 = off)
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", 30))
+MODEL_SHADOW_SAMPLE = float(os.getenv("MODEL_SHADOW_SAMPLE", 0.1))  # fraction of scoring calls a shadow re-scores
+MODEL_SHADOW_MAX_ROWS = int(os.getenv("MODEL_SHADOW_MAX_ROWS", 2048))  # rows sampled per shadowed call
+MODEL_MAX_REGRESSION = float(os.getenv("MODEL_MAX_REGRESSION", 0.1))  # holdout MAE increase a new model may have
+
+models = ModelRegistry(
+    MODEL_DIR,
+    {"model": "best_model.pkl", "features": "feature_names.pkl", "artifact": COMPILED_MODEL_PATH,
+     "schema": FEATURE_SCHEMA_PATH, "holdout": "holdout.npz"},
+    FALLBACK_FEATURES, MODEL_SHADOW_SAMPLE, MODEL_SHADOW_MAX_ROWS, MODEL_MAX_REGRESSION
+)
+feature_schema = models.active.schema
+model_swap = asyncio.Lock()  # one swap (load, activate, re-score) at a time
 
-# MongoDB Atlas connection
+# MongoDB Atlas connection, opened by connect_mongo()
 MONGO_URI = os.getenv("MONGO_URI")
+# serve.py creates the indexes once in its master and turns this off for the processes it forks
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") != "0"
+mongo_client = None
+collection = None  # set by connect_mongo() once the server answers a ping
+http_client = None  # pooled client for the Express fallback, opened by lifespan()
 if not MONGO_URI:
     logger.warning("⚠️ MONGO_URI not found in environment, will use demo data")
-    collection = None
-else:
-    logger.info(f"🔌 Attempting MongoDB connection with URI: {MONGO_URI[:50]}...")
+
+# Traffic is routed here once the model is settled and the catalog cache is warm
+readiness = Readiness("model", "catalog")
+
+def use_model(version):
+    """Score with version from now on, through a micro-batcher of its own"""
+    global model, feature_names, feature_schema, batcher, query_planner
+    if version.model is not None and version.batcher is None:
+        version.batcher = MicroBatcher(version.model.predict, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000)
+        for name, histogram, help in (
+            ("webgi_inference_batch_size", version.batcher.batch_size, "Predict calls per micro-batch"),
+            ("webgi_inference_batch_rows", version.batcher.batch_rows, "Rows per micro-batch"),
+            ("webgi_inference_queue_wait_seconds", version.batcher.queue_wait, "Time predict calls waited for their batch"),
+        ):
+            REGISTRY.histogram(name, help, histogram.buckets).attach(histogram)
+    if version.schema.unencoded:
+        logger.warning(f"⚠️ No training encodings for {', '.join(version.schema.unencoded)} in model "
+                       f"{version.name} - these features are left to the model's imputer")
+
+    models.activate(version)
+    model, feature_names, feature_schema, batcher = version.model, version.feature_names, version.schema, version.batcher
+    query_planner = QueryPlanner(feature_schema.source_fields, RESULT_COLUMNS)
+
+def load_model_files():
+    """Load the model version CURRENT names (else best_model.pkl and its compiled artifact), once"""
+    global model_checked
+    if model_checked:
+        return model
+
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connectTimeoutMS=5000)
-        # Try to ping the server with timeout
-        try:
-            client.admin.command("ping", maxTimeMS=5000)
-            db = client["webgi"]
-            collection = db["properties"]
-            logger.info("✅ MongoDB connection successful")
-        except Exception as ping_error:
-            logger.warning(f"⚠️ MongoDB ping failed: {ping_error} - using demo mode")
-            collection = None
-    except Exception as e:
-        logger.error(f"❌ MongoDB connection failed: {e}")
-        collection = None
+        version = models.load(models.pointer("CURRENT") or DEFAULT_VERSION)
+    except FileNotFoundError:
+        logger.warning("⚠️ Model files not found - using fallback scoring formula")
+    else:
+        use_model(version)
+        logger.info(f"✅ Model loaded successfully ({version.name})")
+    model_checked = True
+    return model
+
+async def swap_model(version, cache=None):
+    """Serve version and re-score the resident catalogs with it; the old scores serve until then"""
+    cache = cache if cache is not None else catalog_cache
+    use_model(version)
+    rebuilt = await cache.rebuild()
+    models.retire()
+    logger.info(f"🔁 Serving model {version.name} ({rebuilt} cached catalogs re-scored)")
+    return rebuilt
+
+async def activate_model(name: str, cache=None, force: bool = False):
+    """Load and validate a model version off the event loop, then swap it in"""
+    async with model_swap:
+        version = await asyncio.to_thread(models.load, name, force)
+        rebuilt = await swap_model(version, cache)
+        return version, rebuilt
+
+async def shadow_model(name: str):
+    """Load a candidate and re-score a sample of the scoring calls with it"""
+    # Shadows are compared against the active model rather than gated on the holdout
+    version = await asyncio.to_thread(models.load, name, True)
+    models.stage_shadow(version)
+    return version
+
+async def follow_models(cache):
+    """Swap in or shadow the versions CURRENT and SHADOW in MODEL_DIR name whenever they change"""
+    attempted = {}
+    while True:
+        await asyncio.sleep(MODEL_POLL_INTERVAL)
+        for pointer in ("CURRENT", "SHADOW"):
+            name = models.pointer(pointer)
+            loaded = models.active if pointer == "CURRENT" else models.shadow
+            if name is None or (loaded is not None and loaded.name == name) or attempted.get(pointer) == name:
+                continue
+            # A version that fails to load is not retried until the pointer changes
+            attempted[pointer] = name
+            try:
+                if pointer == "CURRENT":
+                    await activate_model(name, cache)
+                else:
+                    await shadow_model(name)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not load model {name} named by {pointer}: {e}")
+
+async def connect_mongo(cache):
+    """Ping MongoDB with backoff until it answers, then move the cache over from fallback data"""
+    global mongo_client, collection
+    from pymongo import AsyncMongoClient
+
+    if mongo_client is None:
+        logger.info(f"🔌 Attempting MongoDB connection with URI: {MONGO_URI[:50]}...")
+        mongo_client = AsyncMongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connectTimeoutMS=5000)
+
+    await retry(
+        lambda: mongo_client.admin.command("ping", maxTimeMS=5000),
+        "MongoDB ping", base=STARTUP_RETRY_BASE, cap=STARTUP_RETRY_MAX
+    )
+    collection = mongo_client["webgi"]["properties"]
+    logger.info("✅ MongoDB connection successful")
+    if MONGO_ENSURE_INDEXES:
+        await ensure_indexes(collection)
+    # Anything cached so far came from the backend or demo data
+    cache.invalidate()
+    cache.watch(collection)
+
+async def create_indexes():
+    """Ensure the property indexes over a short-lived connection, for a launcher about to fork"""
+    from pymongo import AsyncMongoClient
+
+    client = AsyncMongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connectTimeoutMS=5000)
+    try:
+        await client.admin.command("ping", maxTimeMS=5000)
+        await ensure_indexes(client["webgi"]["properties"])
+    finally:
+        await client.close()
+
+async def warm_catalog():
+    """Load and score the all-cities catalog, retrying until one is available"""
+    async def load():
+        entry = await catalog_cache.get(ALL_CITIES)
+        if entry is None:
+            raise RuntimeError("no catalog available yet")
+        return entry
+
+    entry = await retry(
+        load, "Catalog warm-up", base=STARTUP_RETRY_BASE, cap=STARTUP_RETRY_MAX,
+        on_error=lambda e: readiness.failed("catalog", e)
+    )
+    logger.info(f"🔥 Catalog cache warm ({len(entry)} properties, {entry.mode})")
+    return entry
+
+async def start_up():
+    """Load the model, connect MongoDB and warm the catalog cache without blocking the server"""
+    try:
+        await retry(
+            lambda: asyncio.to_thread(load_model_files), "Model load", MODEL_LOAD_ATTEMPTS,
+            STARTUP_RETRY_BASE, STARTUP_RETRY_MAX, on_error=lambda e: readiness.failed("model", e)
+        )
+    except Exception as model_error:
+        logger.warning(f"⚠️ Error loading model files: {model_error}")
+        logger.warning("Using fallback scoring formula")
+    # Drop anything scored before the model was ready
+    catalog_cache.invalidate()
+    models.retire()
+    readiness.done("model", type(model).__name__ if model is not None else "fallback formula")
+
+    mongo = asyncio.create_task(connect_mongo(catalog_cache)) if MONGO_URI else None
+    if mongo is not None:
+        await asyncio.wait({mongo}, timeout=MONGO_STARTUP_WAIT)
+        if not mongo.done():
+            logger.warning("⚠️ MongoDB not reachable yet - serving fallback data until it is")
+
+    try:
+        # Older per-file snapshots are folded into the archive once
+        skip = ("recommendations.json", CATALOG_SNAPSHOT_FILE)
+        await asyncio.to_thread(archive.import_directory, RECOMMENDATIONS_DIR, skip)
+        # Earlier versions imported the catalog snapshot as if it were a saved recommendation
+        await asyncio.to_thread(archive.delete, CATALOG_SNAPSHOT_FILE)
+
+        entry = await warm_catalog()
+        readiness.done("catalog", entry.mode)
+
+        if mongo is not None and not mongo.done():
+            await mongo
+            entry = await warm_catalog()
+            readiness.done("catalog", entry.mode)
+    finally:
+        if mongo is not None:
+            mongo.cancel()
 
 @app.get("/health")
 def health():
+    """Liveness and diagnostics; answers as soon as the process is up"""
     return {
         "status": "ok",
+        "ready": readiness.stats(),
         "model_loaded": model is not None,
-        "mongo_connected": collection is not None
+        "model_compiled": isinstance(model, CompiledModel),
+        "model_version": models.active.name,
+        "pid": os.getpid(),
+        "memory": process_memory(),
+        "mongo_connected": collection is not None,
+        "cache": catalog_cache.stats(),
+        "inference": inference.stats(),
+        "batching": batcher.stats() if batcher is not None else None,
+        "persistence": recommendations_file.stats(),
+        "backend": backend.stats(),
+        "catalog_snapshot": catalog_snapshot.stats(),
+        "archive": archive.stats(),
+        "coalescing": {
+            "recommend": recommend_flight.stats(),
+            "catalog_loads": catalog_cache.loads.stats()
+        }
+    }
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once the model is settled and the catalog cache is warm, 503 until then"""
+    state = readiness.stats()
+    state["mongo_connected"] = collection is not None
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of stage timings, counters and component stats"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def models_not_owned():
+    """Error for model changes sent to a worker that only reads the published catalog"""
+    if SHARED_CATALOG_DIR:
+        return {"error": "This worker serves a published catalog; swap models through CURRENT/SHADOW in MODEL_DIR"}
+    return None
+
+@app.get("/models")
+def list_models():
+    """Active, previous and shadow model versions and the versions found in MODEL_DIR"""
+    return {
+        **models.stats(),
+        "active_model": models.active.stats(),
+        "shadow_model": models.shadow.stats() if models.shadow is not None else None,
+        "versions": models.versions()
+    }
+
+@app.post("/models/activate")
+async def activate_model_endpoint(version: str, force: bool = False):
+    """Load, validate and swap in a model version without dropping the warm catalogs"""
+    error = models_not_owned()
+    if error:
+        return error
+    try:
+        loaded, rebuilt = await activate_model(version, force=force)
+        return {"active": loaded.stats(), "catalogs_rescored": rebuilt}
+    except Exception as e:
+        logger.error(f"❌ Error activating model {version}: {e}")
+        return {"error": str(e), "active": models.active.name}
+
+@app.post("/models/shadow")
+async def shadow_model_endpoint(version: str):
+    """Shadow-score a sample of the scoring calls with a candidate model version"""
+    error = models_not_owned()
+    if error:
+        return error
+    try:
+        loaded = await shadow_model(version)
+        return {"shadow": loaded.stats(), "sample": models.shadow_sample}
+    except Exception as e:
+        logger.error(f"❌ Error loading shadow model {version}: {e}")
+        return {"error": str(e)}
+
+@app.get("/models/shadow")
+def shadow_comparison():
+    """Latency and score drift of the shadow model against the active one"""
+    comparison = models.comparison
+    return {
+        "shadow": models.shadow.name if models.shadow is not None else None,
+        "comparison": comparison.stats() if comparison is not None else None
     }
 
+@app.delete("/models/shadow")
+def stop_shadow():
+    """Stop shadow scoring; the last comparison stays readable"""
+    models.stop_shadow()
+    return {"shadow": None}
+
+@app.post("/models/promote")
+async def promote_shadow():
+    """Swap the shadow model in as the active one"""
+    error = models_not_owned()
+    if error:
+        return error
+    async with model_swap:
+        version = models.shadow
+        if version is None:
+            return {"error": "No shadow model to promote"}
+        rebuilt = await swap_model(version)
+    return {"active": version.stats(), "catalogs_rescored": rebuilt, "comparison": models.comparison.stats()}
+
 @app.get("/test-demo-data")
 def test_demo_data():
     """Test endpoint to check demo data generation"""
@@ -210,214 +653,381 @@ def get_demo_data(city: str):
     return demo_properties.get(city, demo_properties.get("Bangalore", []))
 
 @app.get("/recommend")
-def recommend(
+async def recommend(
+    request: Request,
     city: str = "all",
     max_budget: int = 500000,
-    top_k: int = 100
+    top_k: int = 100,
+    cursor: str = None,
+    page_size: int = None,
+    stream: bool = False,
+    lat: float = None,
+    lng: float = None,
+    radius_km: float = None
 ):
-    """Score ALL properties in MongoDB using best_model.pkl, save to recommendations.json"""
+    """Serve properties scored with best_model.pkl from the catalog cache, save the top K to recommendations.json
+
+    By default only the top K are returned. Pass ``page_size`` (and the returned
+    ``next_cursor``) to page through the whole ranking, or ``stream=true`` to
+    receive every scored property as NDJSON. Pass ``lat`` and ``lng`` for the
+    top K within ``radius_km``, ranked with a distance decay.
+    """
     try:
-        # Handle "all cities" case
-        if city.lower() in ["all", "all cities", "*", ""]:
-            city_display = "All Cities"
-            logger.info(f"🎯 Scoring ALL properties from ALL CITIES (budget: ₹{max_budget}, top_k: {top_k}) using best_model.pkl")
-            city_filter = {}  # No filter = get all cities
-        else:
-            city_display = city
-            logger.info(f"🎯 Scoring ALL properties in {city} (budget: ₹{max_budget}, top_k: {top_k}) using best_model.pkl")
-            city_filter = {"city": {"$regex": city, "$options": "i"}}
-        
-        # Fetch ALL properties from MongoDB
-        if collection is not None:
-            try:
-                logger.info(f"🔍 Querying MongoDB with filter: {city_filter}")
-                raw_data = list(collection.find(city_filter).limit(5000))
-                
-                logger.info(f"📊 Found {len(raw_data)} properties in MongoDB for: {city_display}")
-                
-                # Convert ObjectId to string immediately
-                for item in raw_data:
-                    if "_id" in item:
-                        item["_id"] = str(item["_id"])
-                
-                data = raw_data
-            except Exception as db_error:
-                logger.error(f"❌ Database error: {db_error}")
-                data = []
-        else:
-            logger.warning("⚠️ MongoDB not connected, trying Express backend API...")
-            data = []
-            
-            # Try to fetch from Express backend as fallback
-            try:
-                import requests
-                backend_url = "http://localhost:5000/api/rentals"
-                logger.info(f"📡 Attempting to fetch from backend: {backend_url}")
-                response = requests.get(backend_url, timeout=5)
-                
-                if response.status_code == 200:
-                    backend_data = response.json()
-                    rentals = backend_data.get("rentals", [])
-                    
-                    # Filter by city if needed
-                    if city_filter:
-                        import re
-                        city_pattern = city_filter["city"]["$regex"]
-                        rentals = [r for r in rentals if re.search(city_pattern, r.get("city", "") or r.get("location", ""), re.IGNORECASE)]
-                    
-                    # Convert to the expected format
-                    data = []
-                    for r in rentals:
-                        data.append({
-                            "_id": str(r.get("_id", "")),
-                            "name": r.get("name", ""),
-                            "price": r.get("price", 0),
-                            "rating": r.get("rating", 0),
-                            "capacity": r.get("capacity", 1),
-                            "amenities": r.get("amenities", {}),
-                            "city": r.get("location", ""),
-                            "location": r.get("location", ""),
-                            "property_type": r.get("property_type", ""),
-                            "images": r.get("images", [])
-                        })
-                    
-                    logger.info(f"✅ Fetched {len(data)} properties from Express backend")
-                else:
-                    logger.warning(f"⚠️ Backend returned status {response.status_code}")
-            except Exception as backend_error:
-                logger.warning(f"⚠️ Could not fetch from backend: {backend_error}")
-        
-        # Fallback to demo data if no data found
-        if len(data) == 0:
-            logger.info(f"📌 No data in MongoDB, generating demo data for: {city_display}")
-            if city.lower() in ["all", "all cities", "*", ""]:
-                # Demo data for all cities
-                logger.info("📝 Creating demo data for all cities")
-                demo_bangalore = get_demo_data("Bangalore")
-                demo_hyderabad = get_demo_data("Hyderabad")
-                demo_mumbai = get_demo_data("Mumbai")
-                
-                logger.info(f"   - Bangalore: {len(demo_bangalore)} properties")
-                logger.info(f"   - Hyderabad: {len(demo_hyderabad)} properties")
-                logger.info(f"   - Mumbai: {len(demo_mumbai)} properties")
-                
-                data = demo_bangalore + demo_hyderabad + demo_mumbai
-                logger.info(f"✅ Total demo data: {len(data)} properties")
-            else:
-                data = get_demo_data(city)
-                logger.info(f"✅ Generated {len(data)} demo properties for: {city}")
-
-        if len(data) == 0:
-            logger.warning(f"❌ No properties available for: {city_display}")
-            return {
-                "recommendations": [],
-                "all_scored_properties": [],
-                "total_properties_scored": 0,
-                "message": f"No properties found for: {city_display}",
-                "mode": "error"
-            }
+        city_key = normalize_city(city)
+        city_display = "All Cities" if city_key == ALL_CITIES else city
+        top_k = max(0, min(top_k, MAX_PAGE_SIZE))
+        logger.debug("🎯 Ranking properties in %s (budget: ₹%s, top_k: %s)", city_display, max_budget, top_k)
 
-        df = pd.DataFrame(data)
-        logger.info(f"📊 Processing {len(df)} properties for: {city_display}")
+        if lat is not None or lng is not None:
+            nearby = await recommend_nearby(city_key, city_display, max_budget, top_k, lat, lng, radius_km)
+            return respond(request, nearby)
 
-        # Use the pre-trained model if available
-        if model is not None:
-            try:
-                logger.info("🤖 Using best_model.pkl for scoring")
-                # Preprocess data for model
-                df_processed = preprocess(df.copy())
-                
-                # Select features for model
-                available_features = [f for f in feature_names if f in df_processed.columns]
-                if available_features:
-                    X = df_processed.copy()
-                    # Ensure all required features exist
-                    for feat in feature_names:
-                        if feat not in X.columns:
-                            X[feat] = 0
-                    
-                    X = X[feature_names]
-                    df["score"] = model.predict(X)
-                    logger.info(f"✅ Model scoring completed - scores range: {df['score'].min():.2f} to {df['score'].max():.2f}")
-                else:
-                    # Fallback to simple scoring
-                    logger.warning("No matching features found, using fallback scoring")
-                    df["score"] = (
-                        df.get("rating", pd.Series([0]*len(df))).fillna(0) * 0.7 +
-                        (df.get("capacity", pd.Series([1]*len(df))).fillna(1) / 10) * 0.3
+        if not stream and cursor is None and page_size is None:
+            # Under pressure, answer from an already scored catalog rather than queue more scoring
+            degraded = degraded_top_k(city_key, max_budget, top_k) if admission.degraded() else None
+            if degraded is not None:
+                RECOMMEND_REQUESTS.inc("degraded")
+                return respond(request, degraded)
+
+            RECOMMEND_REQUESTS.inc("top_k")
+            # Identical concurrent top-K requests share one computation
+            with span("recommend"):
+                try:
+                    result = await recommend_flight.do(
+                        (city_key, max_budget, top_k), rank_top_k, city_key, city_display, max_budget, top_k
                     )
-            except Exception as e:
-                logger.warning(f"Model scoring failed: {e}, using fallback scoring")
-                # Fallback to simple scoring
-                df["score"] = (
-                    df.get("rating", pd.Series([0]*len(df))).fillna(0) * 0.7 +
-                    (df.get("capacity", pd.Series([1]*len(df))).fillna(1) / 10) * 0.3
-                )
-        else:
-            logger.info("📉 Model not loaded, using fallback scoring formula")
-            # Fallback scoring: rating (70%) + capacity (30%)
-            df["score"] = (
-                df.get("rating", pd.Series([0]*len(df))).fillna(0) * 0.7 +
-                (df.get("capacity", pd.Series([1]*len(df))).fillna(1) / 10) * 0.3
-            )
+                except Overloaded:
+                    result = degraded_top_k(city_key, max_budget, top_k)
+                    if result is None:
+                        raise
+                    RECOMMEND_REQUESTS.inc("degraded")
+            return respond(request, result)
 
-        # Sort by score descending
-        df_sorted = df.sort_values("score", ascending=False)
-        
-        # Ensure _id exists for all results
-        if "_id" not in df_sorted.columns:
-            df_sorted = df_sorted.copy()
-            df_sorted["_id"] = ["demo-" + str(i) for i in range(len(df_sorted))]
-        
-        # Select columns to include in results
-        available_cols = ["_id", "name", "price", "rating", "capacity", "amenities", "score", "city", "location"]
-        cols_to_select = [col for col in available_cols if col in df_sorted.columns]
-        
-        # Get ALL scored properties
-        all_scored_properties = df_sorted[cols_to_select].to_dict(orient="records")
-        
-        # Get top K for quick access
-        top_recommendations = df_sorted.head(top_k)[cols_to_select].to_dict(orient="records")
-        
-        logger.info(f"📝 Prepared {len(all_scored_properties)} scored properties, top {len(top_recommendations)} recommendations")
-        logger.info(f"   - Top recommendations sample: {[r.get('name', 'N/A') for r in top_recommendations[:2]]}")
-        logger.info(f"   - All scored properties count: {len(all_scored_properties)}")
-        
-        # Save ALL scored properties to recommendations.json
-        saved_file = save_all_scored_properties(city_display, max_budget, top_recommendations, all_scored_properties)
+        # Scored catalogs stay resident; only changed properties get re-scored
+        entry = await catalog_cache.get(city_key)
+        if entry is None:
+            return no_properties_response(city_display)
 
-        logger.info(f"✅ Saved {len(all_scored_properties)} scored properties to recommendations.json")
-        
-        response_data = {
-            "recommendations": top_recommendations,
-            "all_scored_properties": all_scored_properties,
-            "total_properties_scored": len(all_scored_properties),
-            "mode": "mongodb" if collection is not None else "demo",
-            "saved": saved_file is not None,
-            "saved_file": saved_file.split('\\')[-1] if saved_file else None
-        }
-        
-        logger.info(f"✅ Response prepared with {len(response_data['all_scored_properties'])} properties")
-        return response_data
+        if stream:
+            RECOMMEND_REQUESTS.inc("stream")
+            return StreamingResponse(
+                stream_scored_properties(entry.snapshot(city_key, max_budget)),
+                media_type="application/x-ndjson"
+            )
+
+        RECOMMEND_REQUESTS.inc("page")
+        page_size = max(1, min(page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        total, page, next_cursor = entry.page(city_key, max_budget, cursor, page_size)
+        return respond(request, {
+            "recommendations": page,
+            "total_properties_scored": total,
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+            "mode": entry.mode
+        })
     
+    except ValueError as e:
+        return {"error": str(e), "recommendations": [], "total_properties_scored": 0}
+    except Overloaded as e:
+        RECOMMEND_REQUESTS.inc("shed")
+        logger.warning(f"⚠️ Shedding /recommend: {e}")
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"❌ Error in recommend: {e}", exc_info=True)
         return {
             "error": str(e),
             "recommendations": [],
-            "all_scored_properties": [],
             "total_properties_scored": 0
         }
 
+async def recommend_nearby(city_key, city_display, max_budget, top_k, lat, lng, radius_km):
+    """Top K properties around a point, retrieved from the entry's spatial index"""
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat and lng must both be given as valid coordinates")
+    radius_km = min(radius_km or GEO_RADIUS_KM, GEO_MAX_RADIUS_KM)
+    if radius_km <= 0:
+        raise ValueError("radius_km must be positive")
+    RECOMMEND_REQUESTS.inc("nearby")
+
+    entry = await catalog_cache.get(city_key)
+    if entry is None:
+        return no_properties_response(city_display)
+
+    total, recommendations = entry.nearby(
+        lat, lng, radius_km, city_key, max_budget, max(0, min(top_k, MAX_PAGE_SIZE)),
+        GEO_DECAY_KM, GEO_WEIGHT, GEO_CELL_KM
+    )
+    return {
+        "recommendations": recommendations,
+        "total_properties_scored": total,
+        "radius_km": radius_km,
+        "mode": entry.mode
+    }
+
+@app.post("/recommend/personalized")
+async def recommend_personalized(request: Request, profile: PreferenceProfile, city: str = "all", top_k: int = 20):
+    """Re-rank the cached model scores of a city with a user's preference profile"""
+    try:
+        city_key = normalize_city(city)
+        city_display = "All Cities" if city_key == ALL_CITIES else city
+        RECOMMEND_REQUESTS.inc("personalized")
+
+        entry = await catalog_cache.get(city_key)
+        if entry is None:
+            return no_properties_response(city_display)
+
+        total, recommendations = entry.rerank(
+            city_key, profile.max_budget, max(0, min(top_k, MAX_PAGE_SIZE)), preference_adjuster(profile)
+        )
+        return respond(request, {
+            "recommendations": recommendations,
+            "total_properties_scored": total,
+            "mode": entry.mode,
+            "personalized": True
+        })
+    except ValueError as e:
+        return {"error": str(e), "recommendations": [], "total_properties_scored": 0}
+    except Overloaded as e:
+        RECOMMEND_REQUESTS.inc("shed")
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"❌ Error in personalized recommend: {e}", exc_info=True)
+        return {"error": str(e), "recommendations": [], "total_properties_scored": 0}
+
+@app.get("/similar/{property_id}")
+async def similar_properties(
+    request: Request, property_id: str, k: int = 10, same_city: bool = True, max_budget: float = None
+):
+    """Properties nearest to property_id by amenities, price, rating, capacity and views"""
+    try:
+        entry = await catalog_cache.get(ALL_CITIES)
+        found = entry.similar(
+            property_id, max(1, min(k, MAX_PAGE_SIZE)), same_city, max_budget, SIMILAR_HNSW_MIN_ROWS
+        ) if entry is not None else None
+        if found is None:
+            return {"error": "Property not found", "similar": []}
+
+        record, neighbours = found
+        return respond(request, {
+            "property": record,
+            "similar": neighbours,
+            "index": entry.similarity.kind,
+            "mode": entry.mode
+        })
+    except Exception as e:
+        logger.error(f"❌ Error in similar: {e}", exc_info=True)
+        return {"error": str(e), "similar": []}
+
+async def rank_top_k(city_key: str, city_display: str, max_budget: int, top_k: int):
+    """Select the top K from the cached catalog and save them to recommendations.json"""
+    # Scored catalogs stay resident; only changed properties get re-scored
+    entry = await catalog_cache.get(city_key)
+    if entry is None:
+        return no_properties_response(city_display)
+
+    # Slice the cached feature store by city and budget masks, select only the top K
+    total, top_recommendations = entry.top(city_key, max_budget, top_k)
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📝 Selected top {len(top_recommendations)} of {total} scored properties")
+        logger.debug(f"   - Top recommendations sample: {[r.get('name', 'N/A') for r in top_recommendations[:2]]}")
+    
+    # Queue the top recommendations for the background recommendations.json writer
+    saved_file = save_top_recommendations(city_display, max_budget, top_recommendations, total)
+    
+    return {
+        "recommendations": top_recommendations,
+        "total_properties_scored": total,
+        "mode": entry.mode,
+        "saved": saved_file is not None,
+        "saved_file": saved_file.split('\\')[-1] if saved_file else None
+    }
+
+def degraded_top_k(city_key: str, max_budget: int, top_k: int):
+    """Top K of a resident catalog as last scored, without loading, refreshing or saving; None if none is resident"""
+    entry = catalog_cache.peek(city_key)
+    if entry is None:
+        return None
+    total, top_recommendations = entry.top(city_key, max_budget, top_k)
+    return {
+        "recommendations": top_recommendations,
+        "total_properties_scored": total,
+        "mode": entry.mode,
+        "degraded": True
+    }
+
+def respond(request: Request, data: dict):
+    """Encode a ranking once with ETag revalidation and negotiated compression"""
+    # "No properties" answers are not worth caching downstream
+    max_age = RESPONSE_MAX_AGE if data.get("mode") != "error" else 0
+    response = encoded_response(request, data, max_age, RESPONSE_COMPRESS_MIN_BYTES)
+    encoding = "not_modified" if response.status_code == 304 else response.headers.get("content-encoding", "identity")
+    RESPONSES.inc(encoding)
+    return response
+
+def no_properties_response(city_display: str):
+    logger.warning(f"❌ No properties available for: {city_display}")
+    return {
+        "recommendations": [],
+        "total_properties_scored": 0,
+        "message": f"No properties found for: {city_display}",
+        "mode": "error"
+    }
+
+def overloaded_response(error: Exception):
+    """503 telling the client to retry once the inference queue drains"""
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(error), "recommendations": [], "total_properties_scored": 0},
+        headers={"Retry-After": "1"}
+    )
+
+def stream_scored_properties(snapshot: list):
+    """Yield scored properties as NDJSON lines in chunks"""
+    lines = []
+    for record, score in snapshot:
+        lines.append(encode_json({**record, "score": score}))
+        if len(lines) == STREAM_CHUNK_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+async def fetch_properties(city_key: str):
+    """Fetch raw properties for a city from MongoDB, the Express backend, the last snapshot or demo data"""
+    data = []
+    mode = "demo"
+    mongo_ok = False
+
+    # Fetch ALL properties from MongoDB
+    if collection is not None:
+        try:
+            plan = query_planner.plan(city_key)
+            logger.debug("🔍 Querying MongoDB with %s", plan)
+            with span("mongo_fetch"):
+                raw_data = await plan.fetch(collection, limit=CATALOG_LIMIT)
+            
+            logger.debug("📊 Found %d properties in MongoDB for: %s", len(raw_data), city_key)
+            
+            # Convert ObjectId to string immediately
+            for item in raw_data:
+                if "_id" in item:
+                    item["_id"] = str(item["_id"])
+            
+            data = raw_data
+            mode = "mongodb"
+            mongo_ok = True
+        except Exception as db_error:
+            logger.error(f"❌ Database error: {db_error}")
+            data = []
+
+    if not mongo_ok:
+        logger.warning("⚠️ MongoDB not connected, trying Express backend API...")
+        
+        # Pooled, conditional and circuit-broken; serves its last good payload while the backend is down
+        try:
+            with span("backend_fetch"):
+                data = await backend.fetch(http_client, city_key)
+            mode = "backend"
+            logger.debug("✅ Fetched %d properties from Express backend", len(data))
+        except Exception as backend_error:
+            logger.warning(f"⚠️ Could not fetch from backend: {backend_error}")
+
+    if data and city_key == ALL_CITIES:
+        catalog_snapshot.save(mode, data)
+    elif not data and not mongo_ok:
+        # Both live sources are down: serve the last good catalog from disk
+        try:
+            saved = catalog_snapshot.load(city_key)
+        except Exception as snapshot_error:
+            logger.warning(f"⚠️ Could not read catalog snapshot: {snapshot_error}")
+            saved = None
+        if saved is not None and saved[1]:
+            data, mode = saved[1], "snapshot"
+            logger.warning(f"📦 Serving {len(data)} properties from the {saved[0]} catalog snapshot")
+    
+    # Fallback to demo data if no data found
+    if len(data) == 0:
+        logger.debug("📌 No data in MongoDB, generating demo data for: %s", city_key)
+        mode = "demo"
+        if city_key == ALL_CITIES:
+            # Demo data for all cities
+            data = get_demo_data("Bangalore") + get_demo_data("Hyderabad") + get_demo_data("Mumbai")
+            logger.debug("✅ Total demo data: %d properties", len(data))
+        else:
+            data = get_demo_data(city_key.title())
+            logger.debug("✅ Generated %d demo properties for: %s", len(data), city_key)
+
+    DATA_SOURCE.inc(mode)
+    return mode, data
+
+async def fetch_changed_properties(city_key: str, since):
+    """Fetch properties of a city updated after the given watermark"""
+    if collection is None:
+        return []
+
+    with span("mongo_fetch"):
+        changed = await query_planner.plan(city_key, since=since).fetch(collection)
+    for item in changed:
+        item["_id"] = str(item["_id"])
+    return changed
+
+async def fetch_property_ids(city_key: str):
+    """Ids of every property of a city still in the database, None without a connection"""
+    if collection is None:
+        return None
+
+    with span("mongo_fetch"):
+        docs = await query_planner.id_plan(city_key).fetch(collection)
+    return {str(doc["_id"]) for doc in docs}
+
+def new_feature_store():
+    """Create an empty feature store laid out for the active model version"""
+    version = models.active
+    return FeatureStore(version.feature_names, RESULT_COLUMNS, schema=version.schema)
+
+def score_rows(store: FeatureStore, rows):
+    """Score feature store rows with the model version they were encoded for (or the fallback formula)"""
+    version = models.scorer_for(store.schema)
+    if version.model is not None:
+        try:
+            # The matrix is already in the version's feature_names order, no reindexing needed
+            X = store.matrix[rows]
+            started = time.perf_counter()
+            with span("predict"):
+                scores = version.predict(X)
+            served_seconds = time.perf_counter() - started
+            SCORING_PATH.inc("model")
+            SCORED_ROWS.inc("model", amount=len(rows))
+            models.shadow_score(version, store.feature_names, X, scores, served_seconds)
+            return scores
+        except Exception as e:
+            logger.warning(f"Model scoring failed: {e}, using fallback scoring")
+
+    # Fallback scoring: rating (70%) + capacity (30%)
+    SCORING_PATH.inc("fallback")
+    SCORED_ROWS.inc("fallback", amount=len(rows))
+    with span("predict"):
+        scores = store.fallback_scores(rows)
+    models.shadow_score(version, store.feature_names, store.matrix[rows], scores)
+    return scores
+
+def score_documents(docs: list):
+    """Encode and score documents into a fresh feature store"""
+    store = new_feature_store()
+    with span("preprocess"):
+        rows = store.upsert(docs)
+    store.scores[rows] = score_rows(store, rows)
+    return store, rows
+
 @app.get("/get-recommendations-json")
 def get_recommendations_json():
     """Get the last saved recommendations from JSON file"""
     try:
-        filepath = os.path.join(RECOMMENDATIONS_DIR, "recommendations.json")
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-            return data
+        # Cached bytes, re-read only when the file changed on disk
+        payload = recommendations_file.read()
+        if payload is not None:
+            return Response(content=payload, media_type="application/json")
         else:
             return {"recommendations": [], "message": "No recommendations saved yet"}
     except Exception as e:
@@ -425,36 +1035,23 @@ def get_recommendations_json():
         return {"error": str(e), "recommendations": []}
 
 @app.get("/save-recommendations-endpoint")
-def save_recommendations_endpoint(city: str, max_budget: int):
+async def save_recommendations_endpoint(city: str, max_budget: int):
     """Manually save recommendations to JSON file"""
     try:
-        # Get recommendations from database
+        # Get recommendations from database, city and budget filtered by MongoDB
         if collection is not None:
-            data_list = list(collection.find({"City": city}, {"_id": 0}).limit(100))
+            plan = query_planner.plan(normalize_city(city), max_budget)
+            data_list = await plan.fetch(collection, limit=100)
         else:
-            data_list = get_demo_data(city)
+            data_list = [p for p in get_demo_data(city) if p.get("price", 0) <= max_budget]
         
         if not data_list:
-            return {"error": "No data found"}
-        
-        df = pd.DataFrame(data_list)
-        df = df[df["Price"] <= max_budget] if "Price" in df.columns else df
-        
-        if df.empty:
             return {"error": "No properties match budget"}
         
-        df = preprocess(df)
-        try:
-            X = df[feature_names]
-            df["score"] = model.predict(X)
-        except:
-            df["score"] = df.get("Rating", 0) * 0.6 + (df.get("Capacity", 1) / 10) * 0.4
-        
-        df = df.sort_values("score", ascending=False)
-        recommendations = df.head(5).to_dict(orient="records")
+        store, rows = await inference.run(score_documents, data_list)
         
-        filename = f"{city}_{max_budget}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        filepath = os.path.join(RECOMMENDATIONS_DIR, filename)
+        best = rows[np.argsort(-store.scores[rows], kind="stable")[:5]]
+        recommendations = [store.result(row) for row in best]
         
         data = {
             "city": city,
@@ -463,62 +1060,88 @@ def save_recommendations_endpoint(city: str, max_budget: int):
             "recommendations": recommendations
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
+        filename = await asyncio.to_thread(archive.save, city, max_budget, data)
         
-        logger.info(f"Saved recommendations to {filepath}")
-        return {"success": True, "file": filename, "path": filepath}
+        logger.info(f"Saved recommendations as {filename} in {ARCHIVE_PATH}")
+        return {"success": True, "file": filename, "path": ARCHIVE_PATH}
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error saving recommendations: {e}")
         return {"error": str(e)}
 
 @app.get("/saved-recommendations")
-def get_saved_recommendations():
-    """Get list of all saved recommendation files"""
+def get_saved_recommendations(
+    city: str = None,
+    min_budget: float = None,
+    max_budget: float = None,
+    since: datetime = None,
+    until: datetime = None,
+    limit: int = 50,
+    offset: int = 0
+):
+    """List saved recommendation snapshots, newest first, filtered by city, budget and time range"""
     try:
-        files = []
-        if os.path.exists(RECOMMENDATIONS_DIR):
-            for file in os.listdir(RECOMMENDATIONS_DIR):
-                if file.endswith('.json'):
-                    filepath = os.path.join(RECOMMENDATIONS_DIR, file)
-                    files.append({
-                        "filename": file,
-                        "path": filepath,
-                        "size": os.path.getsize(filepath),
-                        "modified": datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-                    })
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        total, files = archive.list(
+            city=city,
+            min_budget=min_budget,
+            max_budget=max_budget,
+            since=since.timestamp() if since else None,
+            until=until.timestamp() if until else None,
+            limit=limit,
+            offset=offset
+        )
         
-        return {"files": sorted(files, key=lambda x: x['modified'], reverse=True)}
+        return {
+            "files": files,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + limit if offset + limit < total else None
+        }
     except Exception as e:
         logger.error(f"Error retrieving saved recommendations: {e}")
         return {"error": str(e)}
 
 @app.get("/load-recommendation/{filename}")
 def load_recommendation(filename: str):
-    """Load a specific saved recommendation file"""
+    """Load a specific saved recommendation snapshot"""
     try:
-        filepath = os.path.join(RECOMMENDATIONS_DIR, filename)
-        
-        # Security check - prevent directory traversal
-        if not os.path.abspath(filepath).startswith(os.path.abspath(RECOMMENDATIONS_DIR)):
-            return {"error": "Invalid file path"}
-        
-        if not os.path.exists(filepath):
+        payload = archive.get(filename)
+        if payload is None:
             return {"error": "File not found"}
         
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-        
-        return data
+        return Response(content=payload, media_type="application/json")
     except Exception as e:
         logger.error(f"Error loading recommendation: {e}")
         return {"error": str(e)}
 
+@app.get("/property-score-history/{property_id}")
+def property_score_history(property_id: str, limit: int = 100):
+    """Scores and ranks a property received across saved snapshots, newest first"""
+    try:
+        history = archive.history(property_id, max(1, min(limit, MAX_PAGE_SIZE)))
+        return {"property_id": property_id, "history": history}
+    except Exception as e:
+        logger.error(f"Error loading score history: {e}")
+        return {"error": str(e), "history": []}
+
+@app.post("/compact-saved-recommendations")
+def compact_saved_recommendations():
+    """Apply the archive retention policy and reclaim space"""
+    try:
+        return {"success": True, "expired": archive.compact()}
+    except Exception as e:
+        logger.error(f"Error compacting archive: {e}")
+        return {"error": str(e)}
+
 def save_recommendations(city: str, max_budget: int, recommendations: list):
     """Utility function to save recommendations to a single JSON file (overwrites previous)"""
     try:
         # Always save to the same file: recommendations.json
-        filepath = os.path.join(RECOMMENDATIONS_DIR, "recommendations.json")
+        filepath = recommendations_file.path
         
         data = {
             "city": city,
@@ -527,10 +1150,7 @@ def save_recommendations(city: str, max_budget: int, recommendations: list):
             "recommendations": recommendations
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        logger.info(f"Saved recommendations to {filepath}")
+        recommendations_file.submit(data)
         return filepath
     except Exception as e:
         logger.error(f"Error saving recommendations: {e}")
@@ -540,7 +1160,7 @@ def save_recommendations_with_scores(city: str, max_budget: int, top_recommendat
     """Save both top recommendations and all scored properties to recommendations.json"""
     try:
         # Always save to the same file: recommendations.json
-        filepath = os.path.join(RECOMMENDATIONS_DIR, "recommendations.json")
+        filepath = recommendations_file.path
         
         data = {
             "city": city,
@@ -552,75 +1172,107 @@ def save_recommendations_with_scores(city: str, max_budget: int, top_recommendat
             "top_k": len(top_recommendations)
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        logger.info(f"Saved {len(all_scored_properties)} scored properties and {len(top_recommendations)} top recommendations to {filepath}")
+        recommendations_file.submit(data)
         return filepath
     except Exception as e:
         logger.error(f"Error saving recommendations with scores: {e}")
         return None
 
-def save_all_scored_properties(city: str, max_budget: int, recommendations: list, all_scored_properties: list):
-    """Save all scored properties to recommendations.json with proper structure"""
+def save_top_recommendations(city: str, max_budget: int, recommendations: list, total_scored: int):
+    """Save the top recommendations and scoring stats to recommendations.json"""
     try:
-        filepath = os.path.join(RECOMMENDATIONS_DIR, "recommendations.json")
+        filepath = recommendations_file.path
         
         data = {
             "city": city,
             "max_budget": max_budget,
             "timestamp": datetime.now().isoformat(),
             "recommendations": recommendations,
-            "all_scored_properties": all_scored_properties,
             "stats": {
-                "total_properties_scored": len(all_scored_properties),
-                "top_recommendations": len(recommendations),
-                "total_returned": len(recommendations) + len(all_scored_properties)
+                "total_properties_scored": total_scored,
+                "top_recommendations": len(recommendations)
             }
         }
         
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        logger.info(f"✅ Saved ALL {len(all_scored_properties)} scored properties to recommendations.json")
+        recommendations_file.submit(data)
         return filepath
     except Exception as e:
-        logger.error(f"Error saving all scored properties: {e}")
+        logger.error(f"Error saving top recommendations: {e}")
         return None
 
-def preprocess(df):
-    """Preprocess dataframe for model prediction"""
-    # Drop non-numeric columns
-    df = df.drop(['City', 'Name'], axis=1, errors='ignore')
-    
-    # Fill missing values
-    numeric_cols = ["Rating", "Views", "Vacancies", "Capacity", "Price"]
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-    
-    if "Capacity" in df.columns:
-        df.loc[df["Capacity"] == 0, "Capacity"] = 1
-
-    # Amenity encoding
-    amenities = [
-        "wifi", "food", "ac", "parking",
-        "laundry", "power_backup", "security", "cctv"
-    ]
-
-    if "Amenities" in df.columns:
-        for amenity in amenities:
-            df[amenity] = df["Amenities"].astype(str).str.lower().str.contains(amenity, na=False).astype(int)
-    else:
-        for amenity in amenities:
-            df[amenity] = 0
+# Coalescing background writer and cached reader for recommendations.json
+recommendations_file = SnapshotFile(os.path.join(RECOMMENDATIONS_DIR, "recommendations.json"), RECOMMENDATIONS_WRITE_DELAY)
+
+# Last good all-cities catalog, served when MongoDB and the Express backend are both down
+catalog_snapshot = CatalogSnapshot(os.path.join(RECOMMENDATIONS_DIR, CATALOG_SNAPSHOT_FILE))
+
+# Express fallback for when MongoDB is unavailable
+backend = BackendCatalog(BACKEND_URL, BACKEND_TIMEOUT, CircuitBreaker(BACKEND_FAILURE_THRESHOLD, BACKEND_RESET_TIMEOUT))
+
+# Indexed store of snapshots saved by /save-recommendations-endpoint
+archive = SnapshotArchive(ARCHIVE_PATH, ARCHIVE_MAX_AGE_DAYS, ARCHIVE_MAX_SNAPSHOTS)
+
+# Bounded executor keeping model inference off the event loop
+inference = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE)
 
-    # Ensure all feature columns exist
-    for col in feature_names:
-        if col not in df.columns:
-            df[col] = 0
+# Rate limits per client and concurrency limits per route; pressure is the inference queue's fill level
+admission = AdmissionController(
+    {route: ConcurrencyLimit(ROUTE_CONCURRENCY, ROUTE_MAX_WAITING, ROUTE_MAX_WAIT) for route in ADMISSION_ROUTES},
+    RateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST, RATE_LIMIT_MAX_CLIENTS),
+    lambda: inference.pending / (inference.max_workers + inference.max_queue),
+    DEGRADE_AT,
+    api_keys=RATE_LIMIT_API_KEYS,
+    trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES
+)
+if RATE_LIMIT_RPS and not RATE_LIMIT_TRUSTED_PROXIES:
+    logger.warning("⚠️ Rate limiting by connecting address; behind a proxy every user shares its bucket "
+                   "unless RATE_LIMIT_TRUSTED_PROXIES is set")
+
+# Concurrent identical /recommend calls share one in-flight computation
+recommend_flight = SingleFlight()
+
+# Index-friendly MongoDB queries projecting only scoring and response fields
+query_planner = QueryPlanner(feature_schema.source_fields, RESULT_COLUMNS)
+
+def new_catalog_cache(**overrides):
+    """Resident scored catalogs, refreshed from the change stream or updatedAt polling"""
+    options = dict(
+        loader=fetch_properties,
+        fetch_changed=fetch_changed_properties,
+        fetch_ids=fetch_property_ids,
+        id_sweep_polls=CACHE_ID_SWEEP_POLLS,
+        # Loads that finish after a model swap are redone rather than cached
+        model_version=lambda: models.active,
+        new_store=new_feature_store,
+        predict=score_rows,
+        run=inference.run,
+        max_entries=CACHE_SIZE,
+        max_rows=CACHE_MAX_ROWS,
+        ttl=CACHE_TTL,
+        poll_interval=CACHE_POLL_INTERVAL,
+        derive_from_all=CATALOG_LIMIT == 0,
+    )
+    options.update(overrides)
+    return ScoredCatalogCache(**options)
+
+if SHARED_CATALOG_DIR:
+    catalog_cache = SharedCatalogReader(SHARED_CATALOG_DIR)
+else:
+    catalog_cache = new_catalog_cache()
 
-    return df
+# Component counters exported as gauges on /metrics
+REGISTRY.stats_gauge("webgi_cache", catalog_cache.stats)
+REGISTRY.stats_gauge("webgi_inference", inference.stats)
+REGISTRY.stats_gauge("webgi_admission", admission.stats)
+REGISTRY.stats_gauge("webgi_recommend_coalescing", recommend_flight.stats)
+REGISTRY.stats_gauge("webgi_catalog_load_coalescing", lambda: catalog_cache.loads.stats())
+REGISTRY.stats_gauge("webgi_persistence", recommendations_file.stats)
+REGISTRY.stats_gauge("webgi_backend", backend.stats)
+REGISTRY.stats_gauge("webgi_catalog_snapshot", catalog_snapshot.stats)
+REGISTRY.stats_gauge("webgi_process_memory", process_memory)
+REGISTRY.stats_gauge("webgi_startup", readiness.stats)
+REGISTRY.stats_gauge("webgi_model_registry", models.stats)
+REGISTRY.stats_gauge("webgi_model_shadow", lambda: models.comparison.stats() if models.comparison is not None else {})
 
 if __name__ == "__main__":
     import uvicorn
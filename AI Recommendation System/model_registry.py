@@ -0,0 +1,391 @@
+"""
+Versioned models swapped in without a restart.
+
+A model version is a directory under ``MODEL_DIR`` holding what the
+notebook exports: ``best_model.pkl`` with ``feature_names.pkl`` and/or the
+compiled ``best_model.npz``, plus optional ``feature_schema.json`` and a
+``holdout.npz`` sample (``X``, ``feature_names`` and optionally labels
+``y``). The files next to the server form the ``default`` version.
+
+``ModelRegistry`` loads a version off the event loop, validates it on its
+held-out sample (or a synthetic one) and makes it active by replacing a
+single reference. Scoring calls already running keep the version they
+started with, and feature stores encoded for the previous version keep
+being scored by it until their catalogs have been rebuilt.
+
+A candidate can be staged as a shadow instead: a sampled fraction of the
+scoring calls is re-scored with it on a background thread, and its latency
+and score drift against the active model are tracked until it is promoted.
+Sampled rows are the ones the active model scored, encoded with its schema,
+so a shadow must encode categories the way the active version does.
+
+The ``CURRENT`` and ``SHADOW`` files in ``MODEL_DIR`` name the versions to
+serve and to shadow, for deployments that swap models by writing files.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from compiled_model import load_model, parity_sample
+from feature_schema import CATEGORICAL, FeatureSchema
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = "default"
+FALLBACK_VERSION = "fallback"
+
+# File names inside a version directory
+ARTIFACTS = {
+    "model": "best_model.pkl",
+    "features": "feature_names.pkl",
+    "artifact": "best_model.npz",
+    "schema": "feature_schema.json",
+    "holdout": "holdout.npz",
+}
+
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+
+
+def align(X, names: list, target: list):
+    """Reorder X's columns from names into target order; absent features are NaN for the imputer"""
+    if list(names) == list(target):
+        return X
+    index = {name: j for j, name in enumerate(names)}
+    out = np.full((len(X), len(target)), np.nan, dtype=np.float32)
+    for j, name in enumerate(target):
+        if name in index:
+            out[:, j] = X[:, index[name]]
+    return out
+
+
+def encoding_conflicts(active: FeatureSchema, shadow: FeatureSchema):
+    """Categorical features whose active-schema codes would mean other classes to the shadow model"""
+    shared = set(active.feature_names) & set(shadow.feature_names) & set(CATEGORICAL)
+    # Extended encodings (extend_encodings) only append classes, so a shared prefix is compatible
+    return sorted(name for name in shared
+                  if active.encodings.get(name, []) != shadow.encodings.get(name, [])[:len(active.encodings.get(name, []))])
+
+
+def rank_correlation(a, b):
+    """Spearman correlation of two score vectors (ties broken by position), None if undefined"""
+    if len(a) < 2:
+        return None
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    if ra.std() == 0 or rb.std() == 0:
+        return None
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def compare(served, candidate):
+    """Score drift of candidate against served on the same rows"""
+    diff = np.asarray(candidate, dtype=np.float64) - np.asarray(served, dtype=np.float64)
+    return {
+        "mean_diff": float(diff.mean()) if len(diff) else 0.0,
+        "mean_abs_diff": float(np.abs(diff).mean()) if len(diff) else 0.0,
+        "max_abs_diff": float(np.abs(diff).max()) if len(diff) else 0.0,
+        "rank_correlation": rank_correlation(served, candidate),
+    }
+
+
+class ModelVersion:
+    """One loaded model with the feature schema its rows are encoded with"""
+
+    def __init__(self, name: str, model, feature_names: list, schema: FeatureSchema):
+        self.name = name
+        self.model = model  # None scores with the fallback formula
+        self.feature_names = list(feature_names)
+        self.schema = schema
+        self.batcher = None  # set by the server for the version it serves
+        self.validation = None
+        self.loaded_at = time.time()
+
+    def predict(self, X):
+        if self.batcher is not None:
+            return self.batcher.predict(X)
+        return self.model.predict(X)
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def stats(self):
+        return {
+            "version": self.name,
+            "model": type(self.model).__name__ if self.model is not None else "fallback formula",
+            "features": len(self.feature_names),
+            "unencoded": list(self.schema.unencoded),
+            "loaded_at": self.loaded_at,
+            "validation": self.validation,
+        }
+
+
+class ShadowComparison:
+    """Latency and score drift of a shadow model against the active one on the same rows"""
+
+    def __init__(self, active: str, shadow: str):
+        self.active = active
+        self.shadow = shadow
+        self.started = time.time()
+        self.calls = 0
+        self.rows = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self.active_seconds = Histogram(LATENCY_BUCKETS)
+        self.shadow_seconds = Histogram(LATENCY_BUCKETS)
+        self._sum = 0.0
+        self._abs = 0.0
+        self._max = 0.0
+        self._rank = 0.0
+        self._ranked = 0
+        self._lock = threading.Lock()
+
+    def record(self, served, candidate, active_seconds, shadow_seconds):
+        diff = candidate - served
+        rank = rank_correlation(served, candidate)
+        if active_seconds is not None:
+            self.active_seconds.observe(active_seconds)
+        self.shadow_seconds.observe(shadow_seconds)
+        with self._lock:
+            self.calls += 1
+            self.rows += len(diff)
+            self._sum += float(diff.sum())
+            self._abs += float(np.abs(diff).sum())
+            self._max = max(self._max, float(np.abs(diff).max()) if len(diff) else 0.0)
+            if rank is not None:
+                self._rank += rank
+                self._ranked += 1
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def failed(self, error: Exception):
+        with self._lock:
+            self.errors += 1
+            self.last_error = str(error)
+
+    def stats(self):
+        with self._lock:
+            rows = self.rows
+            stats = {
+                "active": self.active,
+                "shadow": self.shadow,
+                "started": self.started,
+                "calls": self.calls,
+                "rows": rows,
+                "skipped": self.skipped,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "mean_diff": round(self._sum / rows, 6) if rows else 0.0,
+                "mean_abs_diff": round(self._abs / rows, 6) if rows else 0.0,
+                "max_abs_diff": round(self._max, 6),
+                "rank_correlation": round(self._rank / self._ranked, 6) if self._ranked else None,
+            }
+        active, shadow = self.active_seconds.stats(), self.shadow_seconds.stats()
+        stats["latency"] = {"active": active, "shadow": shadow}
+        stats["latency_ratio"] = round(shadow["mean"] / active["mean"], 4) if active["mean"] else None
+        return stats
+
+
+class ModelRegistry:
+    """Active, previous and shadow model versions of one server process"""
+
+    def __init__(self, model_dir: str, defaults: dict, fallback_features: list, shadow_sample: float = 0.1,
+                 shadow_max_rows: int = 2048, max_regression: float = 0.1):
+        self.model_dir = model_dir
+        self.defaults = defaults
+        self.shadow_sample = shadow_sample
+        self.shadow_max_rows = shadow_max_rows
+        self.max_regression = max_regression
+        self.active = ModelVersion(FALLBACK_VERSION, None, fallback_features, FeatureSchema(fallback_features))
+        self.previous = None
+        self.shadow = None
+        self.comparison = None
+        self.swaps = 0
+        self.failed = 0
+        self.last_error = None
+        self._shadow_pool = ThreadPoolExecutor(1, thread_name_prefix="shadow-scoring")
+        self._shadow_slot = threading.Semaphore(1)
+        self._rng = np.random.default_rng()
+
+    def paths(self, name: str):
+        if name == DEFAULT_VERSION:
+            return self.defaults
+        directory = os.path.join(self.model_dir, name)
+        if name.startswith(".") or os.path.basename(name) != name or not os.path.isdir(directory):
+            raise FileNotFoundError(f"Unknown model version: {name}")
+        return {key: os.path.join(directory, filename) for key, filename in ARTIFACTS.items()}
+
+    def pointer(self, name: str):
+        """Version named by a pointer file (CURRENT or SHADOW) in the model directory, if any"""
+        try:
+            with open(os.path.join(self.model_dir, name)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self):
+        """Version directories that hold a model"""
+        try:
+            names = sorted(os.listdir(self.model_dir))
+        except FileNotFoundError:
+            names = []
+        found = [DEFAULT_VERSION]
+        for name in names:
+            directory = os.path.join(self.model_dir, name)
+            if any(os.path.exists(os.path.join(directory, ARTIFACTS[k])) for k in ("model", "artifact")):
+                found.append(name)
+        return found
+
+    def load(self, name: str, force: bool = False):
+        """Load and validate a version without touching the active one; raises if it is unusable"""
+        try:
+            paths = self.paths(name)
+            model, feature_names = load_model(paths["model"], paths["features"], paths["artifact"])
+            if model is None:
+                raise FileNotFoundError(f"No model files for version {name}")
+            version = ModelVersion(name, model, feature_names, FeatureSchema.load(paths["schema"], feature_names))
+            version.validation = self.validate(version, paths["holdout"], force)
+        except Exception as e:
+            self.failed += 1
+            self.last_error = f"{name}: {e}"
+            raise
+        logger.info(f"📦 Loaded model {name} ({type(model).__name__}, {len(feature_names)} features)")
+        return version
+
+    def validate(self, version: ModelVersion, holdout_path: str, force: bool = False):
+        """
+        Score the held-out sample (or a synthetic one) with the version.
+
+        Shapes and finiteness are always checked. With labelled holdout data
+        the version may not have a mean absolute error more than
+        ``max_regression`` (relative) worse than the active model's, unless
+        forced.
+        """
+        labels = None
+        if os.path.exists(holdout_path):
+            with np.load(holdout_path, allow_pickle=False) as data:
+                names = [str(f) for f in data["feature_names"]]
+                X = np.asarray(data["X"], dtype=np.float32)
+                labels = np.asarray(data["y"], dtype=np.float64) if "y" in data.files else None
+            sample = "holdout"
+        else:
+            names = version.feature_names
+            X = parity_sample(names)
+            sample = "synthetic"
+
+        started = time.perf_counter()
+        scores = np.asarray(version.model.predict(align(X, names, version.feature_names)), dtype=np.float64)
+        seconds = time.perf_counter() - started
+        if scores.shape != (len(X),):
+            raise ValueError(f"Model returned {scores.shape} predictions for {len(X)} rows")
+        if not np.isfinite(scores).all():
+            raise ValueError(f"Model returned {int((~np.isfinite(scores)).sum())} non-finite predictions")
+
+        result = {"sample": sample, "rows": len(X), "predict_seconds": round(seconds, 6),
+                  "mean_score": float(scores.mean())}
+        active = self.active
+        if active.model is not None:
+            served = np.asarray(active.model.predict(align(X, names, active.feature_names)), dtype=np.float64)
+            result["drift"] = compare(served, scores)
+            if labels is not None:
+                result["active_mae"] = float(np.abs(served - labels).mean())
+        if labels is not None:
+            result["mae"] = float(np.abs(scores - labels).mean())
+            baseline = result.get("active_mae")
+            if baseline is not None and result["mae"] > baseline * (1 + self.max_regression) and not force:
+                raise ValueError(f"Holdout MAE {result['mae']:.4f} is worse than the active model's {baseline:.4f}")
+        return result
+
+    def activate(self, version: ModelVersion):
+        """Make version the active model; the replaced one is kept for stores encoded with it"""
+        if self.previous is not None and self.previous is not self.active:
+            self.previous.close()
+        self.previous = self.active
+        self.active = version
+        if self.shadow is version:
+            self.shadow = None
+        elif self.shadow is not None and encoding_conflicts(version.schema, self.shadow.schema):
+            logger.warning(f"⚠️ Stopped shadowing {self.shadow.name}: its encodings differ from {version.name}'s")
+            self.shadow = None
+        self.swaps += 1
+
+    def retire(self):
+        """Release the previous version once nothing it encoded is resident any more"""
+        previous, self.previous = self.previous, None
+        if previous is not None and previous is not self.active:
+            previous.close()
+
+    def scorer_for(self, schema: FeatureSchema):
+        """The version a store encoded with schema must be scored by"""
+        previous = self.previous
+        if previous is not None and schema is previous.schema and schema is not self.active.schema:
+            return previous
+        return self.active
+
+    def stage_shadow(self, version: ModelVersion):
+        # Its scores would be computed on another version's category codes
+        conflicts = encoding_conflicts(self.active.schema, version.schema)
+        if conflicts:
+            raise ValueError(f"{version.name} encodes {', '.join(conflicts)} differently from the active "
+                             f"model {self.active.name}; validate it with /models/activate instead")
+        self.shadow = version
+        self.comparison = ShadowComparison(self.active.name, version.name)
+        logger.info(f"👥 Shadow scoring model {version.name} on {self.shadow_sample:.0%} of scoring calls")
+
+    def stop_shadow(self):
+        self.shadow = None
+
+    def shadow_score(self, version: ModelVersion, feature_names: list, X, served, served_seconds: float = None):
+        """
+        Re-score a sample of an active scoring call with the shadow model, off the caller's thread.
+
+        served_seconds is how long the serving call took; it is recorded pro rata for the sampled rows
+        as the active model's latency, so the active model never runs twice.
+        """
+        shadow, comparison = self.shadow, self.comparison
+        if shadow is None or version is not self.active or random.random() >= self.shadow_sample:
+            return
+        # One shadow call at a time; a slow candidate skips samples rather than queueing them
+        if not self._shadow_slot.acquire(blocking=False):
+            comparison.skip()
+            return
+        served = np.asarray(served, dtype=np.float64)
+        if len(X) > self.shadow_max_rows:
+            if served_seconds is not None:
+                served_seconds *= self.shadow_max_rows / len(X)
+            pick = self._rng.choice(len(X), self.shadow_max_rows, replace=False)
+            X, served = X[pick], served[pick]
+        self._shadow_pool.submit(self._shadow_run, shadow, comparison, feature_names, X, served, served_seconds)
+
+    def _shadow_run(self, shadow, comparison, feature_names, X, served, active_seconds):
+        try:
+            started = time.perf_counter()
+            candidate = np.asarray(shadow.model.predict(align(X, feature_names, shadow.feature_names)), dtype=np.float64)
+            comparison.record(served, candidate, active_seconds, time.perf_counter() - started)
+        except Exception as e:
+            comparison.failed(e)
+        finally:
+            self._shadow_slot.release()
+
+    def shutdown(self):
+        self._shadow_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "active": self.active.name,
+            "previous": self.previous.name if self.previous is not None else None,
+            "shadow": self.shadow.name if self.shadow is not None else None,
+            "shadow_sample": self.shadow_sample,
+            "swaps": self.swaps,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
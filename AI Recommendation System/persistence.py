@@ -0,0 +1,226 @@
+"""
+Background persistence for recommendations.json.
+
+Requests hand the latest snapshot to a ``SnapshotFile`` and return
+immediately. A writer thread waits briefly so bursts of requests collapse
+into one write, serializes compactly (orjson when installed, otherwise
+separator-free json) and replaces the file via a temp file and an atomic
+rename, so readers never see a half-written file. Reads are served from the
+cached bytes and only go back to disk when the file's stat signature
+changes. ``CatalogSnapshot`` uses the same writer to keep the last good
+property catalog on disk for when every live source is down.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from metrics import span
+from score_cache import ALL_CITIES, normalize_city
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(data) -> bytes:
+    """Compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+
+def loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def write_atomic(path: str, payload: bytes):
+    """Write payload to a temp file next to path, then rename it into place"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _signature(stat: os.stat_result):
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class SnapshotFile:
+    """Coalescing background writer and stat-validated cached reader for one file"""
+
+    def __init__(self, path: str, delay: float = 0.25):
+        self.path = path
+        self.delay = delay
+        self.submitted = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.reloads = 0
+        self.failed = 0
+        self._pending = None
+        self._writing = False
+        self._stopping = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._cached = None  # (signature, payload)
+
+    def submit(self, data: dict):
+        """Queue data as the next file contents, replacing any unwritten snapshot"""
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = data
+            self.submitted += 1
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._loop, name="snapshot-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._pending is None:
+                    self._thread = None
+                    return
+                self._writing = True
+
+            # Later submissions within the delay replace this one
+            if self.delay and not self._stopping:
+                time.sleep(self.delay)
+
+            with self._cond:
+                data, self._pending = self._pending, None
+            try:
+                self._write(data)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error saving recommendations: {e}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, data: dict):
+        with span("save"):
+            payload = dumps(data)
+            write_atomic(self.path, payload)
+            signature = _signature(os.stat(self.path))
+        with self._cond:
+            self._cached = (signature, payload)
+            self.writes += 1
+        logger.debug("💾 Saved %d bytes to %s", len(payload), self.path)
+
+    def read(self):
+        """Current file contents as JSON bytes, or None when nothing was saved yet
+
+        Raises ValueError if the file on disk is not valid JSON.
+        """
+        try:
+            signature = _signature(os.stat(self.path))
+        except FileNotFoundError:
+            return None
+
+        cached = self._cached
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(self.path, "rb") as f:
+            payload = f.read()
+        try:
+            loads(payload)
+        except Exception as e:
+            raise ValueError(f"{self.path} is not valid JSON: {e}") from e
+        with self._cond:
+            self._cached = (signature, payload)
+            self.reloads += 1
+        return payload
+
+    def flush(self, timeout: float = 5):
+        """Block until queued snapshots are on disk"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is None and not self._writing, timeout)
+
+    def close(self, timeout: float = 5):
+        """Write any queued snapshot immediately and stop the writer thread"""
+        with self._cond:
+            self._stopping = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "reloads": self.reloads,
+            "failed": self.failed,
+            "encoder": "orjson" if orjson is not None else "json",
+        }
+
+
+class CatalogSnapshot:
+    """
+    Last-known-good property catalog on disk.
+
+    Each successful all-cities load is saved through a coalescing
+    ``SnapshotFile``. The file is parsed and indexed by city once per
+    version, the first time a load has to fall back to it.
+    """
+
+    def __init__(self, path: str, delay: float = 1.0):
+        self.file = SnapshotFile(path, delay)
+        self.served = 0
+        self._loaded = None  # (payload, snapshot, properties by city)
+
+    def save(self, source: str, docs: list):
+        self.file.submit({"source": source, "saved_at": datetime.now().isoformat(), "properties": docs})
+
+    def load(self, city_key: str):
+        """Return ``(source, docs)`` saved for a city, or None if no snapshot exists"""
+        payload = self.file.read()
+        if payload is None:
+            return None
+
+        loaded = self._loaded
+        if loaded is None or loaded[0] is not payload:
+            snapshot = loads(payload)
+            by_city = {}
+            for doc in snapshot["properties"]:
+                # Stored as strings; refresh watermarks only come from live MongoDB loads
+                doc.pop("updatedAt", None)
+                city = doc.get("city") or doc.get("location") or ""
+                by_city.setdefault(normalize_city(str(city)), []).append(doc)
+            loaded = self._loaded = (payload, snapshot, by_city)
+
+        self.served += 1
+        _, snapshot, by_city = loaded
+        docs = snapshot["properties"] if city_key == ALL_CITIES else by_city.get(city_key, ())
+        return snapshot["source"], list(docs)
+
+    def close(self):
+        self.file.close()
+
+    def stats(self):
+        return {**self.file.stats(), "served": self.served}
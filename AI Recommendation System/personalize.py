@@ -0,0 +1,87 @@
+"""
+Preference-aware re-ranking of cached catalogs.
+
+The model scores a property the same way for every user. A
+``PreferenceProfile`` adds a per-user match term computed with vectorized
+column operations on the catalog's precomputed feature matrix and amenity
+bitmasks, which is blended with the cached model score. Nothing is re-predicted per user, so a
+personalized top K costs one masked pass over the city's rows.
+"""
+from typing import List, Optional, Union
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from feature_store import amenity_bits
+
+
+class PreferenceProfile(BaseModel):
+    """What one user is looking for"""
+
+    min_budget: Optional[float] = Field(None, ge=0)
+    max_budget: Optional[float] = Field(None, ge=0)
+    min_rating: Optional[float] = Field(None, ge=0, le=5)
+    required_amenities: List[str] = []
+    preferred_amenities: List[str] = []
+    # Category labels ("Single", "Female", ...) mapped through the catalog's schema encodings,
+    # or label-encoded codes as in the "Sharing Type" and "Gender Preference" columns of WebGI.ipynb
+    sharing_type: Optional[Union[int, str]] = None
+    gender_preference: Optional[Union[int, str]] = None
+    # Share of the final score taken by the preference match, the rest by the model score
+    weight: float = Field(0.5, ge=0, le=1)
+
+
+def _column(store, name: str):
+    try:
+        return store.feature_names.index(name)
+    except ValueError:
+        return None
+
+
+def preference_adjuster(profile: PreferenceProfile):
+    """Build the ``adjust(store, rows)`` scorer CatalogEntry.rerank expects"""
+
+    required = amenity_bits(profile.required_amenities)
+    preferred = amenity_bits(profile.preferred_amenities)
+
+    def adjust(store, rows):
+        matrix = store.matrix[rows]
+        prices = store.prices[rows]
+        amenities = store.amenity_masks[rows]
+        keep = np.ones(len(rows), dtype=bool)
+
+        # Hard constraints
+        if required:
+            keep &= (amenities & required) == required
+        if profile.min_budget is not None:
+            keep &= prices >= profile.min_budget
+        if profile.min_rating is not None:
+            keep &= store.ratings[rows] >= profile.min_rating
+
+        # Soft match terms, each in [0, 1]
+        terms = []
+        if preferred:
+            terms.append(np.bitwise_count(amenities & preferred) / preferred.bit_count())
+        for name, wanted in (("Sharing Type", profile.sharing_type), ("Gender Preference", profile.gender_preference)):
+            j = _column(store, name)
+            if wanted is not None and j is not None:
+                # A label the encodings don't know matches nothing
+                terms.append((matrix[:, j] == store.schema.code(name, wanted)).astype(np.float64))
+        if profile.max_budget:
+            # Cheaper within the user's range fits better
+            low = profile.min_budget or 0.0
+            span = max(profile.max_budget - low, 1.0)
+            terms.append(np.clip(1.0 - (prices - low) / span, 0.0, 1.0))
+        match = np.mean(terms, axis=0) if terms else np.zeros(len(rows))
+
+        base = store.scores[rows].astype(np.float64)
+        if len(base) and base.max() > base.min():
+            base = (base - base.min()) / (base.max() - base.min())
+        else:
+            base = np.full(len(rows), 0.5)
+
+        scores = (1.0 - profile.weight) * base + profile.weight * match
+        scores[~keep] = np.nan
+        return scores
+
+    return adjust
@@ -0,0 +1,87 @@
+"""
+MongoDB query planning for property fetches.
+
+City and budget filters are pushed into the database in a form the
+indexes created by ``ensure_indexes()`` can serve: cities are matched by
+equality under a case-insensitive collation instead of an unanchored
+``$regex``, prices with a range predicate, and only the fields needed for
+scoring and for the response are projected.
+"""
+import logging
+
+from pymongo import ASCENDING
+from pymongo.collation import Collation, CollationStrength
+
+from geo_index import COORDINATE_FIELDS
+from score_cache import ALL_CITIES
+
+logger = logging.getLogger(__name__)
+
+# Case-insensitive comparison; queries must use it to hit the city indexes
+CITY_COLLATION = Collation(locale="en", strength=CollationStrength.SECONDARY)
+
+INDEXES = [
+    ([("city", ASCENDING), ("price", ASCENDING)], "city_price_ci"),
+    ([("city", ASCENDING), ("updatedAt", ASCENDING)], "city_updated_ci"),
+    ([("price", ASCENDING)], "price"),
+    ([("updatedAt", ASCENDING)], "updated"),
+]
+
+
+class QueryPlan:
+    """Filter, projection and collation for one collection.find() call"""
+
+    def __init__(self, filter: dict, projection: dict):
+        self.filter = filter
+        self.projection = projection
+
+    def find(self, collection, limit: int = 0, batch_size: int = None):
+        cursor = collection.find(self.filter, self.projection, collation=CITY_COLLATION)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return cursor.limit(limit)
+
+    async def fetch(self, collection, limit: int = 0):
+        """Run the plan on an async collection and return the documents"""
+        return await self.find(collection, limit).to_list(None)
+
+    def __repr__(self):
+        return f"QueryPlan(filter={self.filter}, projection={sorted(self.projection)})"
+
+
+class QueryPlanner:
+    """Build index-friendly property queries"""
+
+    def __init__(self, source_fields: list, result_columns: list):
+        """source_fields: the document fields the feature schema reads"""
+        fields = {"_id", "city", "location", "price", "updatedAt"}
+        fields.update(f for pair in COORDINATE_FIELDS for f in pair)
+        fields.update(c for c in result_columns if c != "score")
+        fields.update(source_fields)
+        self.projection = {field: 1 for field in sorted(fields)}
+
+    def plan(self, city_key: str = ALL_CITIES, max_budget: float = None, since=None):
+        query = {}
+        if city_key != ALL_CITIES:
+            query["city"] = city_key
+        if max_budget is not None:
+            query["price"] = {"$lte": max_budget}
+        if since is not None:
+            query["updatedAt"] = {"$gt": since}
+        return QueryPlan(query, self.projection)
+
+    def id_plan(self, city_key: str = ALL_CITIES):
+        """Ids only, covered by the city indexes"""
+        query = {"city": city_key} if city_key != ALL_CITIES else {}
+        return QueryPlan(query, {"_id": 1})
+
+
+async def ensure_indexes(collection):
+    """Create the compound indexes the planned queries rely on"""
+    for keys, name in INDEXES:
+        try:
+            collation = CITY_COLLATION if keys[0][0] == "city" else None
+            await collection.create_index(keys, name=name, collation=collation)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not ensure index {name}: {e}")
+    logger.info(f"📇 Ensured {len(INDEXES)} property indexes")
@@ -0,0 +1,119 @@
+"""
+Encoded JSON responses for the ranking endpoints.
+
+Endpoints hand their payload to ``encoded_response`` instead of returning
+a dict, which skips FastAPI's ``jsonable_encoder`` pass: the payload is
+serialized once, with orjson when installed (numpy scalars and arrays
+natively, NaN as null), otherwise with json and the same conversions.
+
+The ETag is a hash of the serialized body, so a client or CDN revalidating
+an unchanged ranking gets an empty 304. Bodies above a size threshold are
+compressed with brotli (when installed) or gzip, whichever the client
+prefers in ``Accept-Encoding``. ``Vary: Accept-Encoding`` and the
+Cache-Control max-age let a shared cache keep one copy per encoding.
+"""
+import gzip
+import hashlib
+import json
+import math
+
+import numpy as np
+from starlette.responses import Response
+
+from persistence import dumps, orjson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# Codings this server can produce, preferred first when the client has no preference
+CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _plain(value):
+    # json fallback only: numpy scalars to Python, NaN and infinities to null as orjson does
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _plain(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def encode_json(data) -> bytes:
+    """Compact JSON bytes with numpy values and NaN handled"""
+    if orjson is not None:
+        return dumps(data)
+    return json.dumps(_plain(data), separators=(",", ":"), default=str).encode()
+
+
+def accepted_encodings(header: str):
+    """Content codings from an Accept-Encoding header, highest q-value first, refused ones dropped"""
+    codings = []
+    for part in (header or "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            codings.append((-q, len(codings), coding.lower()))
+    return [coding for _, _, coding in sorted(codings)]
+
+
+def choose_encoding(header: str):
+    """Best coding both sides support, or None for identity"""
+    for coding in accepted_encodings(header):
+        if coding in CODINGS:
+            return coding
+        if coding == "*":
+            return CODINGS[0]
+    return None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output, and so CDN copies, identical for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def etag_matches(header: str, etag: str):
+    """Weak If-None-Match comparison, as RFC 9110 requires for GET"""
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (t.removeprefix("W/") for t in tags)
+
+
+def encoded_response(request, data, max_age: int = 0, compress_min_bytes: int = 1024, headers: dict = None):
+    """200 with the encoded (and possibly compressed) payload, or 304 if the client's copy is current"""
+    body = encode_json(data)
+    # Weak, because the gzip and brotli bodies of one ranking share it
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": f"public, max-age={max_age}" if max_age > 0 else "no-cache",
+        **(headers or {}),
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    coding = choose_encoding(request.headers.get("accept-encoding")) if len(body) >= compress_min_bytes else None
+    if coding is not None:
+        body = compress(body, coding)
+        headers["Content-Encoding"] = coding
+    return Response(body, headers=headers, media_type="application/json")
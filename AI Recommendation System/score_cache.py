@@ -0,0 +1,572 @@
+"""
+Resident scored-catalog cache for the recommendation server.
+
+Property data changes rarely but scoring the catalog is expensive, so the
+scored properties of each requested city are kept in memory and refreshed
+incrementally: only documents that were inserted, updated or deleted since
+the last refresh get re-scored. Changes come from a MongoDB change stream
+when the deployment supports one, otherwise from polling the ``updatedAt``
+watermark. A deleted document has no ``updatedAt`` to poll for, so every
+``id_sweep_polls``-th poll also diffs the entry's ids against the ids still
+in the database: without a change stream a delete is visible for at most
+``poll_interval * id_sweep_polls`` seconds. Entries are evicted
+least-recently-used first.
+
+Loads are tagged with the model version they started under; one that
+finishes after a model swap is scored for the old version and is loaded
+again rather than cached.
+
+Each entry keeps its properties in a ``FeatureStore``, so re-scoring a
+changed property only re-encodes and re-predicts its own row.
+"""
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from geo_index import GeoIndex
+from metrics import span
+from similarity import SimilarityIndex
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+ALL_CITIES = "all"
+
+
+def normalize_city(city: str):
+    """Map a user supplied city name to its cache key"""
+    key = (city or "").strip().lower()
+    if key in ("all", "all cities", "*", ""):
+        return ALL_CITIES
+    return key
+
+
+def city_matches(city_key: str, doc: dict):
+    """Check whether a document belongs to a city, mirroring the /recommend filter"""
+    if city_key == ALL_CITIES:
+        return True
+    return normalize_city(str(doc.get("city") or doc.get("location") or "")) == city_key
+
+
+async def _run_inline(fn, *args):
+    return fn(*args)
+
+
+def encode_cursor(score: float, doc_id: str):
+    """Opaque pagination cursor pointing just after a ranked property"""
+    payload = json.dumps([score, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor, raising ValueError for malformed cursors"""
+    try:
+        score, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), str(doc_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def latest_update(docs: list, default=None):
+    """Return the newest updatedAt among the documents"""
+    watermark = default
+    for doc in docs:
+        updated = doc.get("updatedAt")
+        if updated is not None and (watermark is None or updated > watermark):
+            watermark = updated
+    return watermark
+
+
+class CatalogEntry:
+    """Scored properties of one city, held in a columnar feature store"""
+
+    def __init__(self, city_key: str, mode: str, store, watermark=None):
+        self.city_key = city_key
+        self.mode = mode
+        self.store = store
+        self.watermark = watermark
+        self.loaded_at = time.time()
+        self.polled_at = self.loaded_at
+        self.polls = 0
+        self.model_version = None
+        self.lock = threading.Lock()
+        self.version = 0
+        self.similarity = None
+        self.geo = None
+        self._order = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def upsert(self, docs: list, predict):
+        """Encode and score documents, replacing rows of known ids"""
+        with self.lock:
+            with span("preprocess"):
+                rows = self.store.upsert(docs)
+            if len(rows):
+                self.store.scores[rows] = predict(self.store, rows)
+                if self.similarity is not None:
+                    self.similarity.update(rows)
+                if self.geo is not None:
+                    self.geo.update(rows)
+            self.version += 1
+            self._order = None
+
+    def remove(self, doc_id: str):
+        with self.lock:
+            row = self.store.rows.get(doc_id)
+            if not self.store.delete(doc_id):
+                return False
+            if self.similarity is not None:
+                self.similarity.remove(row)
+            if self.geo is not None:
+                self.geo.remove(row)
+            self.version += 1
+            self._order = None
+            return True
+
+    def _ranked_rows(self):
+        # Live rows by descending score then id, re-sorted only after a change
+        order = self._order
+        if order is None:
+            store = self.store
+            ids = np.array([str(i) for i in store.ids[:store.size]])
+            order = np.lexsort((ids, -store.scores[:store.size]))
+            order = order[store.live[order]]
+            self._order = order
+        return order
+
+    def _mask(self, city_key: str, max_budget: float):
+        if city_key in (self.city_key, ALL_CITIES):
+            city_key = None
+        return self.store.mask(city_key, max_budget)
+
+    def top(self, city_key: str = None, max_budget: float = None, k: int = 100):
+        """Return ``(total, records)`` for the k best properties matching the masks"""
+        with self.lock:
+            store = self.store
+            with span("sort"):
+                mask = self._mask(city_key, max_budget)
+                if self._order is not None:
+                    ranked = self._order[mask[self._order]]
+                    total, rows = len(ranked), ranked[:k]
+                else:
+                    # Partial selection is O(n); only the k winners get sorted
+                    candidates = np.flatnonzero(mask)
+                    total = len(candidates)
+                    if 0 < k < total:
+                        scores = store.scores[candidates]
+                        kth = np.partition(-scores, k - 1)[k - 1]
+                        # Keep every tie at the boundary so the id tie-break matches paging
+                        candidates = candidates[-scores <= kth]
+                    ids = np.array([store.ids[r] for r in candidates], dtype=str)
+                    rows = candidates[np.lexsort((ids, -store.scores[candidates]))][:max(k, 0)]
+            with span("to_dict"):
+                return total, [store.result(row) for row in rows]
+
+    def rerank(self, city_key: str = None, max_budget: float = None, k: int = 100, adjust=None):
+        """
+        Return ``(total, records)`` for the k best properties under adjusted scores.
+
+        ``adjust(store, rows)`` returns new scores for the masked rows, NaN for
+        rows to exclude. Records carry the adjusted ``score`` and the cached
+        ``base_score``.
+        """
+        with self.lock:
+            store = self.store
+            with span("sort"):
+                rows = np.flatnonzero(self._mask(city_key, max_budget))
+                scores = np.asarray(adjust(store, rows), dtype=np.float64)
+                keep = ~np.isnan(scores)
+                rows, scores = rows[keep], scores[keep]
+                total = len(rows)
+                if 0 < k < total:
+                    kth = np.partition(-scores, k - 1)[k - 1]
+                    top = -scores <= kth
+                    rows, scores = rows[top], scores[top]
+                ids = np.array([store.ids[r] for r in rows], dtype=str)
+                order = np.lexsort((ids, -scores))[:max(k, 0)]
+            with span("to_dict"):
+                records = []
+                for i in order:
+                    record = store.result(rows[i])
+                    record["base_score"] = record["score"]
+                    record["score"] = float(scores[i])
+                    records.append(record)
+            return total, records
+
+    def similar(self, doc_id: str, k: int = 10, same_city: bool = False, max_budget: float = None,
+                hnsw_min_rows: int = 50000):
+        """Return ``(record, neighbours)`` for the k properties nearest to doc_id, or None if unknown
+
+        The similarity index is built on first use and kept current by upsert and remove.
+        """
+        with self.lock:
+            store = self.store
+            row = store.rows.get(doc_id)
+            if row is None:
+                return None
+            city_key = store.cities[store.city_codes[row]] if same_city else None
+            if self.similarity is None:
+                self.similarity = SimilarityIndex(store, hnsw_min_rows)
+            with span("similar"):
+                rows, distances = self.similarity.query(row, k, self._mask(city_key, max_budget))
+            neighbours = []
+            for neighbour, distance in zip(rows, distances):
+                record = store.result(neighbour)
+                record["distance"] = float(distance)
+                neighbours.append(record)
+            return store.result(row), neighbours
+
+    def nearby(self, lat: float, lng: float, radius_km: float, city_key: str = None, max_budget: float = None,
+               k: int = 100, decay_km: float = 5.0, weight: float = 0.3, cell_km: float = 5.0):
+        """
+        Return ``(total, records)`` for the k best properties within radius_km of a point.
+
+        Candidates come from the grid index, so only the neighbourhood is
+        filtered and scored. The cached score, min-max normalized over the
+        candidates, is blended with ``exp(-distance / decay_km)`` by ``weight``.
+        Records carry the blended ``score``, the cached ``base_score`` and
+        ``distance_km``.
+        """
+        with self.lock:
+            store = self.store
+            if self.geo is None:
+                self.geo = GeoIndex(store, cell_km)
+            with span("nearby"):
+                rows, distances = self.geo.query(lat, lng, radius_km)
+                if city_key in (self.city_key, ALL_CITIES):
+                    city_key = None
+                keep = store.mask_rows(rows, city_key, max_budget)
+                rows, distances = rows[keep], distances[keep]
+
+                base = store.scores[rows].astype(np.float64)
+                if len(base) and base.max() > base.min():
+                    base = (base - base.min()) / (base.max() - base.min())
+                scores = (1.0 - weight) * base + weight * np.exp(-distances / max(decay_km, 1e-6))
+
+                total = len(rows)
+                ids = np.array([store.ids[r] for r in rows], dtype=str)
+                order = np.lexsort((ids, -scores))[:max(k, 0)]
+            with span("to_dict"):
+                records = []
+                for i in order:
+                    record = store.result(rows[i])
+                    record["base_score"] = record["score"]
+                    record["score"] = float(scores[i])
+                    record["distance_km"] = round(float(distances[i]), 3)
+                    records.append(record)
+            return total, records
+
+    def page(self, city_key: str = None, max_budget: float = None, cursor: str = None, page_size: int = 50):
+        """Return ``(total, records, next_cursor)`` for one page of the ranked list"""
+        with self.lock:
+            store = self.store
+            with span("sort"):
+                mask = self._mask(city_key, max_budget)
+                order = self._ranked_rows()
+                ranked = order[mask[order]]
+
+                start = 0
+                if cursor:
+                    # Keyset position, so inserts and deletes don't shift pages
+                    last_score, last_id = decode_cursor(cursor)
+                    scores = store.scores[ranked]
+                    ids = np.array([store.ids[r] for r in ranked], dtype=str)
+                    after = (scores < last_score) | ((scores == last_score) & (ids > last_id))
+                    start = int(np.argmax(after)) if after.any() else len(ranked)
+
+            rows = ranked[start:start + page_size]
+            next_cursor = None
+            if start + page_size < len(ranked):
+                last = rows[-1]
+                next_cursor = encode_cursor(float(store.scores[last]), store.ids[last])
+            with span("to_dict"):
+                return len(ranked), [store.result(row) for row in rows], next_cursor
+
+    def snapshot(self, city_key: str = None, max_budget: float = None):
+        """Return the full ranked list as (record, score) pairs for streaming"""
+        with self.lock:
+            store = self.store
+            with span("sort"):
+                order = self._ranked_rows()
+                ranked = order[self._mask(city_key, max_budget)[order]]
+            return [(store.records[row], float(store.scores[row])) for row in ranked]
+
+
+class ScoredCatalogCache:
+    """
+    LRU cache of scored catalogs keyed by normalized city.
+
+    The coroutine ``loader(city_key)`` returns ``(mode, docs)`` for a full
+    load and ``fetch_changed(city_key, since)`` the documents updated after
+    the watermark; the optional ``fetch_ids(city_key)`` returns the set of
+    ids the city has now, or None when unknown. ``model_version()`` names
+    the model new stores are laid out for. ``new_store()`` creates an empty feature store and
+    ``predict(store, rows)`` scores rows of a store; encoding and scoring are
+    dispatched through the ``run(fn, *args)`` coroutine so they stay off the
+    event loop. While a complete catalog of all cities is resident, single
+    cities are served from it by mask.
+    """
+
+    def __init__(self, loader, fetch_changed, new_store, predict, run=None, max_entries: int = 128,
+                 max_rows: int = 200000, ttl: float = 3600, poll_interval: float = 30,
+                 derive_from_all: bool = True, fetch_ids=None, id_sweep_polls: int = 10,
+                 model_version=None, max_load_attempts: int = 3):
+        self.loader = loader
+        self.fetch_changed = fetch_changed
+        self.fetch_ids = fetch_ids
+        self.id_sweep_polls = id_sweep_polls
+        self.model_version = model_version or (lambda: None)
+        self.max_load_attempts = max_load_attempts
+        self.new_store = new_store
+        self.predict = predict
+        self.run = run or _run_inline
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.derive_from_all = derive_from_all
+        self.change_stream_active = False
+        self._watcher = None
+        self.loads = SingleFlight()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "refreshes": 0,
+            "rescored": 0,
+            "removed": 0,
+            "swept": 0,
+            "stale_loads": 0,
+            "evictions": 0,
+            "changes_applied": 0,
+        }
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    async def get(self, city_key: str):
+        """Return the scored catalog for a city, loading or refreshing it as needed"""
+        now = time.time()
+        with self._lock:
+            entry = self._fresh(city_key, now)
+            if entry is None and self.derive_from_all and city_key != ALL_CITIES:
+                entry = self._fresh(ALL_CITIES, now)
+                if entry is not None and entry.mode != "mongodb":
+                    entry = None
+            if entry is not None:
+                self._entries.move_to_end(entry.city_key)
+                self._counters["hits"] += 1
+            else:
+                self._counters["misses"] += 1
+
+        if entry is None:
+            # Concurrent misses for one city wait on a single load
+            return await self.loads.do(city_key, self._load, city_key)
+
+        if (entry.mode == "mongodb" and not self.change_stream_active
+                and now - entry.polled_at >= self.poll_interval):
+            await self._refresh(entry, now)
+        return entry
+
+    def peek(self, city_key: str):
+        """The resident entry serving a city, even past its TTL, without loading or refreshing anything"""
+        with self._lock:
+            entry = self._entries.get(city_key)
+            if entry is None and self.derive_from_all and city_key != ALL_CITIES:
+                entry = self._entries.get(ALL_CITIES)
+                if entry is not None and entry.mode != "mongodb":
+                    entry = None
+            return entry
+
+    def _fresh(self, city_key: str, now: float):
+        entry = self._entries.get(city_key)
+        if entry is not None and now - entry.loaded_at < self.ttl:
+            return entry
+        return None
+
+    async def _load(self, city_key: str):
+        for attempt in range(1, self.max_load_attempts + 1):
+            version = self.model_version()
+            mode, docs = await self.loader(city_key)
+            if not docs:
+                return None
+
+            entry = CatalogEntry(city_key, mode, self.new_store(), latest_update(docs))
+            entry.model_version = version
+            await self.run(entry.upsert, docs, self.predict)
+            if self.model_version() == version:
+                break
+            # The model was swapped mid-load; a rebuild waiting on this load needs the new version's scores
+            self._count("stale_loads")
+            logger.info(f"🔁 Model changed while loading {city_key}, loading it again ({attempt})")
+        else:
+            # Still serve this request, but don't cache scores of a retired model
+            return entry
+
+        with self._lock:
+            self._entries[city_key] = entry
+            self._entries.move_to_end(city_key)
+            self._counters["loads"] += 1
+            self._counters["rescored"] += len(docs)
+            self._evict()
+        logger.info(f"🗃️ Cached {len(entry)} scored properties for: {city_key}")
+        return entry
+
+    async def _refresh(self, entry: CatalogEntry, now: float):
+        entry.polled_at = now
+        if entry.watermark is None:
+            return
+
+        try:
+            docs = await self.fetch_changed(entry.city_key, entry.watermark)
+        except Exception as e:
+            logger.warning(f"⚠️ Incremental refresh failed for {entry.city_key}: {e}")
+            return
+
+        self._count("refreshes")
+        if docs:
+            await self.run(entry.upsert, docs, self.predict)
+            entry.watermark = latest_update(docs, entry.watermark)
+            self._count("rescored", len(docs))
+            logger.info(f"🔄 Re-scored {len(docs)} changed properties for: {entry.city_key}")
+
+        entry.polls += 1
+        if self.fetch_ids is not None and self.id_sweep_polls and entry.polls % self.id_sweep_polls == 0:
+            # After the upsert, so properties it just added are in the id set fetched next
+            await self._sweep_deleted(entry)
+
+    async def _sweep_deleted(self, entry: CatalogEntry):
+        """Remove the properties of an entry that are no longer in the database"""
+        try:
+            ids = await self.fetch_ids(entry.city_key)
+        except Exception as e:
+            logger.warning(f"⚠️ Deleted-property sweep failed for {entry.city_key}: {e}")
+            return
+        if ids is None:
+            return
+
+        gone = [doc_id for doc_id in list(entry.store.rows) if doc_id not in ids]
+        removed = sum(entry.remove(doc_id) for doc_id in gone)
+        self._count("swept")
+        if removed:
+            self._count("removed", removed)
+            logger.info(f"🗑️ Removed {removed} deleted properties from: {entry.city_key}")
+
+    async def rebuild(self):
+        """Reload every resident city into a fresh entry, each swapped in once it is scored"""
+        with self._lock:
+            city_keys = list(self._entries)
+        for city_key in city_keys:
+            try:
+                await self.loads.do(city_key, self._load, city_key)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not rebuild cached catalog for {city_key}: {e}, dropping it")
+                self.invalidate(city_key)
+        return len(city_keys)
+
+    def _evict(self):
+        rows = sum(len(e) for e in self._entries.values())
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or rows > self.max_rows):
+            city_key, evicted = self._entries.popitem(last=False)
+            rows -= len(evicted)
+            self._counters["evictions"] += 1
+            logger.info(f"🧹 Evicted cached catalog for: {city_key}")
+
+    def invalidate(self, city_key: str = None):
+        """Drop one cached city, or every city when no key is given"""
+        with self._lock:
+            if city_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(city_key, None)
+
+    async def apply_change(self, change: dict):
+        """Apply one MongoDB change stream event to the resident entries"""
+        operation = change.get("operationType")
+        if operation in ("drop", "dropDatabase", "rename", "invalidate"):
+            self.invalidate()
+            return
+
+        doc_key = change.get("documentKey") or {}
+        if "_id" not in doc_key:
+            return
+        doc_id = str(doc_key["_id"])
+        doc = change.get("fullDocument")
+
+        with self._lock:
+            entries = [e for e in self._entries.values() if e.mode == "mongodb"]
+        if not entries:
+            return
+
+        rescored = removed = 0
+        for entry in entries:
+            if doc is not None and city_matches(entry.city_key, doc):
+                await self.run(entry.upsert, [doc], self.predict)
+                rescored += 1
+            elif entry.remove(doc_id):
+                removed += 1
+            if doc is not None:
+                entry.watermark = latest_update([doc], entry.watermark)
+
+        with self._lock:
+            self._counters["changes_applied"] += 1
+            self._counters["rescored"] += rescored
+            self._counters["removed"] += removed
+
+    def watch(self, collection, retry_delay: float = 5):
+        """Follow the collection's change stream in a background task"""
+        self._watcher = asyncio.create_task(self._watch(collection, retry_delay), name="catalog-change-stream")
+        return self._watcher
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        self.loads = SingleFlight()
+        self.change_stream_active = False
+
+    async def _watch(self, collection, retry_delay: float):
+        from pymongo.errors import OperationFailure
+
+        resume_token = None
+        while True:
+            try:
+                stream = await collection.watch(full_document="updateLookup", resume_after=resume_token)
+                async with stream:
+                    self.change_stream_active = True
+                    logger.info("👀 Following MongoDB change stream for cache invalidation")
+                    async for change in stream:
+                        await self.apply_change(change)
+                        resume_token = stream.resume_token
+            except OperationFailure as e:
+                # Standalone servers have no change streams; polling takes over
+                self.change_stream_active = False
+                logger.warning(f"⚠️ Change stream unavailable ({e}), polling updatedAt instead")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.change_stream_active = False
+                logger.warning(f"⚠️ Change stream interrupted: {e}, retrying in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["rows"] = sum(len(e) for e in self._entries.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["change_stream_active"] = self.change_stream_active
+        return stats
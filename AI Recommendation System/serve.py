@@ -0,0 +1,209 @@
+"""
+Production launcher: N uvicorn workers sharing the model and the catalog.
+
+The master process imports ``ml_server``, loads the model and binds the
+listening socket before forking, so every worker starts with the model's
+arrays as copy-on-write pages instead of loading its own. One extra
+publisher process keeps the scored all-cities catalog current from MongoDB
+and publishes each change with ``shared_catalog.publish_catalog``; workers
+memory-map the published arrays, so they share one copy and pick up
+refreshes without a restart. The master creates the MongoDB indexes once
+instead of every child doing so, and holds no SQLite connection of the
+snapshot archive: each worker opens its own. The master restarts crashed
+children and logs each worker's resident, shared and private memory. With
+``--no-publish`` no publisher runs and workers serve the rankings
+``batch_score.py`` writes to the catalog directory.
+
+    python serve.py --workers 4 --port 8001
+    python serve.py --no-publish --catalog-dir recommendations/batch_catalog
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger("serve")
+
+
+def fork(target, *args):
+    """Run target(*args) in a child process and return its pid"""
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        target(*args)
+    except BaseException:
+        logger.exception("Child process failed")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def run_worker(sock: socket.socket):
+    import uvicorn
+    import ml_server
+
+    uvicorn.Server(uvicorn.Config(ml_server.app, log_level="info")).run(sockets=[sock])
+
+
+async def publish_forever(directory: str, interval: float):
+    """Keep the all-cities catalog scored and publish every new version"""
+    import httpx
+    import ml_server as server
+    from score_cache import ALL_CITIES
+    from shared_catalog import publish_catalog
+
+    server.http_client = httpx.AsyncClient(
+        timeout=5,
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+    )
+    try:
+        # Already loaded unless the master's preload failed
+        await asyncio.to_thread(server.load_model_files)
+    except Exception as e:
+        logger.warning(f"⚠️ Publisher could not load the model, using the fallback formula: {e}")
+    cache = server.new_catalog_cache(max_entries=1, derive_from_all=False)
+    # Workers only read what is published, so new model versions are swapped in here
+    following = asyncio.create_task(server.follow_models(cache)) if server.MODEL_POLL_INTERVAL else None
+    # Publishes fallback data until MongoDB answers, then switches over
+    connecting = asyncio.create_task(server.connect_mongo(cache)) if server.MONGO_URI else None
+
+    published = None
+    while True:
+        try:
+            entry = await cache.get(ALL_CITIES)
+            if entry is not None and published != (entry, entry.version):
+                await asyncio.to_thread(publish_catalog, entry, directory)
+                published = (entry, entry.version)
+        except Exception as e:
+            logger.error(f"❌ Catalog publish failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
+
+
+def run_publisher(directory: str, interval: float):
+    asyncio.run(publish_forever(directory, interval))
+
+
+def log_memory(workers: dict, publisher: int = None):
+    from metrics import process_memory
+
+    processes = [(p, f"worker {i}") for p, i in workers.items()]
+    if publisher is not None:
+        processes.append((publisher, "publisher"))
+    for pid, label in processes:
+        memory = process_memory(pid)
+        if memory:
+            logger.info(
+                f"🧠 {label} pid={pid} rss={memory['rss_bytes'] >> 20}MiB pss={memory['pss_bytes'] >> 20}MiB "
+                f"shared={memory['shared_bytes'] >> 20}MiB private={memory['private_bytes'] >> 20}MiB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve ml_server with forked workers sharing model and catalog memory")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8001)))
+    parser.add_argument("--catalog-dir", default=os.getenv("SHARED_CATALOG_DIR",
+                                                           os.path.join(HERE, "recommendations", "shared_catalog")))
+    parser.add_argument("--publish-interval", type=float, default=float(os.getenv("PUBLISH_INTERVAL", 2)))
+    parser.add_argument("--no-publish", action="store_true",
+                        help="serve the catalog batch_score.py writes instead of publishing from MongoDB")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--memory-log-interval", type=float, default=float(os.getenv("MEMORY_LOG_INTERVAL", 60)))
+    args = parser.parse_args()
+
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+    if not hasattr(os, "fork"):
+        import uvicorn
+        import ml_server
+        uvicorn.run(ml_server.app, host=args.host, port=args.port)
+        return
+
+    # Workers read the published catalog; set before ml_server is imported
+    os.environ["SHARED_CATALOG_DIR"] = args.catalog_dir
+    # Indexes are ensured here once, not by every worker as it connects
+    os.environ["MONGO_ENSURE_INDEXES"] = "0"
+    os.makedirs(args.catalog_dir, exist_ok=True)
+
+    # Preload before forking so the model pages are shared copy-on-write
+    import ml_server
+    try:
+        ml_server.load_model_files()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not preload the model, workers will retry: {e}")
+    if ml_server.MONGO_URI:
+        try:
+            # Its own event loop and client, both closed again before anything forks
+            asyncio.run(ml_server.create_indexes())
+        except Exception as e:
+            logger.warning(f"⚠️ Could not ensure MongoDB indexes, queries may scan: {e}")
+    from shared_catalog import wait_for_catalog
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    publisher = None if args.no_publish else fork(run_publisher, args.catalog_dir, args.publish_interval)
+    if not wait_for_catalog(args.catalog_dir, args.startup_timeout):
+        logger.warning("⚠️ No catalog published yet, starting workers anyway")
+
+    workers = {fork(run_worker, sock): i for i in range(args.workers)}
+    logger.info(f"🚀 Serving on {args.host}:{args.port} with {args.workers} workers (publisher pid={publisher})")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_memory_log = time.time() + args.memory_log_interval
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid in workers:
+            index = workers.pop(pid)
+            logger.warning(f"⚠️ Worker {index} (pid={pid}) exited with status {status}, restarting")
+            workers[fork(run_worker, sock)] = index
+        elif pid == publisher:
+            logger.warning(f"⚠️ Publisher (pid={pid}) exited with status {status}, restarting")
+            publisher = fork(run_publisher, args.catalog_dir, args.publish_interval)
+        elif not pid:
+            if time.time() >= next_memory_log:
+                log_memory(workers, publisher)
+                next_memory_log = time.time() + args.memory_log_interval
+            time.sleep(0.5)
+
+    children = list(workers) + ([publisher] if publisher is not None else [])
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
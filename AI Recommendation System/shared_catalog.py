@@ -0,0 +1,221 @@
+"""
+Scored catalog shared between server worker processes.
+
+One publisher process keeps the scored catalog of all cities up to date and
+writes each new version as a directory of ``.npy`` arrays (feature matrix,
+scores, prices, ratings, city codes, ids and the precomputed ranking) plus one blob
+of compact JSON response records. The ``CURRENT`` file names the newest
+version and is replaced atomically. Workers memory-map the arrays, so
+every worker reads the same page-cache copy, and swap to a new version as
+soon as ``CURRENT`` changes.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+
+import numpy as np
+
+from feature_schema import FeatureSchema
+from feature_store import FeatureStore
+from persistence import dumps, loads, write_atomic
+from score_cache import ALL_CITIES, CatalogEntry
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+POINTER = "CURRENT"
+ARRAYS = ("matrix", "scores", "prices", "ratings", "city_codes", "lats", "lngs", "amenity_masks", "live", "ids", "order",
+          "record_offsets")
+
+# Versions kept on disk; older ones may still be mapped by a worker mid-request
+KEEP_VERSIONS = 3
+
+
+def stage_version(directory: str):
+    """Create a hidden staging directory for a new version and return ``(version, path)``"""
+    os.makedirs(directory, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    staging = os.path.join(directory, f".{version}")
+    os.makedirs(staging)
+    return version, staging
+
+
+def commit_version(directory: str, version: str):
+    """Move a staged version into place, point CURRENT at it and prune old versions"""
+    os.rename(os.path.join(directory, f".{version}"), os.path.join(directory, version))
+    write_atomic(os.path.join(directory, POINTER), version.encode())
+
+    versions = sorted(d for d in os.listdir(directory) if d.startswith("v"))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def publish_catalog(entry: CatalogEntry, directory: str):
+    """Write the entry as a new catalog version and point CURRENT at it"""
+    version, staging = stage_version(directory)
+
+    with entry.lock:
+        store = entry.store
+        size = store.size
+        order = entry._ranked_rows()
+        arrays = {
+            "matrix": store.matrix[:size],
+            "scores": store.scores[:size],
+            "prices": store.prices[:size],
+            "ratings": store.ratings[:size],
+            "city_codes": store.city_codes[:size],
+            "lats": store.lats[:size],
+            "lngs": store.lngs[:size],
+            "amenity_masks": store.amenity_masks[:size],
+            "live": store.live[:size],
+            "ids": np.array([i or "" for i in store.ids[:size]], dtype=str),
+            "order": order,
+        }
+        records = [dumps(r) if r is not None else b"" for r in store.records[:size]]
+        meta = {
+            "version": version,
+            "mode": entry.mode,
+            "cities": list(store.cities),
+            "feature_names": list(store.feature_names),
+            "encodings": store.schema.encodings,
+            "rows": len(store),
+        }
+
+    arrays["record_offsets"] = np.concatenate([[0], np.cumsum([len(r) for r in records])]).astype(np.int64)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(staging, "records.bin"), "wb") as f:
+        for record in records:
+            f.write(record)
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    commit_version(directory, version)
+    logger.info(f"📤 Published catalog {version} ({meta['rows']} properties)")
+    return version
+
+
+class MappedRecords:
+    """Response records decoded on demand from the memory-mapped blob"""
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self.offsets = offsets
+        with open(path, "rb") as f:
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b""
+
+    def __getitem__(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return loads(self._blob[start:end]) if end > start else None
+
+
+class MappedStore:
+    """Read-only view of a published catalog with the FeatureStore query interface"""
+
+    mask = FeatureStore.mask
+    mask_rows = FeatureStore.mask_rows
+    result = FeatureStore.result
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self.size = len(self.scores)
+        self.cities = self.meta["cities"]
+        self.feature_names = self.meta["feature_names"]
+        self.schema = FeatureSchema(self.feature_names, self.meta.get("encodings"))
+        self._city_codes = {city: code for code, city in enumerate(self.cities)}
+        self.records = MappedRecords(os.path.join(path, "records.bin"), self.record_offsets)
+        self._rows = None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def rows(self):
+        """Id to row map, built on first lookup"""
+        if self._rows is None:
+            live = np.flatnonzero(self.live)
+            self._rows = dict(zip(self.ids[live].tolist(), live.tolist()))
+        return self._rows
+
+
+class SharedCatalogReader:
+    """
+    Drop-in for ScoredCatalogCache in worker processes.
+
+    Every city is served from the published all-cities catalog by mask. The
+    ranking is precomputed by the publisher, so workers never sort.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.change_stream_active = False
+        self.loads = SingleFlight()
+        self.reloads = 0
+        self.failed = 0
+        self._signature = None
+        self._entry = None
+
+    def _current(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, POINTER))
+        except FileNotFoundError:
+            return None
+
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature != self._signature:
+            try:
+                with open(os.path.join(self.directory, POINTER)) as f:
+                    version = f.read().strip()
+                store = MappedStore(os.path.join(self.directory, version))
+                entry = CatalogEntry(ALL_CITIES, store.meta["mode"], store)
+                entry.version = version
+                entry._order = store.order
+                self._entry = entry
+                self.reloads += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"⚠️ Could not map published catalog: {e}")
+            self._signature = signature
+        return self._entry
+
+    async def get(self, city_key: str):
+        return self._current()
+
+    def peek(self, city_key: str):
+        return self._current()
+
+    def watch(self, collection, retry_delay: float = 5):
+        """The publisher follows MongoDB; workers only follow CURRENT"""
+        return None
+
+    def invalidate(self, city_key: str = None):
+        self._signature = None
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        entry = self._entry
+        return {
+            "shared": True,
+            "version": entry.version if entry is not None else None,
+            "rows": len(entry) if entry is not None else 0,
+            "entries": int(entry is not None),
+            "reloads": self.reloads,
+            "failed": self.failed,
+        }
+
+
+def wait_for_catalog(directory: str, timeout: float):
+    """Block until a first catalog version is published"""
+    deadline = time.time() + timeout
+    while not os.path.exists(os.path.join(directory, POINTER)):
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.1)
+    return True
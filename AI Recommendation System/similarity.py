@@ -0,0 +1,140 @@
+"""
+Nearest-neighbour index for "more like this" queries.
+
+Each property is embedded from its encoded feature row (``FeatureSchema.encode``):
+amenity one-hots plus standardized log price, rating, capacity and views.
+Small catalogs are searched exactly, with one BLAS matrix-vector product
+giving squared distances to every row. Large catalogs use an HNSW graph when
+``hnswlib`` is installed, falling back to the exact search whenever the
+approximate candidates don't fill the request after filtering. Rows are
+re-embedded as their properties change, so the index never needs a rebuild.
+"""
+import logging
+
+import numpy as np
+
+from feature_store import AMENITIES, AMENITY_BITS
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Numeric features embedded on a log scale before standardizing
+LOG_FEATURES = ("Capacity", "Views")
+
+
+class SimilarityIndex:
+    """Embeddings of a feature store's rows with exact and HNSW search"""
+
+    def __init__(self, store, hnsw_min_rows: int = 50000):
+        self.store = store
+        names = list(store.feature_names)
+        self._amenity_bits = np.array([AMENITY_BITS[name] for name in AMENITIES], dtype=np.uint16)
+        self._numeric_cols = [(j, name) for j, name in enumerate(names) if name in ("Rating",) + LOG_FEATURES]
+        self.dim = len(AMENITIES) + len(self._numeric_cols) + 1
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+
+        # Standardization is fixed at build time so updates stay comparable
+        raw = self._raw(np.flatnonzero(store.live[:store.size]))
+        self._mean = raw.mean(axis=0) if len(raw) else np.zeros(self.dim, dtype=np.float32)
+        self._std = raw.std(axis=0) if len(raw) else np.ones(self.dim, dtype=np.float32)
+        self._std[self._std == 0] = 1
+        self._std[:len(AMENITIES)] = 1
+        self._mean[:len(AMENITIES)] = 0
+
+        self._hnsw = None
+        self.update(np.arange(store.size))
+        if hnswlib is not None and len(raw) >= hnsw_min_rows:
+            self._build_hnsw()
+
+    @property
+    def kind(self):
+        return "hnsw" if self._hnsw is not None else "exact"
+
+    def _raw(self, rows):
+        store = self.store
+        matrix = store.matrix[rows]
+        columns = [((store.amenity_masks[rows][:, None] & self._amenity_bits) != 0).astype(np.float32)]
+        for j, name in self._numeric_cols:
+            values = matrix[:, j].astype(np.float32)
+            columns.append((np.log1p(np.maximum(values, 0)) if name in LOG_FEATURES else values)[:, None])
+        columns.append(np.log1p(np.maximum(store.prices[rows], 0)).astype(np.float32)[:, None])
+        return np.hstack(columns)
+
+    def _grow(self, size: int):
+        if size > len(self.vectors):
+            capacity = max(size, 2 * len(self.vectors), 1024)
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            norms = np.zeros(capacity, dtype=np.float32)
+            vectors[:len(self.vectors)] = self.vectors
+            norms[:len(self.norms)] = self.norms
+            self.vectors, self.norms = vectors, norms
+            if self._hnsw is not None:
+                self._hnsw.resize_index(capacity)
+
+    def update(self, rows):
+        """Re-embed rows whose properties were inserted or changed"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._grow(self.store.size)
+        vectors = (self._raw(rows) - self._mean) / self._std
+        self.vectors[rows] = vectors
+        self.norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        if self._hnsw is not None:
+            live = rows[self.store.live[rows]]
+            if len(live):
+                self._hnsw.add_items(self.vectors[live], live, replace_deleted=True)
+
+    def remove(self, row: int):
+        if self._hnsw is not None:
+            try:
+                self._hnsw.mark_deleted(row)
+            except RuntimeError:
+                pass
+
+    def _build_hnsw(self):
+        live = np.flatnonzero(self.store.live[:self.store.size])
+        index = hnswlib.Index(space="l2", dim=self.dim)
+        index.init_index(max_elements=len(self.vectors), ef_construction=200, M=16, allow_replace_deleted=True)
+        index.add_items(self.vectors[live], live)
+        index.set_ef(64)
+        self._hnsw = index
+        logger.info(f"🧭 Built HNSW similarity index over {len(live)} properties")
+
+    def query(self, row: int, k: int, mask: np.ndarray):
+        """Return ``(rows, distances)`` of the k nearest masked rows to ``row``, excluding itself"""
+        mask = mask.copy()
+        mask[row] = False
+        if self._hnsw is not None:
+            found = self._query_hnsw(row, k, mask)
+            if found is not None:
+                return found
+        return self._query_exact(row, k, mask)
+
+    def _query_exact(self, row: int, k: int, mask: np.ndarray):
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return candidates, np.zeros(0, dtype=np.float32)
+        q = self.vectors[row]
+        distances = self.norms[candidates] - 2 * (self.vectors[candidates] @ q) + self.norms[row]
+        if k < len(candidates):
+            nearest = np.argpartition(distances, k - 1)[:k]
+            candidates, distances = candidates[nearest], distances[nearest]
+        order = np.argsort(distances, kind="stable")
+        return candidates[order], np.sqrt(np.maximum(distances[order], 0))
+
+    def _query_hnsw(self, row: int, k: int, mask: np.ndarray):
+        # Oversample, since the mask filters the graph's neighbours afterwards
+        wanted = min(k * 4 + 1, self._hnsw.get_current_count())
+        labels, distances = self._hnsw.knn_query(self.vectors[row], k=wanted)
+        labels, distances = labels[0].astype(np.int64), distances[0]
+        keep = (labels < len(mask)) & mask[np.minimum(labels, len(mask) - 1)]
+        labels, distances = labels[keep][:k], np.sqrt(np.maximum(distances[keep][:k], 0))
+        if len(labels) < min(k, int(mask.sum())):
+            return None
+        return labels, distances
@@ -0,0 +1,38 @@
+"""
+Request coalescing for concurrent identical work.
+
+When several coroutines ask for the same key while a computation for it is
+still running, they all await that one computation instead of starting
+their own. This flattens thundering herds after deploys and cache expiry.
+"""
+import asyncio
+
+
+class SingleFlight:
+    """Share one in-flight call per key among concurrent callers"""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def do(self, key, fn, *args):
+        """Await fn(*args), or the identical call already in flight for key"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one disconnecting caller doesn't cancel everyone's result
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,69 @@
+"""
+Background startup with retries and a readiness state.
+
+The server binds its port straight away. Loading the model, connecting to
+MongoDB and warming the catalog cache run as background tasks that retry
+with capped exponential backoff. ``Readiness`` records which startup steps
+have finished, so ``/ready`` can hold traffic back until they have while
+``/health`` keeps answering as a liveness probe.
+"""
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+async def retry(fn, what: str, attempts: int = 0, base: float = 0.5, cap: float = 30, on_error=None):
+    """
+    Await ``fn()`` until it succeeds and return its result.
+
+    Failures are retried after a jittered delay that doubles up to ``cap``
+    seconds. After ``attempts`` failures (0 = never give up) the last error
+    is raised. ``on_error(error)`` is called for every failure.
+    """
+    delay = base
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return await fn()
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            if attempts and attempt >= attempts:
+                raise
+            wait = delay * random.uniform(0.8, 1.2)
+            logger.warning(f"⚠️ {what} failed (attempt {attempt}): {e} - retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, cap)
+
+
+class Readiness:
+    """Startup steps that must finish before the server takes traffic"""
+
+    def __init__(self, *steps):
+        self.steps = {step: None for step in steps}
+        self.errors = {}
+        self.started = time.time()
+
+    def done(self, step: str, detail: str = "ok"):
+        self.steps[step] = detail
+        self.errors.pop(step, None)
+
+    def failed(self, step: str, error: Exception):
+        """Record the latest error of a step that is still being retried"""
+        self.errors[step] = str(error)
+
+    @property
+    def ready(self):
+        return all(detail is not None for detail in self.steps.values())
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "steps": dict(self.steps),
+            "errors": dict(self.errors),
+            "uptime_seconds": round(time.time() - self.started, 3),
+        }
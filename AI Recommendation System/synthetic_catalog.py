@@ -0,0 +1,116 @@
+"""
+Synthetic property catalogs for benchmarking the recommendation server.
+
+Catalogs are reproducible for a given seed and size and follow the shape of
+the WebGI property documents: cities drawn with metro-weighted frequencies,
+prices log-normal around each city's median rent, ratings skewed towards
+4-5 stars, and amenities sampled at independent per-amenity rates. Both the
+response fields (``price``, ``rating``...) and the model's feature columns
+(``Price``, ``Rating``, ``Amenities``...) are filled in.
+
+    python synthetic_catalog.py 100000 --seed 7 --out catalog.ndjson
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# (city, share of the catalog, median monthly rent)
+CITIES = [
+    ("Bangalore", 0.22, 9000),
+    ("Mumbai", 0.18, 12000),
+    ("Delhi", 0.15, 10000),
+    ("Hyderabad", 0.12, 8000),
+    ("Pune", 0.10, 8500),
+    ("Chennai", 0.09, 7500),
+    ("Kolkata", 0.07, 6500),
+    ("Ahmedabad", 0.04, 6000),
+    ("Jaipur", 0.03, 5500),
+]
+
+# Probability that a property lists each amenity
+AMENITY_RATES = {
+    "wifi": 0.90,
+    "food": 0.60,
+    "ac": 0.50,
+    "parking": 0.40,
+    "laundry": 0.45,
+    "power_backup": 0.35,
+    "security": 0.55,
+    "cctv": 0.50,
+}
+
+PROPERTY_TYPES = ["PG", "Hostel", "Flat", "Co-living"]
+GENDER_PREFERENCES = ["Any", "Male", "Female"]
+SHARING_TYPES = ["Single", "Double", "Triple"]
+
+
+def generate_catalog(n: int, seed: int = 42, updated_from: datetime = None):
+    """Return n property documents"""
+    rng = np.random.default_rng(seed)
+    updated_from = updated_from or datetime(2026, 1, 1)
+
+    names, shares, medians = zip(*CITIES)
+    city_index = rng.choice(len(names), size=n, p=np.array(shares) / sum(shares))
+    prices = np.round(np.array(medians)[city_index] * rng.lognormal(0, 0.35, n), -2).astype(int)
+    ratings = np.round(2.5 + 2.5 * rng.beta(5, 2, n), 1)
+    capacities = rng.integers(1, 40, n)
+    vacancies = (capacities * rng.random(n)).astype(int)
+    views = rng.lognormal(6, 1, n).astype(int)
+    types = rng.integers(len(PROPERTY_TYPES), size=n)
+    genders = rng.integers(len(GENDER_PREFERENCES), size=n)
+    sharing = rng.integers(len(SHARING_TYPES), size=n)
+    amenity_names = list(AMENITY_RATES)
+    has_amenity = rng.random((n, len(amenity_names))) < np.array(list(AMENITY_RATES.values()))
+    updated = rng.integers(0, 180 * 86400, n)
+
+    docs = []
+    for i in range(n):
+        city = names[city_index[i]]
+        amenities = [a for a, present in zip(amenity_names, has_amenity[i]) if present]
+        price, rating, capacity = int(prices[i]), float(ratings[i]), int(capacities[i])
+        docs.append({
+            "_id": f"syn-{i:08d}",
+            "name": f"{city} {PROPERTY_TYPES[types[i]]} {i}",
+            "city": city,
+            "location": city,
+            "price": price,
+            "rating": rating,
+            "capacity": capacity,
+            "amenities": amenities,
+            "property_type": PROPERTY_TYPES[types[i]],
+            "Price": price,
+            "Rating": rating,
+            "Capacity": capacity,
+            "Vacancies": int(vacancies[i]),
+            "Views": int(views[i]),
+            "Type": int(types[i]),
+            "Gender Preference": int(genders[i]),
+            "Sharing Type": int(sharing[i]),
+            "Amenities": "; ".join(amenities),
+            "updatedAt": updated_from + timedelta(seconds=int(updated[i])),
+        })
+    return docs
+
+
+def city_names():
+    return [city for city, _, _ in CITIES]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Write a synthetic property catalog as NDJSON")
+    parser.add_argument("size", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="output file (default stdout)")
+    args = parser.parse_args()
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        for doc in generate_catalog(args.size, args.seed):
+            out.write(json.dumps(doc, default=str) + "\n")
+    finally:
+        if args.out:
+            out.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server modules live flat in the directory above, imported by bare name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, ConcurrencyLimit, RateLimiter
+from inference import Overloaded
+
+
+def test_token_bucket_allows_burst_then_refills():
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.acquire("a", now=0.0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("a", now=0.0) == pytest.approx(0.5)
+    # Other clients have buckets of their own
+    assert limiter.acquire("b", now=0.0) == 0
+    # Half a second refills one token at 2/s
+    assert limiter.acquire("a", now=0.5) == 0
+    assert limiter.acquire("a", now=0.5) > 0
+    assert limiter.stats()["limited"] == 2
+
+
+def test_token_bucket_never_exceeds_burst_and_evicts_idle_clients():
+    limiter = RateLimiter(rate=1, burst=2, max_clients=2)
+    limiter.acquire("a", now=0.0)
+    assert [limiter.acquire("a", now=100.0) for _ in range(3)][-1] > 0
+    limiter.acquire("b", now=100.0)
+    limiter.acquire("c", now=100.0)
+    assert limiter.stats()["clients"] == 2
+
+
+def test_zero_rate_disables_limiting():
+    limiter = RateLimiter(rate=0, burst=1)
+    assert all(limiter.acquire("a") == 0 for _ in range(100))
+
+
+def test_concurrency_limit_sheds_beyond_running_plus_waiting():
+    async def main():
+        limit = ConcurrencyLimit(limit=2, max_waiting=1, max_wait=1.0)
+
+        async def job():
+            await limit.acquire()
+            try:
+                await asyncio.sleep(0.05)
+            finally:
+                limit.release()
+
+        return limit, await asyncio.gather(*(job() for _ in range(5)), return_exceptions=True)
+
+    limit, results = asyncio.run(main())
+    assert sum(isinstance(r, Overloaded) for r in results) == 2
+    assert limit.stats() == {"limit": 2, "active": 0, "waiting": 0, "admitted": 3, "rejected": 2}
+
+
+def test_concurrency_limit_sheds_when_the_wait_runs_out():
+    async def main():
+        limit = ConcurrencyLimit(limit=1, max_waiting=1, max_wait=0.01)
+        await limit.acquire()
+        with pytest.raises(Overloaded):
+            await limit.acquire()
+        limit.release()
+        await limit.acquire()
+        return limit
+
+    assert asyncio.run(main()).active == 1
+
+
+class FakeRequest:
+    def __init__(self, headers: dict, host: str = "10.0.0.1"):
+        self.headers = headers
+        self.client = type("Client", (), {"host": host})
+
+
+def test_client_key_only_trusts_configured_api_keys_and_forwarding():
+    admission = AdmissionController({"/recommend": ConcurrencyLimit(1)}, RateLimiter(1, 1), api_keys=["k1"])
+    assert admission.client_key(FakeRequest({"x-api-key": "k1"})) == "key:k1"
+    assert admission.client_key(FakeRequest({"x-api-key": "made-up"})) == "ip:10.0.0.1"
+    assert admission.client_key(FakeRequest({"x-forwarded-for": "1.2.3.4"})) == "ip:10.0.0.1"
+
+    # One proxy: the client is what it appended, whatever the client sent before it
+    forwarded = AdmissionController({}, RateLimiter(1, 1), trusted_proxies=1)
+    assert forwarded.client_key(FakeRequest({"x-forwarded-for": "1.2.3.4, 10.0.0.9"})) == "ip:10.0.0.9"
+    assert forwarded.client_key(FakeRequest({"x-forwarded-for": "6.6.6.6, 10.0.0.9"})) == "ip:10.0.0.9"
+    assert forwarded.client_key(FakeRequest({})) == "ip:10.0.0.1"
+
+    # A CDN in front of the proxy: the client is the second entry from the right
+    two_hops = AdmissionController({}, RateLimiter(1, 1), trusted_proxies=2)
+    assert two_hops.client_key(FakeRequest({"x-forwarded-for": "6.6.6.6, 1.2.3.4, 10.0.0.9"})) == "ip:1.2.3.4"
+    # Fewer entries than proxies: the header didn't come through them all
+    assert two_hops.client_key(FakeRequest({"x-forwarded-for": "1.2.3.4"})) == "ip:10.0.0.1"
+
+
+def test_routes_match_longest_prefix():
+    routes = {"/recommend": ConcurrencyLimit(1), "/recommend/personalized": ConcurrencyLimit(1)}
+    admission = AdmissionController(routes, RateLimiter(1, 1))
+    assert admission.route("/recommend")[0] == "/recommend"
+    assert admission.route("/recommend/personalized")[0] == "/recommend/personalized"
+    assert admission.route("/recommendations")[0] is None
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from archive import SnapshotArchive
+
+
+def test_archive_opens_nothing_until_used(tmp_path):
+    path = tmp_path / "archive.db"
+    archive = SnapshotArchive(str(path))
+    assert not path.exists()
+    archive.save("Pune", 9000, {"recommendations": [{"_id": "a", "score": 1.0}]})
+    assert path.exists() and archive.stats()["snapshots"] == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_uses_its_own_connection(tmp_path):
+    archive = SnapshotArchive(str(tmp_path / "archive.db"))
+    archive.save("Pune", 9000, {"recommendations": []})
+    parent_conn = archive._conn()
+
+    pid = os.fork()
+    if not pid:
+        code = 1
+        try:
+            if archive._conn() is not parent_conn:
+                archive.save("Delhi", 12000, {"recommendations": [{"_id": "b", "score": 0.5}]})
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert archive._conn() is parent_conn
+    assert archive.list()[0] == 2
+    assert [h["city"] for h in archive.history("b")] == ["Delhi"]
@@ -0,0 +1,131 @@
+"""Express fallback against a local stub server: revalidation, circuit breaker, disk snapshot"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from archive import SnapshotArchive
+from backend import BackendCatalog, CircuitBreaker, CircuitOpen
+from persistence import CatalogSnapshot
+
+RENTALS = [
+    {"_id": "r1", "name": "Lake View", "price": 8000, "rating": 4.5, "location": "Pune"},
+    {"_id": "r2", "name": "City Rooms", "price": 9000, "rating": 4.1, "location": "Mumbai"},
+]
+
+
+class StubBackend:
+    """/api/rentals with an ETag, switchable to failing"""
+
+    def __init__(self):
+        self.failing = False
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(dict(self.headers))
+                if stub.failing:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps({"rentals": RENTALS}).encode()
+                self.send_response(200)
+                self.send_header("ETag", '"v1"')
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/rentals"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = StubBackend()
+    yield stub
+    stub.close()
+
+
+def fetch_all(catalog, calls):
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [await catalog.fetch(client, city) for city in calls]
+    return asyncio.run(run())
+
+
+def test_unchanged_catalog_is_revalidated_with_304(stub):
+    catalog = BackendCatalog(stub.url)
+    first, pune = fetch_all(catalog, ["all", "pune"])
+
+    assert [p["_id"] for p in first] == ["r1", "r2"]
+    assert [p["_id"] for p in pune] == ["r1"]
+    assert stub.requests[1].get("If-None-Match") == '"v1"'
+    assert catalog.counters["downloads"] == 1
+    assert catalog.counters["not_modified"] == 1
+
+
+def test_circuit_opens_serves_last_payload_and_recovers(stub):
+    catalog = BackendCatalog(stub.url, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    fetch_all(catalog, ["all"])
+
+    stub.failing = True
+    results = fetch_all(catalog, ["all", "all", "all"])
+    assert all(len(r) == 2 for r in results)
+    assert catalog.breaker.state == "open"
+    # The third call was refused without reaching the backend
+    assert len(stub.requests) == 3
+
+    stub.failing = False
+    time.sleep(0.25)
+    fetch_all(catalog, ["all"])
+    assert catalog.breaker.state == "closed"
+    assert len(stub.requests) == 4
+
+
+def test_cold_start_without_payload_raises_when_circuit_open(stub):
+    stub.failing = True
+    catalog = BackendCatalog(stub.url, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    with pytest.raises(RuntimeError):
+        fetch_all(catalog, ["all"])
+    with pytest.raises(CircuitOpen):
+        fetch_all(catalog, ["all"])
+
+
+def test_catalog_snapshot_is_served_after_restart(tmp_path):
+    path = str(tmp_path / "catalog_snapshot.json")
+    saved = CatalogSnapshot(path, 0)
+    saved.save("mongodb", [{"_id": "p1", "city": "Pune"}, {"_id": "p2", "city": "Delhi"}])
+    saved.close()
+
+    source, docs = CatalogSnapshot(path, 0).load("pune")
+    assert source == "mongodb"
+    assert [d["_id"] for d in docs] == ["p1"]
+
+
+def test_catalog_snapshot_imported_by_older_versions_can_be_removed(tmp_path):
+    (tmp_path / "catalog_snapshot.json").write_text(json.dumps({"source": "mongodb", "properties": []}))
+    (tmp_path / "pune_9000_20250101_000000.json").write_text(json.dumps({"city": "Pune", "recommendations": []}))
+    archive = SnapshotArchive(str(tmp_path / "archive.db"))
+    assert archive.import_directory(str(tmp_path), ("recommendations.json",)) == 2
+
+    assert archive.delete("catalog_snapshot.json")
+    assert archive.get("catalog_snapshot.json") is None
+    assert archive.get("pune_9000_20250101_000000.json") is not None
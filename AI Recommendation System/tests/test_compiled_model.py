@@ -0,0 +1,107 @@
+"""CompiledModel against the pipeline it was compiled from, and against a per-row tree walk"""
+import os
+
+import numpy as np
+import pytest
+
+from compiled_model import CompiledModel, compile_pipeline, parity_sample
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_compiled_matches_pipeline():
+    pytest.importorskip("sklearn")
+    pytest.importorskip("xgboost")
+    joblib = pytest.importorskip("joblib")
+    model_path = os.path.join(HERE, "best_model.pkl")
+    pipeline = joblib.load(model_path)
+    feature_names = joblib.load(os.path.join(HERE, "feature_names.pkl"))
+    compiled = CompiledModel(compile_pipeline(pipeline, feature_names))
+
+    checks = [parity_sample(feature_names, rows=5000)]
+    # The notebook's encoded training data, when available: WEBGI_TRAINING_CSV=path/to/X.csv
+    training_csv = os.getenv("WEBGI_TRAINING_CSV")
+    if training_csv:
+        import pandas as pd
+        checks.append(pd.read_csv(training_csv).reindex(columns=feature_names, fill_value=0).to_numpy(np.float32))
+
+    for X in checks:
+        X = X.copy()
+        X[::7, 0] = np.nan  # missing values go through the imputer
+        np.testing.assert_allclose(compiled.predict(X), pipeline.predict(X), rtol=1e-5, atol=1e-5)
+
+
+def random_ensemble(rng, n_features: int, n_trees: int = 20, depth: int = 4):
+    """Complete binary trees with random splits, in the flattened CompiledModel layout"""
+    columns = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "value")}
+    roots = []
+    nodes_per_tree = 2 ** (depth + 1) - 1
+    for _ in range(n_trees):
+        offset = len(columns["feature"])
+        roots.append(offset)
+        for n in range(nodes_per_tree):
+            leaf = n >= 2 ** depth - 1
+            columns["feature"].append(0 if leaf else int(rng.integers(n_features)))
+            columns["threshold"].append(0.0 if leaf else float(rng.uniform(-1, 1)))
+            columns["left"].append(offset + (n if leaf else 2 * n + 1))
+            columns["right"].append(offset + (n if leaf else 2 * n + 2))
+            columns["default_left"].append(bool(rng.integers(2)))
+            columns["value"].append(float(rng.normal()) if leaf else 0.0)
+    return {
+        "feature_names": np.array([f"f{j}" for j in range(n_features)]),
+        "objective": np.array("reg:squarederror"),
+        "base_margin": np.float64(0.5),
+        "columns": np.arange(n_features, dtype=np.int32),
+        "fill": np.full(n_features, np.nan, dtype=np.float32),
+        "shift": np.zeros(n_features, dtype=np.float32),
+        "scale": np.ones(n_features, dtype=np.float32),
+        "roots": np.array(roots, dtype=np.int32),
+        "feature": np.array(columns["feature"], dtype=np.int32),
+        "threshold": np.array(columns["threshold"], dtype=np.float32),
+        "left": np.array(columns["left"], dtype=np.int32),
+        "right": np.array(columns["right"], dtype=np.int32),
+        "default_left": np.array(columns["default_left"], dtype=bool),
+        "value": np.array(columns["value"], dtype=np.float32),
+        "depth": np.int32(depth + 1),
+    }
+
+
+def walk(arrays: dict, x):
+    """Reference evaluation: follow each tree node by node"""
+    total = float(arrays["base_margin"])
+    for root in arrays["roots"]:
+        node = root
+        while arrays["left"][node] != node:
+            value = x[arrays["feature"][node]]
+            go_left = arrays["default_left"][node] if np.isnan(value) else value < arrays["threshold"][node]
+            node = arrays["left"][node] if go_left else arrays["right"][node]
+        total += float(arrays["value"][node])
+    return total
+
+
+def test_vectorized_traversal_matches_tree_walk():
+    rng = np.random.default_rng(7)
+    arrays = random_ensemble(rng, n_features=6)
+    X = rng.uniform(-1.5, 1.5, (300, 6)).astype(np.float32)
+    X[rng.uniform(size=X.shape) < 0.1] = np.nan  # default branches
+
+    expected = np.array([walk(arrays, x) for x in X])
+    np.testing.assert_allclose(CompiledModel(arrays).predict(X), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_imputer_and_scaler_are_applied_before_the_trees(tmp_path):
+    rng = np.random.default_rng(3)
+    arrays = random_ensemble(rng, n_features=4)
+    arrays["fill"] = np.array([0.1, -0.2, 0.3, 0.0], dtype=np.float32)
+    arrays["shift"] = np.array([1.0, 0.0, -1.0, 0.5], dtype=np.float32)
+    arrays["scale"] = np.array([2.0, 1.0, 0.5, 4.0], dtype=np.float32)
+    X = rng.uniform(-2, 2, (100, 4)).astype(np.float32)
+    X[::5, 1] = np.nan
+
+    filled = np.where(np.isnan(X), arrays["fill"], X)
+    expected = np.array([walk(arrays, x) for x in (filled - arrays["shift"]) / arrays["scale"]])
+
+    # Through an .npz round-trip, as the server loads it
+    np.savez(tmp_path / "model.npz", **arrays)
+    np.testing.assert_allclose(CompiledModel.load(str(tmp_path / "model.npz")).predict(X), expected,
+                               rtol=1e-5, atol=1e-5)
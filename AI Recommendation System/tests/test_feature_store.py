@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from feature_store import AMENITY_BITS, FeatureStore, amenity_bits, amenity_mask
+
+FEATURES = ["Price", "Rating", "Capacity", "wifi", "ac", "parking"]
+RESULT_COLUMNS = ["_id", "name", "price", "rating", "capacity", "amenities", "score", "city"]
+
+
+def make_store(capacity: int = 2):
+    return FeatureStore(FEATURES, RESULT_COLUMNS, capacity=capacity)
+
+
+def test_amenity_mask_string_list_and_dict_forms():
+    expected = AMENITY_BITS["wifi"] | AMENITY_BITS["ac"] | AMENITY_BITS["power_backup"]
+    assert amenity_mask("WiFi, A/C; Power Backup") == expected
+    assert amenity_mask(["wi-fi", "air conditioning", "powerbackup"]) == expected
+    assert amenity_mask({"wifi": True, "ac": 1, "power_backup": True, "parking": False}) == expected
+
+
+def test_amenity_mask_matches_whole_tokens_only():
+    assert amenity_mask("power_backup") == AMENITY_BITS["power_backup"]
+    assert amenity_mask("jacuzzi, rooftop") == 0
+    assert amenity_mask(None) == 0
+
+
+def test_amenity_bits_rejects_unknown_names():
+    assert amenity_bits(["wifi", "tv"]) == AMENITY_BITS["wifi"] | AMENITY_BITS["tv"]
+    with pytest.raises(ValueError):
+        amenity_bits(["jacuzzi"])
+
+
+def test_upsert_encodes_rows_and_grows():
+    store = make_store()
+    rows = store.upsert([
+        {"_id": "a", "price": 8000, "rating": 4.5, "capacity": 0, "amenities": "wifi, parking", "city": "Pune"},
+        {"_id": "b", "price": "9000", "rating": 3.9, "capacity": 4, "amenities": ["ac"], "city": "Delhi"},
+        {"_id": "c", "price": 20000, "rating": 4.8, "capacity": 2, "amenities": {}, "city": "pune"},
+    ])
+    assert store.allocated >= 3 and len(store) == 3
+
+    a, b, _ = rows
+    np.testing.assert_allclose(store.matrix[a], [8000, 4.5, 1, 1, 0, 1])  # capacity 0 counts as 1
+    np.testing.assert_allclose(store.matrix[b], [9000, 3.9, 4, 0, 1, 0])
+    assert store.result(a)["_id"] == "a" and "score" in store.result(a)
+
+
+def test_upsert_replaces_known_ids_in_place():
+    store = make_store()
+    (row,) = store.upsert([{"_id": "a", "price": 8000, "city": "Pune"}])
+    (again,) = store.upsert([{"_id": "a", "price": 7000, "city": "Pune"}])
+    assert again == row and len(store) == 1
+    assert store.prices[row] == 7000
+
+
+def test_delete_frees_the_row_for_reuse_and_masks_it_out():
+    store = make_store()
+    a, b = store.upsert([{"_id": "a", "price": 1, "city": "Pune"}, {"_id": "b", "price": 2, "city": "Pune"}])
+    assert store.delete("a")
+    assert not store.delete("a")
+    assert store.mask().tolist() == [False, True]
+
+    (c,) = store.upsert([{"_id": "c", "price": 3, "city": "Pune"}])
+    assert c == a and store.ids[c] == "c"
+
+
+def test_mask_filters_city_and_budget():
+    store = make_store()
+    store.upsert([
+        {"_id": "a", "price": 8000, "city": "Pune"},
+        {"_id": "b", "price": 12000, "city": "Pune"},
+        {"_id": "c", "price": 5000, "location": "Delhi"},
+    ])
+    assert store.mask("pune").tolist() == [True, True, False]
+    assert store.mask("pune", 10000).tolist() == [True, False, False]
+    assert store.mask(None, 10000).tolist() == [True, False, True]
+    assert not store.mask("mumbai").any()
+
+    rows = np.arange(3)
+    assert store.mask_rows(rows, "pune", 10000).tolist() == store.mask("pune", 10000).tolist()
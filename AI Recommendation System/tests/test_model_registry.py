@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from feature_schema import FeatureSchema
+from model_registry import ModelRegistry, ModelVersion, encoding_conflicts
+
+FEATURES = ["Rent", "City", "Sharing Type"]
+
+
+class CountingModel:
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        return X[:, 0] + self.offset
+
+
+def version(name, encodings, model=None):
+    return ModelVersion(name, model or CountingModel(), FEATURES, FeatureSchema(FEATURES, encodings))
+
+
+def registry(active):
+    models = ModelRegistry("/nonexistent", {}, FEATURES, shadow_sample=1.0, shadow_max_rows=4)
+    models.activate(active)
+    return models
+
+
+def test_encoding_conflicts_allow_appended_classes_only():
+    base = FeatureSchema(FEATURES, {"City": ["Delhi", "Pune"], "Sharing Type": ["1", "2"]})
+    extended = FeatureSchema(FEATURES, {"City": ["Delhi", "Pune", "Goa"], "Sharing Type": ["1", "2"]})
+    reordered = FeatureSchema(FEATURES, {"City": ["Pune", "Delhi"], "Sharing Type": ["1", "2"]})
+    assert encoding_conflicts(base, extended) == []
+    assert encoding_conflicts(extended, base) == ["City"]
+    assert encoding_conflicts(base, reordered) == ["City"]
+
+
+def test_stage_shadow_refuses_other_encodings():
+    models = registry(version("v1", {"City": ["Delhi", "Pune"]}))
+    with pytest.raises(ValueError, match="City"):
+        models.stage_shadow(version("v2", {"City": ["Pune", "Delhi"]}))
+    assert models.shadow is None
+
+
+def test_activate_stops_an_incompatible_shadow():
+    models = registry(version("v1", {"City": ["Delhi"]}))
+    models.stage_shadow(version("v2", {"City": ["Delhi", "Pune"]}))
+    models.activate(version("v3", {"City": ["Pune"]}))
+    assert models.shadow is None
+
+
+def test_shadow_records_serving_latency_without_rerunning_active():
+    active = version("v1", {})
+    models = registry(active)
+    shadow = version("v2", {}, CountingModel(offset=1.0))
+    models.stage_shadow(shadow)
+
+    X = np.arange(24, dtype=np.float32).reshape(8, 3)
+    models.shadow_score(active, FEATURES, X, X[:, 0], served_seconds=0.2)
+    models._shadow_pool.shutdown(wait=True)
+
+    assert active.model.calls == 0 and shadow.model.calls == 1
+    stats = models.comparison.stats()
+    assert stats["calls"] == 1 and stats["rows"] == 4
+    assert stats["mean_diff"] == pytest.approx(1.0)
+    # Half of the rows were sampled, so half of the serving time is charged to them
+    assert stats["latency"]["active"]["mean"] == pytest.approx(0.1)
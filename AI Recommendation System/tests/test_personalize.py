@@ -0,0 +1,44 @@
+import numpy as np
+
+from feature_schema import FeatureSchema
+from feature_store import FeatureStore
+from personalize import PreferenceProfile, preference_adjuster
+
+# No "Rating" feature column: the rating filter must not depend on the model's features
+FEATURES = ["Price", "Capacity", "Sharing Type", "Gender Preference"]
+ENCODINGS = {"Sharing Type": ["Double", "Single"], "Gender Preference": ["Female", "Male", "Unisex"]}
+RESULT_COLUMNS = ["_id", "price", "rating", "city"]
+
+
+def make_store():
+    store = FeatureStore(FEATURES, RESULT_COLUMNS, schema=FeatureSchema(FEATURES, ENCODINGS))
+    rows = store.upsert([
+        {"_id": "a", "price": 8000, "rating": 4.6, "sharing": "Single", "gender": "Female", "city": "Pune"},
+        {"_id": "b", "price": 9000, "rating": 3.2, "sharing": "Single", "gender": "Male", "city": "Pune"},
+        {"_id": "c", "price": 7000, "rating": 4.9, "sharing": "Double", "gender": "Female", "city": "Pune"},
+    ])
+    store.scores[rows] = [0.5, 0.5, 0.5]
+    return store, rows
+
+
+def scores(store, rows, **profile):
+    return preference_adjuster(PreferenceProfile(weight=1.0, **profile))(store, rows)
+
+
+def test_min_rating_filters_on_the_rating_field():
+    store, rows = make_store()
+    result = scores(store, rows, min_rating=4.5)
+    assert np.isnan(result[1]) and not np.isnan(result[[0, 2]]).any()
+
+
+def test_category_labels_match_like_their_codes():
+    store, rows = make_store()
+    by_label = scores(store, rows, sharing_type="single", gender_preference="Female")
+    by_code = scores(store, rows, sharing_type=1, gender_preference=0)
+    np.testing.assert_allclose(by_label, by_code)
+    np.testing.assert_allclose(by_label, [1.0, 0.5, 0.5])
+
+
+def test_unknown_label_matches_nothing():
+    store, rows = make_store()
+    np.testing.assert_allclose(scores(store, rows, sharing_type="Triple"), [0.0, 0.0, 0.0])
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from feature_store import FeatureStore
+from score_cache import CatalogEntry, ScoredCatalogCache, decode_cursor, encode_cursor
+
+FEATURES = ["Rating", "Capacity"]
+RESULT_COLUMNS = ["_id", "price", "rating", "score", "city"]
+
+
+def score_by_rating(store, rows):
+    return store.ratings[rows]
+
+
+def make_entry(n: int = 25):
+    # Repeated ratings, so ties have to be broken by id
+    docs = [{"_id": f"p{i:02d}", "price": 1000 * i, "rating": (i * 7) % 5, "city": "Pune"} for i in range(n)]
+    entry = CatalogEntry("all", "mongodb", FeatureStore(FEATURES, RESULT_COLUMNS))
+    entry.upsert(docs, score_by_rating)
+    return entry
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(4.25, "abc/123")
+    assert decode_cursor(cursor) == (4.25, "abc/123")
+
+
+def test_malformed_cursor_is_a_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def page_through(entry, page_size: int, **filters):
+    ids, cursor = [], None
+    while True:
+        total, page, cursor = entry.page(cursor=cursor, page_size=page_size, **filters)
+        ids.extend(r["_id"] for r in page)
+        if cursor is None:
+            return total, ids
+
+
+def test_pages_cover_the_ranking_exactly_once_in_top_order():
+    entry = make_entry()
+    total, ranked = entry.top(k=100)
+    _, paged = page_through(entry, page_size=4)
+    assert paged == [r["_id"] for r in ranked]
+    assert total == len(paged) == 25
+
+
+def test_paging_honours_the_budget_filter():
+    entry = make_entry()
+    total, paged = page_through(entry, page_size=3, max_budget=10000)
+    assert total == len(paged) == 11
+
+
+def test_cursor_position_survives_inserts_and_deletes():
+    entry = make_entry()
+    _, first, cursor = entry.page(page_size=5)
+    seen = {r["_id"] for r in first}
+
+    # A new best property and a deleted already-seen one don't shift the next page
+    entry.upsert([{"_id": "new", "price": 1, "rating": 99, "city": "Pune"}], score_by_rating)
+    entry.remove(first[0]["_id"])
+    _, second, _ = entry.page(cursor=cursor, page_size=5)
+    assert not seen & {r["_id"] for r in second}
+    assert "new" not in {r["_id"] for r in second}
+    last = (-first[-1]["score"], first[-1]["_id"])
+    assert all((-r["score"], r["_id"]) > last for r in second)
+
+
+def docs_for(ids):
+    return [{"_id": i, "price": 1000, "rating": 4, "city": "Pune", "updatedAt": 1} for i in ids]
+
+
+def make_cache(db: dict, **options):
+    async def loader(city_key):
+        return "mongodb", docs_for(db["ids"])
+
+    async def fetch_changed(city_key, since):
+        return []
+
+    async def fetch_ids(city_key):
+        return set(db["ids"])
+
+    options = dict(poll_interval=0, fetch_ids=fetch_ids, **options)
+    return ScoredCatalogCache(loader, fetch_changed, lambda: FeatureStore(FEATURES, RESULT_COLUMNS),
+                              score_by_rating, **options)
+
+
+def test_polling_sweeps_deleted_ids_every_nth_poll():
+    async def run():
+        db = {"ids": ["a", "b", "c"]}
+        cache = make_cache(db, id_sweep_polls=3)
+        entry = await cache.get("all")
+        db["ids"] = ["a", "c"]
+        for _ in range(2):
+            await cache.get("all")
+        assert "b" in entry.store.rows
+        await cache.get("all")
+        assert sorted(entry.store.rows) == ["a", "c"]
+        assert cache.stats()["removed"] == 1
+
+    asyncio.run(run())
+
+
+def test_load_finishing_after_a_model_swap_is_redone():
+    async def run():
+        db = {"ids": ["a", "b"]}
+        models = {"active": "v1"}
+        swapped = []
+
+        def score(store, rows):
+            # The first load is overtaken by a swap while it scores
+            if not swapped:
+                swapped.append(True)
+                models["active"] = "v2"
+            return store.ratings[rows]
+
+        cache = make_cache(db, model_version=lambda: models["active"])
+        cache.predict = score
+        entry = await cache.get("all")
+        assert entry.model_version == "v2"
+        assert cache.peek("all") is entry
+        assert cache.stats()["stale_loads"] == 1
+
+    asyncio.run(run())
+
+
+def test_load_outpaced_by_every_attempt_is_not_cached():
+    async def run():
+        versions = iter(range(100))
+        cache = make_cache({"ids": ["a"]}, model_version=lambda: next(versions), max_load_attempts=2)
+        entry = await cache.get("all")
+        assert entry is not None and len(entry) == 1
+        assert cache.peek("all") is None
+
+    asyncio.run(run())
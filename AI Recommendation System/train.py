@@ -0,0 +1,399 @@
+"""
+Out-of-core training of the recommendation model from the properties collection.
+
+Replaces the Colab flow of WebGI.ipynb, which loads the whole training CSV
+into pandas, for catalogs that do not fit in memory. Properties are streamed
+in chunks from MongoDB (or an NDJSON export, or the notebook's CSV) twice:
+
+1. the categorical values are collected into the label encodings
+2. every chunk is encoded by the server's own ``FeatureSchema`` and
+   ``FeatureStore`` and spilled to disk as a float32 block, split into
+   training and validation rows by a hash of the property id
+
+The target is the notebook's ``liked`` label. XGBoost builds its quantized
+training matrix by iterating over the spilled blocks (``--external-memory``
+keeps that on disk as well). A random hyperparameter search, starting from
+the notebook's settings, runs ``--parallel`` trials at a time until
+``--time-budget`` runs out, each stopping early on the validation log loss.
+``--warm-start`` continues boosting from an earlier version instead of
+starting from scratch.
+
+The best booster is written as a model version the server loads
+(``best_model.npz``, ``feature_names.pkl``, ``feature_schema.json`` and
+``holdout.npz``), with ``training_report.json`` covering the time and
+throughput of every stage. Training needs xgboost (2.0 or later, 3.0 for
+``--external-memory``); the server itself only needs the compiled artifact.
+
+    python train.py --input catalog.ndjson --time-budget 600
+    python train.py --output models/v2 --activate
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import joblib
+import numpy as np
+from dotenv import load_dotenv
+
+from batch_score import chunked, read_mongo, read_ndjson
+from compiled_model import CompiledModel, compile_booster
+from feature_schema import SCHEMA_VERSION, FeatureSchema, extend_encodings, fit_encodings
+from feature_store import AMENITIES, RESULT_COLUMNS, FeatureStore
+from persistence import write_atomic
+
+logger = logging.getLogger("train")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The notebook's columns; its MultiLabelBinarizer orders the amenity columns alphabetically
+FEATURE_NAMES = [
+    "Price", "City", "Type", "Capacity", "Vacancies",
+    "Rating", "Views", "Gender Preference", "Sharing Type"
+] + sorted(AMENITIES)
+
+RATING = FEATURE_NAMES.index("Rating")
+VACANCIES = FEATURE_NAMES.index("Vacancies")
+
+# The notebook's XGBoost settings are the first trial; later trials draw from the grid
+NOTEBOOK_PARAMS = {"max_depth": 6, "eta": 0.05, "subsample": 0.8, "colsample_bytree": 0.8,
+                   "min_child_weight": 1, "lambda": 1.0}
+SEARCH_SPACE = {
+    "max_depth": [4, 6, 8, 10],
+    "eta": [0.02, 0.05, 0.1, 0.2],
+    "subsample": [0.6, 0.8, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "min_child_weight": [1, 5, 10],
+    "lambda": [0.5, 1.0, 5.0],
+}
+
+# Buckets of the id hash; a row is held out when its bucket falls below the validation share
+HASH_BUCKETS = 10000
+
+
+def label(X):
+    """The notebook's target: well rated and with room to spare"""
+    return ((X[:, RATING] >= 4.3) & (X[:, VACANCIES] >= 3)).astype(np.float32)
+
+
+def read_csv(path: str, limit: int = 0):
+    with open(path, newline="") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            if limit and i >= limit:
+                return
+            row.setdefault("_id", f"row-{i}")
+            yield row
+
+
+def open_source(args, schema: FeatureSchema):
+    """A fresh document stream from the configured source"""
+    if args.input and args.input.endswith(".csv"):
+        return read_csv(args.input, args.limit)
+    if args.input:
+        return read_ndjson(args.input, args.limit)
+    return read_mongo(args.mongo_uri, args.db, args.chunk_size, args.limit, schema)
+
+
+def held_out(ids, share: float):
+    """Stable validation membership: the same property always lands on the same side"""
+    cut = int(share * HASH_BUCKETS)
+    return np.fromiter((zlib.crc32(i.encode()) % HASH_BUCKETS < cut for i in ids), dtype=bool, count=len(ids))
+
+
+def encode_chunk(docs: list, schema: FeatureSchema):
+    """Feature rows, labels and ids of a chunk, encoded exactly as the server encodes them"""
+    store = FeatureStore(FEATURE_NAMES, RESULT_COLUMNS, capacity=max(len(docs), 1), schema=schema)
+    store.upsert(docs)
+    live = np.flatnonzero(store.live[:store.size])
+    X = store.matrix[live]
+    return X, label(X), [store.ids[row] for row in live]
+
+
+def spill_blocks(chunks, schema: FeatureSchema, workdir: str, share: float):
+    """Encode chunk by chunk and write training and validation blocks to workdir"""
+    blocks = {"train": [], "valid": []}
+    rows = {"train": 0, "valid": 0, "positive": 0}
+    for i, docs in enumerate(chunks):
+        X, y, ids = encode_chunk(docs, schema)
+        hold = held_out(ids, share)
+        rows["positive"] += int(y.sum())
+        for kind, mask in (("train", ~hold), ("valid", hold)):
+            if mask.any():
+                path = os.path.join(workdir, f"{kind}-{i:06d}.npz")
+                np.savez(path, X=X[mask], y=y[mask])
+                blocks[kind].append(path)
+                rows[kind] += int(mask.sum())
+    return blocks, rows
+
+
+def stack_blocks(paths: list, max_rows: int = 0):
+    """Concatenate spilled blocks, stopping after max_rows (0 = all)"""
+    Xs, ys, total = [], [], 0
+    for path in paths:
+        with np.load(path) as block:
+            Xs.append(block["X"])
+            ys.append(block["y"])
+        total += len(ys[-1])
+        if max_rows and total >= max_rows:
+            break
+    if not Xs:
+        return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32), np.empty(0, dtype=np.float32)
+    X, y = np.concatenate(Xs), np.concatenate(ys)
+    return (X[:max_rows], y[:max_rows]) if max_rows else (X, y)
+
+
+def sample_params(rng: random.Random):
+    return {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+
+
+def search(blocks: dict, workdir: str, args, report: dict):
+    """Time-budgeted parallel hyperparameter search; returns the best booster"""
+    import xgboost as xgb
+
+    class Blocks(xgb.DataIter):
+        """Spilled feature blocks handed to XGBoost one at a time"""
+
+        def __init__(self, paths: list, cache_prefix: str = None):
+            self.paths = paths
+            self.position = 0
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data):
+            if self.position == len(self.paths):
+                return False
+            with np.load(self.paths[self.position]) as block:
+                input_data(data=block["X"], label=block["y"])
+            self.position += 1
+            return True
+
+        def reset(self):
+            self.position = 0
+
+    class Deadline(xgb.callback.TrainingCallback):
+        def __init__(self, deadline: float):
+            super().__init__()
+            self.deadline = deadline
+
+        def after_iteration(self, model, epoch, evals_log):
+            return time.time() >= self.deadline
+
+    started = time.time()
+    if args.external_memory:
+        dtrain = xgb.ExtMemQuantileDMatrix(Blocks(blocks["train"], os.path.join(workdir, "cache")),
+                                           max_bin=args.max_bin)
+    else:
+        dtrain = xgb.QuantileDMatrix(Blocks(blocks["train"]), max_bin=args.max_bin)
+    dvalid = xgb.QuantileDMatrix(Blocks(blocks["valid"]), ref=dtrain)
+    report["stages"]["quantize"] = {"seconds": round(time.time() - started, 3)}
+    logger.info(f"🧮 Quantized {dtrain.num_row()} training rows in {time.time() - started:.1f}s")
+
+    base = os.path.join(args.warm_start, "booster.ubj") if args.warm_start else None
+    threads = max(1, (os.cpu_count() or 1) // args.parallel)
+    deadline = time.time() + args.time_budget
+    rng = random.Random(args.seed)
+
+    def trial(number: int, params: dict):
+        if time.time() >= deadline:
+            return None
+        trial_started = time.time()
+        evals = {}
+        booster = xgb.train(
+            {"objective": "binary:logistic", "eval_metric": "logloss", "tree_method": "hist",
+             "nthread": threads, "seed": args.seed, **params},
+            dtrain, args.rounds, evals=[(dvalid, "valid")], evals_result=evals,
+            early_stopping_rounds=args.early_stopping, verbose_eval=False,
+            callbacks=[Deadline(deadline)], xgb_model=base,
+        )
+        best = booster.best_iteration
+        result = {
+            "trial": number,
+            "params": params,
+            "logloss": float(evals["valid"]["logloss"][best]),
+            "rounds": best + 1,
+            "seconds": round(time.time() - trial_started, 3),
+        }
+        logger.info(f"🎯 Trial {number}: logloss {result['logloss']:.5f} after {result['rounds']} rounds "
+                    f"in {result['seconds']:.1f}s {params}")
+        return result, booster[:best + 1]
+
+    started = time.time()
+    results = []
+    # Trials are submitted as slots free up, so none starts after the budget is spent
+    with ThreadPoolExecutor(args.parallel) as pool:
+        first = min(args.parallel, args.trials) if args.trials else args.parallel
+        pending = {pool.submit(trial, n, NOTEBOOK_PARAMS if n == 0 else sample_params(rng)) for n in range(first)}
+        submitted = len(pending)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                if outcome is not None:
+                    results.append(outcome)
+                if time.time() < deadline and (not args.trials or submitted < args.trials):
+                    pending.add(pool.submit(trial, submitted, sample_params(rng)))
+                    submitted += 1
+
+    if not results:
+        raise RuntimeError("No trial finished within the time budget")
+    results.sort(key=lambda r: r[0]["logloss"])
+    report["trials"] = [r for r, _ in sorted(results, key=lambda r: r[0]["trial"])]
+    report["best"] = results[0][0]
+    report["stages"]["search"] = {"seconds": round(time.time() - started, 3), "trials": len(results),
+                                  "parallel": args.parallel, "threads_per_trial": threads}
+    return results[0][1]
+
+
+def evaluate(booster, X, y):
+    """Accuracy, F1 and log loss on the holdout, as the notebook compares models"""
+    import xgboost as xgb
+
+    p = booster.predict(xgb.DMatrix(X))
+    predicted = p > 0.5
+    positive = y > 0.5
+    tp = int((predicted & positive).sum())
+    precision = tp / max(int(predicted.sum()), 1)
+    recall = tp / max(int(positive.sum()), 1)
+    eps = 1e-7
+    return {
+        "rows": len(y),
+        "accuracy": float((predicted == positive).mean()) if len(y) else 0.0,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "logloss": float(-np.mean(y * np.log(p + eps) + (1 - y) * np.log(1 - p + eps))) if len(y) else 0.0,
+    }, p
+
+
+def write_version(directory: str, booster, encodings: dict, holdout, probabilities, report: dict):
+    """Write the artifacts the server loads into a staging directory, then move it into place"""
+    X, y = holdout
+    arrays = compile_booster(booster, FEATURE_NAMES)
+    compiled = CompiledModel(arrays)
+    # The same parity check compiled_model.export_model runs for pickles
+    mismatches = int(np.sum(~np.isclose(compiled.predict_proba(X)[:, 1], probabilities, rtol=1e-5, atol=1e-5)))
+    if mismatches:
+        raise ValueError(f"Compiled model disagrees with the booster on {mismatches}/{len(X)} holdout rows")
+
+    parent, name = os.path.split(os.path.abspath(directory))
+    staging = os.path.join(parent, f".{name}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    np.savez(os.path.join(staging, "best_model.npz"), **arrays)
+    joblib.dump(FEATURE_NAMES, os.path.join(staging, "feature_names.pkl"))
+    with open(os.path.join(staging, "feature_schema.json"), "w") as f:
+        json.dump({"version": SCHEMA_VERSION, "encodings": encodings}, f, indent=2)
+    np.savez(os.path.join(staging, "holdout.npz"), X=X, y=y, feature_names=np.array(FEATURE_NAMES))
+    booster.save_model(os.path.join(staging, "booster.ubj"))
+    with open(os.path.join(staging, "training_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(staging, directory)
+
+
+def stage(report: dict, name: str, started: float, docs: int):
+    seconds = time.time() - started
+    report["stages"][name] = {"seconds": round(seconds, 3), "docs": docs,
+                              "docs_per_second": round(docs / seconds, 1) if seconds else None}
+    logger.info(f"⏱️ {name}: {docs} documents in {seconds:.1f}s ({docs / max(seconds, 1e-9):,.0f}/s)")
+
+
+class Counted:
+    """Iterate docs while counting them"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.count = 0
+
+    def __iter__(self):
+        for doc in self.docs:
+            self.count += 1
+            yield doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the recommendation model out of core from the property catalog")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    parser.add_argument("--db", default="webgi")
+    parser.add_argument("--input", help="NDJSON export or the notebook's training CSV instead of MongoDB")
+    parser.add_argument("--output", help="model version directory to write (default: a new version in MODEL_DIR)")
+    parser.add_argument("--activate", action="store_true", help="point CURRENT at the new version")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="documents per cursor batch and spilled block")
+    parser.add_argument("--limit", type=int, default=0, help="train on at most this many properties (0 = all)")
+    parser.add_argument("--validation-share", type=float, default=0.25, help="share held out for validation")
+    parser.add_argument("--holdout-rows", type=int, default=50000, help="validation rows saved in holdout.npz")
+    parser.add_argument("--time-budget", type=float, default=600, help="seconds for the hyperparameter search")
+    parser.add_argument("--trials", type=int, default=0, help="stop after this many trials (0 = no limit)")
+    parser.add_argument("--parallel", type=int, default=2, help="trials trained at the same time")
+    parser.add_argument("--rounds", type=int, default=300, help="maximum boosting rounds per trial")
+    parser.add_argument("--early-stopping", type=int, default=20)
+    parser.add_argument("--max-bin", type=int, default=256)
+    parser.add_argument("--external-memory", action="store_true", help="keep the quantized training matrix on disk")
+    parser.add_argument("--warm-start", help="model version directory to continue boosting from")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not args.input and not args.mongo_uri:
+        parser.error("set MONGO_URI, pass --mongo-uri or pass --input")
+    if not args.output:
+        args.output = os.path.join(HERE, os.getenv("MODEL_DIR", "models"), time.strftime("v%Y%m%d-%H%M%S"))
+
+    started = time.time()
+    report = {"source": args.input or "mongodb", "feature_names": FEATURE_NAMES, "stages": {}}
+
+    # Pass 1: label encodings, extended rather than refitted when continuing a version
+    pass_started = time.time()
+    docs = Counted(open_source(args, FeatureSchema(FEATURE_NAMES)))
+    encodings = fit_encodings(docs)
+    if args.warm_start:
+        previous = FeatureSchema.load(os.path.join(args.warm_start, "feature_schema.json"), FEATURE_NAMES)
+        if joblib.load(os.path.join(args.warm_start, "feature_names.pkl")) != FEATURE_NAMES:
+            parser.error(f"{args.warm_start} was trained on different features")
+        encodings = extend_encodings(previous.encodings, encodings)
+    stage(report, "encodings", pass_started, docs.count)
+    schema = FeatureSchema(FEATURE_NAMES, encodings)
+
+    # Pass 2: encode and spill
+    workdir = f"{os.path.abspath(args.output)}.work"
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    try:
+        pass_started = time.time()
+        docs = Counted(open_source(args, schema))
+        blocks, rows = spill_blocks(chunked(docs, args.chunk_size), schema, workdir, args.validation_share)
+        stage(report, "features", pass_started, docs.count)
+        report["rows"] = rows
+        if not rows["train"] or not rows["valid"]:
+            raise SystemExit("⚠️ Not enough properties for a training and a validation split")
+
+        booster = search(blocks, workdir, args, report)
+
+        pass_started = time.time()
+        holdout = stack_blocks(blocks["valid"], args.holdout_rows)
+        report["holdout"], probabilities = evaluate(booster, *holdout)
+        report["stages"]["evaluate"] = {"seconds": round(time.time() - pass_started, 3)}
+        report["total_seconds"] = round(time.time() - started, 3)
+        report["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        write_version(args.output, booster, encodings, holdout, probabilities, report)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.activate:
+        write_atomic(os.path.join(os.path.dirname(os.path.abspath(args.output)), "CURRENT"),
+                     os.path.basename(os.path.abspath(args.output)).encode())
+    logger.info(
+        f"📦 Wrote {args.output}: holdout accuracy {report['holdout']['accuracy']:.4f}, "
+        f"F1 {report['holdout']['f1']:.4f} ({rows['train']} training rows, {report['total_seconds']:.1f}s)"
+        + (" - now CURRENT" if args.activate else "")
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    main()